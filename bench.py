@@ -0,0 +1,731 @@
+"""Замеры производительности игры.
+
+Запуск:
+    python bench.py blur
+    python bench.py run [--save-baseline base.json] [--baseline base.json]
+    python bench.py alloc [--steps 3600 --warmup 1200]
+    python bench.py replay session.rec
+    python bench.py level [--width 2000 --height 500]
+    python bench.py stream [--width 20000 --frames 3000]
+    python bench.py endless [--columns 2000 --seed 1]
+    python bench.py rope [--segments 24 100 200]
+    python bench.py entities [--counts 250 1000 8000]
+    python bench.py latency [--fps 30 60 144 240]
+"""
+import argparse
+import array
+import json
+import math
+import os
+import random
+import sys
+import tempfile
+import time
+import tracemalloc
+
+import pygame
+
+import main
+
+# Разрешения для замеров размытия
+RESOLUTIONS = {
+    "1080p": (1920, 1080),
+    "4K": (3840, 2160),
+}
+
+# Размеры уровней для сценариев: (ширина, высота) в тайлах, None - встроенная карта
+LEVEL_SIZES = {
+    "small": None,
+    "medium": (256, 96),
+    "large": (1024, 128),
+}
+
+# Разрешения окна для сценариев с отрисовкой
+RENDER_RESOLUTIONS = {
+    "720p": (1280, 720),
+    "1080p": (1920, 1080),
+}
+
+# Метрики, по которым ищется регрессия: (ключ, True если больше - лучше)
+COMPARED_METRICS = (("rate", True), ("p95_ms", False))
+
+# Высота уровня замера подвижных тел в тайлах; ширина растёт с числом тел
+ENTITY_LEVEL_HEIGHT = 64
+
+# Минимальный прогрев перед замером выделений: свободные списки CPython (float, кортежи)
+# растут, пока сценарий впервые проходит все состояния крюка (первый зацеп - около 450-го шага)
+ALLOC_WARMUP_STEPS = main.SIM_HZ * 10
+
+def legacy_blur(surface, blur_radius=5):
+    """Прежний blur_surface: blur_radius раз уменьшение вдвое и увеличение обратно."""
+    width, height = surface.get_size()
+    for _ in range(blur_radius):
+        surface = pygame.transform.smoothscale(surface, (width // 2, height // 2))
+        surface = pygame.transform.smoothscale(surface, (width, height))
+    return surface
+
+def make_test_surface(size):
+    """Непрозрачная 32-битная поверхность с полосами, похожая на фон."""
+    surface = pygame.Surface(size, pygame.SRCALPHA, 32)
+    surface.fill((20, 20, 40, 255))
+    for x in range(0, size[0], 64):
+        pygame.draw.rect(surface, (200, 80, 40, 255), (x, 0, 32, size[1]))
+    return surface
+
+def time_call(function, repeats):
+    """Минимальное время вызова function за repeats повторов (сек)."""
+    best = float('inf')
+    for _ in range(repeats):
+        start = time.perf_counter()
+        function()
+        best = min(best, time.perf_counter() - start)
+    return best
+
+def bench_blur(args):
+    print(f"NumPy: {'есть' if main.np is not None else 'нет'}")
+    for name, size in RESOLUTIONS.items():
+        surface = make_test_surface(size)
+        radius = main.BLUR_RADIUS * size[1] / main.BASE_HEIGHT
+        legacy = time_call(lambda: legacy_blur(surface), args.repeats)
+        results = [("прежний blur_surface", legacy)]
+        if main.np is not None:
+            results.append(("BlurEngine (NumPy)", time_call(lambda: main.blur_engine.blur(surface, radius), args.repeats)))
+        results.append(("BlurEngine (пирамида)", time_call(lambda: main.blur_engine.blur(surface, radius, use_numpy=False), args.repeats)))
+        for label, seconds in results:
+            print(f"{name:>6} {label:<24} {seconds * 1000:8.1f} мс  x{legacy / seconds:.1f}")
+
+def make_level_map(width, height, density, seed=0):
+    """Карта width x height: стены по краям, платформы с долей density, пустое место появления слева внизу."""
+    rng = random.Random(seed)
+    cells = [[False] * width for _ in range(height)]
+    for x in range(width):
+        cells[0][x] = cells[height - 1][x] = True
+    for y in range(height):
+        cells[y][0] = cells[y][width - 1] = True
+    for y in range(2, height - 2):
+        for x in range(1, width - 1):
+            if rng.random() < density:
+                length = rng.randint(1, 6) if y % 3 == 0 else 1
+                for dx in range(length):
+                    if x + dx < width - 1:
+                        cells[y][x + dx] = True
+    for y in range(height - 8, height - 1):
+        for x in range(2, 12):
+            cells[y][x] = False
+    return ["".join("█" if solid else " " for solid in row) for row in cells]
+
+def make_level(size_name, density=0.04, seed=0):
+    """Уровень из LEVEL_SIZES и позиция появления игрока на нём."""
+    size = LEVEL_SIZES[size_name]
+    if size is None:
+        return main.Level(), (100, 600)
+    level = main.Level(make_level_map(size[0], size[1], density, seed))
+    return level, (3 * main.TILE_SIZE, (size[1] - 2) * main.TILE_SIZE)
+
+def percentiles(samples):
+    """p50/p95/p99 длительностей samples (сек) в миллисекундах."""
+    ordered = sorted(samples)
+    def pick(fraction):
+        return ordered[min(len(ordered) - 1, int(fraction * len(ordered)))] * 1000
+    return {"p50_ms": pick(0.5), "p95_ms": pick(0.95), "p99_ms": pick(0.99)}
+
+def measure_allocations(run, count):
+    """Пиковый прирост памяти (КБ) и остаток после run(count) по tracemalloc."""
+    tracemalloc.start()
+    start, _ = tracemalloc.get_traced_memory()
+    tracemalloc.reset_peak()
+    run(count)
+    current, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return {"peak_alloc_kb": (peak - start) / 1024, "net_alloc_bytes": current - start}
+
+# Сценарии физики: каждый возвращает функцию policy(step, player) -> (клавиши, действия)
+def hook_swing_policy(spawn):
+    """Долгое раскачивание на крюке: зацеп над головой и смена направления раз в секунду."""
+    keys = main.KeyState()
+    def policy(step, player):
+        actions = []
+        if player.hook.state is None:
+            actions.append((main.ACTION_HOOK, player.pos.x + 120, player.pos.y - 220))
+        elif player.hook.state == "attached" and step % (main.SIM_HZ * 8) == 0:
+            actions.append((main.ACTION_RELEASE,))
+        keys.pressed = {pygame.K_d} if (step // main.SIM_HZ) % 2 == 0 else {pygame.K_a}
+        return keys, actions
+    return policy
+
+def dash_spam_policy(spawn):
+    """Рывки в стену: бег влево, рывок при каждой готовности и прыжки."""
+    keys = main.KeyState({pygame.K_a})
+    def policy(step, player):
+        actions = []
+        if player.dash_timer <= 0:
+            actions.append((main.ACTION_DASH,))
+        if step % (main.SIM_HZ // 2) == 0:
+            actions.append((main.ACTION_JUMP,))
+        return keys, actions
+    return policy
+
+def hook_dense_policy(spawn):
+    """Выстрелы крюком по кругу в плотную геометрию с отпусканием после зацепа."""
+    keys = main.KeyState()
+    state = {"angle": 0.0, "attached_at": None}
+    def policy(step, player):
+        actions = []
+        if player.hook.state is None:
+            state["angle"] += 0.7
+            target = (player.pos.x + math.cos(state["angle"]) * main.HOOK_RANGE,
+                      player.pos.y + math.sin(state["angle"]) * main.HOOK_RANGE)
+            actions.append((main.ACTION_HOOK,) + target)
+            state["attached_at"] = None
+        elif player.hook.state == "attached":
+            if state["attached_at"] is None:
+                state["attached_at"] = step
+            elif step - state["attached_at"] > main.SIM_HZ // 4:
+                actions.append((main.ACTION_RELEASE,))
+        return keys, actions
+    return policy
+
+# Имя сценария -> (политика ввода, плотность геометрии уровня)
+PHYSICS_SCENARIOS = {
+    "hook_swing": (hook_swing_policy, 0.04),
+    "dash_spam": (dash_spam_policy, 0.04),
+    "hook_dense": (hook_dense_policy, 0.25),
+}
+
+def run_physics(name, size_name, steps):
+    """Прогоняет сценарий физики без окна: шагов/с, перцентили шага и выделения памяти."""
+    make_policy, density = PHYSICS_SCENARIOS[name]
+    level, spawn = make_level(size_name, density)
+
+    def make_simulation():
+        simulation = main.HeadlessSimulation(level, main.Player(*spawn))
+        policy = make_policy(spawn)
+        return simulation, policy
+
+    simulation, policy = make_simulation()
+    samples = []
+    start = time.perf_counter()
+    for step in range(steps):
+        step_start = time.perf_counter()
+        keys, actions = policy(step, simulation.player)
+        simulation.step(keys, actions)
+        samples.append(time.perf_counter() - step_start)
+    elapsed = time.perf_counter() - start
+    result = {"rate": steps / elapsed}
+    result.update(percentiles(samples))
+
+    simulation, policy = make_simulation()
+    def run(count):
+        for step in range(count):
+            keys, actions = policy(step, simulation.player)
+            simulation.step(keys, actions)
+    run(main.SIM_HZ)  # Прогрев: кэши кадров анимации и т.п.
+    result.update(measure_allocations(run, min(steps, main.SIM_HZ * 10)))
+    return result
+
+def bench_alloc(args):
+    """Выделения памяти в шаге физики: пик за шаг и блоки, оставшиеся от прогона (tracemalloc)."""
+    if args.warmup < ALLOC_WARMUP_STEPS:
+        print(f"Прогрев {args.warmup} шагов короче {ALLOC_WARMUP_STEPS}: свободные списки CPython ещё растут, "
+              "это не установившийся режим")
+        sys.exit(1)
+    print(f"{'сценарий':<20} {'шагов':>7} {'пик шага Б':>11} {'шагов с выделением':>19} {'новых блоков':>13}")
+    # Блоки считаются только из main.py: ввод сценария и сам замер не в счёт
+    main_only = (tracemalloc.Filter(True, main.__file__),)
+    failed = False
+    for name in args.scenarios:
+        make_policy, density = PHYSICS_SCENARIOS[name]
+        level, spawn = make_level(args.size, density)
+        simulation = main.HeadlessSimulation(level, main.Player(*spawn))
+        policy = make_policy(spawn)
+        # Чанки уровня загружаются один раз при первом обращении - это не выделения шага
+        for chunk_y in range(level.source.chunks_y):
+            for chunk_x in range(level.source.chunks_x):
+                level.get_chunk(chunk_x, chunk_y)
+        # Прогрев: кэши кадров и свободные списки CPython (см. ALLOC_WARMUP_STEPS)
+        for step in range(args.warmup):
+            simulation.step(*policy(step, simulation.player))
+        # Массив под замеры выделен заранее, чтобы сам не попадал в замер
+        step_peaks = array.array("q", bytes(8 * args.steps))
+        tracemalloc.start()
+        before = tracemalloc.take_snapshot().filter_traces(main_only)
+        # Числа от get_traced_memory сами выделяются под tracemalloc: первый вызов
+        # заранее, чтобы на первом шаге не освобождались неотслеживаемые
+        start, _ = tracemalloc.get_traced_memory()
+        _, peak = tracemalloc.get_traced_memory()
+        for index in range(args.steps):
+            keys, actions = policy(args.warmup + index, simulation.player)
+            start, _ = tracemalloc.get_traced_memory()
+            tracemalloc.reset_peak()
+            simulation.step(keys, actions)
+            _, peak = tracemalloc.get_traced_memory()
+            step_peaks[index] = peak - start
+        after = tracemalloc.take_snapshot().filter_traces(main_only)
+        tracemalloc.stop()
+        blocks = sum(max(0, stat.count_diff) for stat in after.compare_to(before, "lineno"))
+        allocating = sum(1 for peak in step_peaks if peak > 0)
+        print(f"{name:<20} {args.steps:7d} {max(step_peaks):11d} {allocating:19d} {blocks:13d}")
+        failed |= allocating > 0 or blocks > 0
+    if failed:
+        print("Шаг физики выделяет память")
+        sys.exit(1)
+
+def bench_replay(args):
+    """Прогон записанной сессии (main.py --record) без окна с теми же метриками, что у run."""
+    def make_simulation():
+        replay = main.ReplayInput(args.file)
+        return main.HeadlessSimulation(input_source=replay), replay
+
+    simulation, replay = make_simulation()
+    samples = []
+    start = time.perf_counter()
+    for step in range(replay.steps):
+        step_start = time.perf_counter()
+        keys, actions = replay.poll(step)
+        simulation.step(keys, actions)
+        samples.append(time.perf_counter() - step_start)
+    elapsed = time.perf_counter() - start
+    result = percentiles(samples)
+    match = "совпадает" if replay.final_pos is None or simulation.player.pos == replay.final_pos else "НЕ совпадает"
+    simulation, replay = make_simulation()
+    result.update(measure_allocations(simulation.run, replay.steps))
+    print(f"{args.file}: {replay.steps} шагов, {replay.steps / elapsed:.0f} шагов/с, "
+          f"p50 {result['p50_ms']:.3f} мс, p95 {result['p95_ms']:.3f} мс, p99 {result['p99_ms']:.3f} мс, "
+          f"пик {result['peak_alloc_kb']:.1f} КБ, итоговая позиция {match} с записью")
+
+def measure_memory(function):
+    """Результат function() и память (байт), оставшаяся занятой после вызова, по tracemalloc."""
+    tracemalloc.start()
+    start, _ = tracemalloc.get_traced_memory()
+    result = function()
+    current, _ = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return result, current - start
+
+def bench_level(args):
+    """Время загрузки и память уровня width x height в текстовом и двоичном формате."""
+    level_map = make_level_map(args.width, args.height, args.density)
+    width, height, cells = main.parse_level_text(level_map)
+    solid_count = len(cells) - cells.count(main.TILE_EMPTY)
+    print(f"Уровень {width}x{height}, твёрдых клеток {solid_count}")
+    with tempfile.TemporaryDirectory() as directory:
+        text_path = os.path.join(directory, "level.txt")
+        with open(text_path, "w", encoding="utf-8") as file:
+            file.write("\n".join(row.replace("█", "#").replace(" ", ".") for row in level_map))
+        binary_path = os.path.join(directory, "level.lvl")
+        main.save_level_binary(binary_path, width, height, cells)
+        for label, path in (("текст", text_path), ("двоичный", binary_path)):
+            main.level_geometry_cache.clear()
+            start = time.perf_counter()
+            level, memory = measure_memory(lambda: main.Level(path=path))
+            elapsed = time.perf_counter() - start
+            print(f"{label:>9}: файл {os.path.getsize(path) / 1024:8.0f} КБ, загрузка {elapsed * 1000:7.1f} мс, "
+                  f"память {memory / 1024 / 1024:6.2f} МБ ({memory / solid_count:.1f} байт на твёрдую клетку)")
+
+    # Прямоугольники строятся только для чанков, к которым обращаются: экран и вокруг него
+    screen_chunks = (main.BASE_WIDTH // (main.LEVEL_CHUNK_TILES * main.TILE_SIZE) + 2) * \
+                    (main.BASE_HEIGHT // (main.LEVEL_CHUNK_TILES * main.TILE_SIZE) + 2)
+    def touch_chunks():
+        for index in range(screen_chunks):
+            level.get_chunk_rects(index % 6, index // 6)
+    _, chunk_memory = measure_memory(touch_chunks)
+    print(f"прямоугольники {screen_chunks} чанков вокруг экрана: {chunk_memory / 1024:.0f} КБ")
+
+    # Для сравнения: прежнее представление с Rect на каждый твёрдый тайл
+    def build_tiles():
+        return [pygame.Rect(index % width * main.TILE_SIZE, index // width * main.TILE_SIZE, main.TILE_SIZE, main.TILE_SIZE)
+                for index in range(len(cells)) if cells[index] != main.TILE_EMPTY]
+    start = time.perf_counter()
+    build_tiles()
+    elapsed = time.perf_counter() - start
+    _, tiles_memory = measure_memory(build_tiles)
+    print(f"Rect на тайл: {elapsed * 1000:7.1f} мс, память {tiles_memory / 1024 / 1024:6.2f} МБ "
+          f"({tiles_memory / solid_count:.1f} байт на твёрдую клетку)")
+
+def bench_stream(args):
+    """Проход игрока по уровню из файла с чанками: чанков в памяти, пик памяти и время кадра."""
+    level_map = make_level_map(args.width, args.height, args.density)
+    width, height, cells = main.parse_level_text(level_map)
+    del level_map
+    with tempfile.TemporaryDirectory() as directory:
+        path = os.path.join(directory, "level.lvl")
+        main.save_level_binary(path, width, height, cells, chunked=True)
+        del cells
+        print(f"Уровень {width}x{height}: файл с чанками {os.path.getsize(path) / 1024 / 1024:.1f} МБ, "
+              f"бюджет {main.LEVEL_CHUNK_BUDGET} чанков")
+        level = main.Level(path=path)
+        player = main.Player(0, 0)
+        max_x = width * main.TILE_SIZE - main.BASE_WIDTH
+        max_y = height * main.TILE_SIZE - main.BASE_HEIGHT
+        speed = max_x / args.frames
+
+        def run_frame(frame):
+            # Игрок бежит слева направо, раскачиваясь по высоте
+            progress = frame / max(1, args.frames - 1)
+            camera = pygame.Vector2(max_x * progress, max_y * (0.5 - 0.5 * math.cos(progress * math.pi * 4)))
+            player.pos.update(camera.x + main.BASE_WIDTH / 2, camera.y + main.BASE_HEIGHT / 2)
+            player.vel.update(speed, 0)
+            main.stream_level(level, player, camera)
+            level.query_rect(pygame.Rect(int(player.pos.x), int(player.pos.y), 64, 64))
+            level.raycast(player.pos, player.pos + pygame.Vector2(main.HOOK_RANGE * 0.7, -main.HOOK_RANGE * 0.7))
+
+        samples = []
+        max_chunks = 0
+        tracemalloc.start()
+        for frame in range(args.frames):
+            frame_start = time.perf_counter()
+            run_frame(frame)
+            samples.append(time.perf_counter() - frame_start)
+            max_chunks = max(max_chunks, len(level.chunks))
+        _, peak = tracemalloc.get_traced_memory()
+        tracemalloc.stop()
+        total_chunks = level.source.chunks_x * level.source.chunks_y
+        result = percentiles(samples)
+        print(f"кадров {args.frames}: p50 {result['p50_ms']:.3f} мс, p95 {result['p95_ms']:.3f} мс, p99 {result['p99_ms']:.3f} мс")
+        print(f"чанков в памяти: максимум {max_chunks} из {total_chunks}, пик памяти {peak / 1024 / 1024:.2f} МБ")
+        level.source.buffer.close()
+
+def profile_errors(columns, limits):
+    """Нарушения проходимости в столбцах бесконечного уровня: список строк."""
+    rise, jump_gap, dash_gap, hook_gap = limits
+    height = main.ENDLESS_HEIGHT_TILES
+    floors = []  # Верхняя клетка пола в каждом столбце тайлов или None над провалом
+    anchors = set()
+    for column in columns:
+        for local_x in range(main.LEVEL_CHUNK_TILES):
+            solid = [column[row // main.LEVEL_CHUNK_TILES][row % main.LEVEL_CHUNK_TILES * main.LEVEL_CHUNK_TILES + local_x]
+                     != main.TILE_EMPTY for row in range(height)]
+            top = next((row for row in range(height) if solid[row] and all(solid[row:])), None)
+            anchors.update((len(floors), row) for row in range(height) if solid[row] and (top is None or row < top))
+            floors.append(top)
+    errors = []
+    x = 0
+    while x < len(floors) - 1:
+        if floors[x] is not None and floors[x + 1] is not None and floors[x] - floors[x + 1] > rise:
+            errors.append(f"x={x + 1}: подъём {floors[x] - floors[x + 1]}")
+        if floors[x] is not None and floors[x + 1] is None:
+            end = x + 1
+            while end < len(floors) and floors[end] is None:
+                end += 1
+            width = end - x - 1
+            if end == len(floors):
+                break
+            if floors[end] < floors[x]:
+                errors.append(f"x={end}: подъём после провала")
+            if width > hook_gap:
+                errors.append(f"x={x + 1}: провал {width}")
+            elif width > dash_gap:
+                edge = ((x + 1) * main.TILE_SIZE, floors[x] * main.TILE_SIZE)
+                if not any(x < anchor_x < end and math.hypot(anchor_x * main.TILE_SIZE - edge[0], anchor_y * main.TILE_SIZE - edge[1])
+                           <= main.HOOK_RANGE for anchor_x, anchor_y in anchors):
+                    errors.append(f"x={x + 1}: провал {width} без опоры для крюка")
+            x = end
+            continue
+        x += 1
+    return errors
+
+def bench_endless(args):
+    """Скорость генерации бесконечного уровня, проходимость и память при быстром проходе камеры."""
+    limits = main.crossing_limits(-15, 5)
+    generator = main.EndlessGenerator(args.seed, -15, 5)
+    start = time.perf_counter()
+    columns = [generator.generate() for _ in range(args.columns)]
+    elapsed = time.perf_counter() - start
+    chunks_y = main.ENDLESS_HEIGHT_TILES // main.LEVEL_CHUNK_TILES
+    print(f"генерация: {args.columns / elapsed:.0f} столбцов/с, {args.columns * chunks_y / elapsed:.0f} чанков/с")
+    errors = profile_errors(columns, limits)
+    print(f"пределы (подъём, прыжок, рывок, крюк) {limits}: нарушений {len(errors)}")
+    for error in errors[:10]:
+        print("  " + error)
+
+    # Камера идёт вправо быстрее игрока; генерация в фоновом потоке
+    level = main.EndlessLevel(args.seed)
+    player = main.Player(*level.spawn)
+    frame_time = 1 / main.FPS
+    samples = []
+    max_columns = max_chunks = missing_frames = 0
+    chunk_size = main.LEVEL_CHUNK_TILES * main.TILE_SIZE
+    tracemalloc.start()
+    for frame in range(args.frames):
+        frame_start = time.perf_counter()
+        camera = pygame.Vector2(frame * args.speed, 0)
+        player.pos.update(camera.x + main.BASE_WIDTH / 2, level.spawn[1])
+        player.vel.update(args.speed, 0)
+        main.stream_level(level, player, camera)
+        level.discard_behind(player.pos.x)
+        level.query_rect(pygame.Rect(int(player.pos.x), int(player.pos.y), 24, 32))
+        samples.append(time.perf_counter() - frame_start)
+        visible = range(int(camera.x) // chunk_size, (int(camera.x) + main.BASE_WIDTH) // chunk_size + 1)
+        missing_frames += any(column not in level.source.columns for column in visible)
+        max_columns = max(max_columns, len(level.source.columns))
+        max_chunks = max(max_chunks, len(level.chunks))
+        time.sleep(max(0.0, frame_time - (time.perf_counter() - frame_start)))
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    level.close()
+    result = percentiles(samples)
+    print(f"проход {args.frames} кадров со скоростью {args.speed} пикс/кадр: p50 {result['p50_ms']:.3f} мс, "
+          f"p99 {result['p99_ms']:.3f} мс, кадров с неготовыми чанками {missing_frames}")
+    print(f"в памяти: максимум {max_columns} столбцов, {max_chunks} чанков уровня, пик {peak / 1024:.0f} КБ")
+
+def bench_rope(args):
+    """Время шага гибкой верёвки от числа отрезков и доля бюджета кадра."""
+    if main.np is None:
+        print("NumPy не найден: гибкая верёвка недоступна")
+        return
+    level = main.Level(main.DEFAULT_LEVEL_MAP)
+    step = main.SIM_DT * main.FPS
+    steps_per_frame = main.SIM_HZ // main.FPS
+    budget_ms = 1000 / main.FPS
+    print(f"{'отрезков':>9} {'мкс/шаг':>9} {'мс/кадр':>9} {'бюджета':>8} {'растяжение':>11}")
+    for segments in args.segments:
+        # Качание под потолком открытой части уровня с раскачкой вправо-влево
+        rope = main.VerletRope((1250, 40), (1400, 200), (0, 0), 250, segments)
+        samples = []
+        for index in range(args.steps):
+            force = (main.ROPE_SWING_FORCE if index // 120 % 2 == 0 else -main.ROPE_SWING_FORCE, 0.0)
+            start = time.perf_counter()
+            rope.update(level, step, force)
+            samples.append(time.perf_counter() - start)
+        step_time = percentiles(samples)["p50_ms"]
+        frame_time = step_time * steps_per_frame
+        stretch = math.hypot(*(rope.points[-1] - rope.anchor)) / rope.length
+        print(f"{segments:9d} {step_time * 1000:9.0f} {frame_time:9.3f} {frame_time / budget_ms:8.1%} {stretch:11.3f}")
+
+def brute_force_pairs(entities):
+    """Пересекающиеся пары полным перебором - эталон для широкой фазы."""
+    pairs = []
+    for index, entity in enumerate(entities):
+        for other in entities[index + 1:]:
+            if entity.rect.colliderect(other.rect):
+                pairs.append((entity, other))
+    return pairs
+
+def bench_entities(args):
+    """Шаг EntityWorld от числа тел при постоянной плотности: цена тела и отдельно широкой фазы (resort + find_pairs)."""
+    # Враги и платформы: снаряды быстро гибнут в тайлах, и число тел падало бы
+    kinds = (main.ENTITY_ENEMY, main.ENTITY_ENEMY, main.ENTITY_PLATFORM)
+    print(f"{'тел':>6} {'мс/шаг':>8} {'мкс/тело':>9} {'к первому':>10} {'фаза мкс/тело':>14} {'пар':>6} {'перебор мс':>11} {'пары':>6}")
+    worlds = []
+    for count in args.counts:
+        # Уровень растёт в ширину вместе с числом тел: на тело приходится одна и та же площадь,
+        # и рост цены тела показывал бы саму широкую фазу, а не уплотнение
+        width = max(ENTITY_LEVEL_HEIGHT, count * args.cells_per_body // ENTITY_LEVEL_HEIGHT)
+        level = main.Level(make_level_map(width, ENTITY_LEVEL_HEIGHT, 0.04))
+        world = main.EntityWorld()
+        world.populate(level, count, kinds=kinds)
+        for _ in range(main.SIM_HZ // 2):
+            world.update(level, main.SIM_DT)  # Прогрев: враги падают на пол, чанки строятся
+        worlds.append((level, world, [], [], [0]))
+    # Шаги разных размеров чередуются: медленный дрейф частоты машины ложится на все строки поровну
+    for _ in range(args.steps):
+        for level, world, samples, broadphase_samples, pair_count in worlds:
+            start = time.perf_counter()
+            world.update(level, main.SIM_DT)
+            samples.append(time.perf_counter() - start)
+            pair_count[0] += len(world.pairs)
+            start = time.perf_counter()
+            world.resort()
+            world.find_pairs()
+            broadphase_samples.append(time.perf_counter() - start)
+    base_cost = None
+    for _, world, samples, broadphase_samples, pair_count in worlds:
+        step_ms = percentiles(samples)["p50_ms"]
+        cost = step_ms * 1000 / len(world.entities)
+        broadphase_cost = percentiles(broadphase_samples)["p50_ms"] * 1000 / len(world.entities)
+        base_cost = base_cost or cost
+        brute = "-"
+        check = "-"
+        if len(world.entities) <= args.brute_limit:
+            start = time.perf_counter()
+            expected = brute_force_pairs(world.entities)
+            brute = f"{(time.perf_counter() - start) * 1000:.2f}"
+            found = {frozenset((id(first), id(second))) for first, second in world.find_pairs()}
+            check = "да" if found == {frozenset((id(first), id(second))) for first, second in expected} else "НЕТ"
+        print(f"{len(world.entities):6d} {step_ms:8.3f} {cost:9.2f} {cost / base_cost:10.2f} {broadphase_cost:14.2f} "
+              f"{pair_count[0] / args.steps:6.0f} {brute:>11} {check:>6}")
+
+def bench_latency(args):
+    """Задержка ввода (кадров и мс до показа) при разной частоте кадров игры."""
+    os.environ.setdefault("SDL_VIDEODRIVER", "dummy")
+    os.environ.setdefault("SDL_AUDIODRIVER", "dummy")
+    main.setup()
+    pygame.mixer.music.stop()
+    game = main.game
+    for fps in args.fps:
+        game.reset(game.main_level)
+        main.input_latency.reset()
+        for frame in range(args.frames):
+            if frame % 7 == 3:
+                pygame.event.post(pygame.event.Event(pygame.KEYDOWN, key=pygame.K_SPACE))
+            game.handle_events(["game", None])
+            game.update()
+            game.draw()
+            pygame.display.flip()
+            main.input_latency.presented(game.frame_count)
+            game.frame_count += 1
+            game.clock.tick(fps)
+        frames = sorted(main.input_latency.frames)
+        times = main.input_latency.times
+        print(f"{fps:4d} FPS: среднее {sum(frames) / len(frames):.2f} кадра, {sum(times) / len(times) * 1000:6.2f} мс, "
+              f"максимум {frames[-1]} кадра, действий {len(frames)}")
+
+def set_resolution(size):
+    """Переключает окно на size и синхронно собирает фоны под него."""
+    main.handle_resize(*size)
+    main.menu_background, main.level_background, main.level_background_blurred = \
+        main.background_pipeline.get_now(main.viewport.size)
+    main.game.screen = main.screen
+
+def run_camera_pan(size_name, resolution, frames):
+    """Проход камеры по уровню через Game.draw: кадров/с, перцентили кадра и память."""
+    set_resolution(RENDER_RESOLUTIONS[resolution])
+    game = main.game
+    game.reset()
+    game.level, spawn = make_level(size_name)
+    game.player = main.Player(*spawn)
+    game.hud.player = game.player
+    game.player.rebuild_frame_cache(main.scale_factor)
+    max_x = max(0, game.level.width * main.TILE_SIZE - main.BASE_WIDTH)
+    max_y = max(0, game.level.height * main.TILE_SIZE - main.BASE_HEIGHT)
+
+    def draw_frame(frame):
+        # Камера идёт слева направо, медленно спускаясь сверху вниз
+        progress = frame / max(1, frames - 1)
+        game.camera.update(max_x * progress, max_y * (0.5 - 0.5 * math.cos(progress * math.pi * 4)))
+        game.prev_camera.update(game.camera)
+        game.draw()
+        pygame.display.flip()
+
+    for frame in range(10):
+        draw_frame(0)  # Прогрев: первая сборка видимых фрагментов уровня
+    samples = []
+    start = time.perf_counter()
+    for frame in range(frames):
+        frame_start = time.perf_counter()
+        draw_frame(frame)
+        samples.append(time.perf_counter() - frame_start)
+    elapsed = time.perf_counter() - start
+    result = {"rate": frames / elapsed}
+    result.update(percentiles(samples))
+    game.level.clear_render_cache()
+
+    def run(count):
+        for frame in range(count):
+            draw_frame(frame * frames // count)
+    result.update(measure_allocations(run, min(frames, 60)))
+    game.level.clear_render_cache()
+    return result
+
+def compare(results, baseline, threshold):
+    """Сравнивает с эталоном; возвращает список регрессий сильнее threshold."""
+    regressions = []
+    for key, result in results.items():
+        if key not in baseline:
+            continue
+        for metric, higher_is_better in COMPARED_METRICS:
+            old, new = baseline[key].get(metric), result.get(metric)
+            if not old or new is None:
+                continue
+            change = (new - old) / old
+            worse = -change if higher_is_better else change
+            if worse > threshold:
+                regressions.append((key, metric, old, new, change))
+    return regressions
+
+def bench_run(args):
+    results = {}
+    for size_name in args.sizes:
+        for name in args.scenarios:
+            if name in PHYSICS_SCENARIOS:
+                results[f"{name}/{size_name}"] = run_physics(name, size_name, args.steps)
+    if "camera_pan" in args.scenarios:
+        os.environ.setdefault("SDL_VIDEODRIVER", "dummy")
+        os.environ.setdefault("SDL_AUDIODRIVER", "dummy")
+        main.setup()
+        pygame.mixer.music.stop()
+        for size_name in args.sizes:
+            for resolution in args.resolutions:
+                results[f"camera_pan/{size_name}/{resolution}"] = run_camera_pan(size_name, resolution, args.frames)
+
+    print(f"{'сценарий':<28} {'в сек':>10} {'p50 мс':>8} {'p95 мс':>8} {'p99 мс':>8} {'пик КБ':>8} {'остаток Б':>10}")
+    for key, result in results.items():
+        print(f"{key:<28} {result['rate']:10.0f} {result['p50_ms']:8.3f} {result['p95_ms']:8.3f} "
+              f"{result['p99_ms']:8.3f} {result['peak_alloc_kb']:8.1f} {result['net_alloc_bytes']:10d}")
+
+    if args.save_baseline:
+        with open(args.save_baseline, "w") as file:
+            json.dump(results, file, indent=2)
+        print(f"Эталон сохранён в {args.save_baseline}")
+    if args.baseline:
+        with open(args.baseline) as file:
+            baseline = json.load(file)
+        regressions = compare(results, baseline, args.threshold)
+        for key, metric, old, new, change in regressions:
+            print(f"РЕГРЕССИЯ {key} {metric}: {old:.3f} -> {new:.3f} ({change:+.0%})")
+        if regressions:
+            sys.exit(1)
+        print(f"Регрессий больше {args.threshold:.0%} нет")
+
+def parse_args():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    subparsers = parser.add_subparsers(dest="command", required=True)
+    blur_parser = subparsers.add_parser("blur", help="размытие фона при 1080p и 4K")
+    blur_parser.add_argument("--repeats", type=int, default=5)
+    blur_parser.set_defaults(function=bench_blur)
+    run_parser = subparsers.add_parser("run", help="сценарии физики и отрисовки")
+    run_parser.add_argument("--scenarios", nargs="+", default=list(PHYSICS_SCENARIOS) + ["camera_pan"],
+                            choices=list(PHYSICS_SCENARIOS) + ["camera_pan"])
+    run_parser.add_argument("--sizes", nargs="+", default=list(LEVEL_SIZES), choices=list(LEVEL_SIZES))
+    run_parser.add_argument("--resolutions", nargs="+", default=list(RENDER_RESOLUTIONS), choices=list(RENDER_RESOLUTIONS))
+    run_parser.add_argument("--steps", type=int, default=main.SIM_HZ * 60, help="шагов на сценарий физики")
+    run_parser.add_argument("--frames", type=int, default=300, help="кадров на проход камеры")
+    run_parser.add_argument("--baseline", metavar="FILE", help="сравнить с эталоном")
+    run_parser.add_argument("--save-baseline", metavar="FILE", help="сохранить результаты как эталон")
+    run_parser.add_argument("--threshold", type=float, default=0.15, help="допустимое ухудшение (доля)")
+    run_parser.set_defaults(function=bench_run)
+    alloc_parser = subparsers.add_parser("alloc", help="выделения памяти в шаге физики")
+    alloc_parser.add_argument("--scenarios", nargs="+", default=list(PHYSICS_SCENARIOS), choices=list(PHYSICS_SCENARIOS))
+    alloc_parser.add_argument("--size", default="medium", choices=list(LEVEL_SIZES))
+    alloc_parser.add_argument("--steps", type=int, default=main.SIM_HZ * 30)
+    alloc_parser.add_argument("--warmup", type=int, default=ALLOC_WARMUP_STEPS, help=f"шагов до замера (не меньше {ALLOC_WARMUP_STEPS})")
+    alloc_parser.set_defaults(function=bench_alloc)
+    replay_parser = subparsers.add_parser("replay", help="прогон записанной сессии без окна")
+    replay_parser.add_argument("file", help="файл записи ввода (main.py --record)")
+    replay_parser.set_defaults(function=bench_replay)
+    level_parser = subparsers.add_parser("level", help="память и время загрузки большого уровня")
+    level_parser.add_argument("--width", type=int, default=2000)
+    level_parser.add_argument("--height", type=int, default=500)
+    level_parser.add_argument("--density", type=float, default=0.04)
+    level_parser.set_defaults(function=bench_level)
+    stream_parser = subparsers.add_parser("stream", help="потоковая подгрузка чанков огромного уровня")
+    stream_parser.add_argument("--width", type=int, default=20000)
+    stream_parser.add_argument("--height", type=int, default=500)
+    stream_parser.add_argument("--density", type=float, default=0.04)
+    stream_parser.add_argument("--frames", type=int, default=3000)
+    stream_parser.set_defaults(function=bench_stream)
+    endless_parser = subparsers.add_parser("endless", help="генерация бесконечного уровня")
+    endless_parser.add_argument("--columns", type=int, default=2000, help="столбцов для замера скорости генерации")
+    endless_parser.add_argument("--frames", type=int, default=600)
+    endless_parser.add_argument("--speed", type=float, default=40, help="скорость камеры, пикс/кадр")
+    endless_parser.add_argument("--seed", type=int, default=1)
+    endless_parser.set_defaults(function=bench_endless)
+    rope_parser = subparsers.add_parser("rope", help="шаг гибкой верёвки крюка")
+    rope_parser.add_argument("--segments", type=int, nargs="+", default=[24, 100, 200, 400, 800])
+    rope_parser.add_argument("--steps", type=int, default=600)
+    rope_parser.set_defaults(function=bench_rope)
+    entities_parser = subparsers.add_parser("entities", help="широкая фаза подвижных тел")
+    entities_parser.add_argument("--counts", type=int, nargs="+", default=[250, 500, 1000, 2000, 4000, 8000])
+    entities_parser.add_argument("--cells-per-body", type=int, default=128, help="клеток уровня на тело")
+    entities_parser.add_argument("--steps", type=int, default=120)
+    entities_parser.add_argument("--brute-limit", type=int, default=2000, help="сверять пары с перебором до стольких тел")
+    entities_parser.set_defaults(function=bench_entities)
+    latency_parser = subparsers.add_parser("latency", help="задержка ввода до показа кадра")
+    latency_parser.add_argument("--fps", type=int, nargs="+", default=[30, 60, 144, 240])
+    latency_parser.add_argument("--frames", type=int, default=300)
+    latency_parser.set_defaults(function=bench_latency)
+    return parser.parse_args()
+
+if __name__ == "__main__":
+    args = parse_args()
+    args.function(args)
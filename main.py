@@ -1,3 +1,5 @@
+import time
+STARTUP_TIME = time.perf_counter()  # Момент запуска для замера времени до первого кадра
 import pygame
 import sys
 import math
@@ -6,6 +8,23 @@ from pygame import Vector2
 import asyncio
 import platform
 import os
+import argparse
+import threading
+import queue
+import csv
+import json
+import struct
+import hashlib
+import mmap
+import zlib
+import bisect
+from collections import OrderedDict, deque
+from operator import attrgetter, itemgetter
+
+try:
+    import numpy as np
+except ImportError:
+    np = None  # Без NumPy размытие работает через пирамиду smoothscale
 
 # Constants
 WIDTH, HEIGHT = 800, 600
@@ -28,36 +47,147 @@ ROWS = {
 }
 FRAMES_PER_ROW = 8
 
-# Инициализация Pygame
-pygame.init()
-
 # Базовые размеры разрешения для масштабирования
 BASE_WIDTH = 1920
 BASE_HEIGHT = 1080
 ASPECT_RATIO = BASE_WIDTH / BASE_HEIGHT  # 16:9
 
-# Определение начального размера окна на основе экрана
-try:
-    display_info = pygame.display.get_desktop_sizes()[0]
-    WIDTH, HEIGHT = display_info[0], display_info[1]
-except:
-    WIDTH, HEIGHT = 1280, 720  # Резервное разрешение
-
-# Создание окна с поддержкой изменения размера
-screen = pygame.display.set_mode((WIDTH, HEIGHT), pygame.RESIZABLE)
-pygame.display.set_caption("Главное меню - Пиксельный платформер")
+# Резервное разрешение; реальное определяется в setup()
+WIDTH, HEIGHT = 1280, 720
 
 # Константы
 TILE_SIZE = 32  # Размер тайла
+LEVEL_CHUNK_TILES = 16  # Сторона чанка уровня в тайлах (столкновения, отрисовка, файл)
+LEVEL_CHUNK_SIZE = LEVEL_CHUNK_TILES * TILE_SIZE  # Сторона чанка в пикселях
+LEVEL_CHUNK_BUDGET = 512  # Сколько чанков потокового уровня держать в памяти
+RENDER_CHUNK_BUDGET = 40  # Сколько отрисованных чанков хранить
+LEVEL_PREFETCH_FRAMES = 30  # На сколько кадров движения вперёд подгружать чанки
+ENDLESS_HEIGHT_TILES = 48  # Высота бесконечного уровня в тайлах
+ENDLESS_COLUMNS = 1 << 16  # Ширина бесконечного уровня в столбцах чанков
+ENDLESS_AHEAD_COLUMNS = 6  # Сколько столбцов чанков генерировать впереди камеры
+ENDLESS_BEHIND_COLUMNS = 1  # Сколько столбцов чанков хранить позади экрана вокруг игрока
+ENDLESS_START_TILES = 24  # Ровный пол в начале забега
 GRAVITY = 0.8   # Гравитация
 HOOK_RANGE = 300  # Дальность крюка
 HOOK_SPEED = 20   # Скорость крюка
 MIN_ROPE_LENGTH = 50  # Минимальная длина веревки
 ROPE_SPEED = 5    # Скорость изменения длины веревки
 SWING_SPEED = 0.02  # Скорость качания
+ROPE_RIGID = "rigid"  # Верёвка - жёсткий радиус
+ROPE_VERLET = "verlet"  # Верёвка из частиц, огибающая тайлы (нужен NumPy)
+ROPE_SEGMENTS = 24  # Отрезков гибкой верёвки
+ROPE_ITERATIONS = 8  # Итераций решения ограничений длины за шаг
+ROPE_DAMPING = 0.999  # Затухание скорости частиц верёвки за кадр
+ROPE_PLAYER_MASS = 8  # Масса игрока относительно частицы верёвки
+ROPE_SWING_FORCE = 0.25  # Ускорение раскачки гибкой верёвки (пикс/кадр²)
 DASH_DISTANCE = 100  # Дистанция рывка
 DASH_COOLDOWN = 0.25  # Кулдаун рывка (0.25 сек)
 DASH_DURATION = 0.2  # Длительность рывка (сек)
+JUMP_BUFFER_TIME = 0.1  # Сколько сек прыжок, нажатый в воздухе, ждёт приземления
+COYOTE_TIME = 0.1  # Сколько сек после схода с края ещё можно прыгнуть
+FRICTION = 0.9  # Затухание горизонтальной скорости за кадр
+
+# Подвижные тела уровня (EntityWorld)
+ENTITY_ENEMY = "enemy"
+ENTITY_PLATFORM = "platform"
+ENTITY_PROJECTILE = "projectile"
+ENTITY_KINDS = (ENTITY_ENEMY, ENTITY_ENEMY, ENTITY_ENEMY, ENTITY_PLATFORM, ENTITY_PROJECTILE)  # Доли при расстановке
+ENTITY_SIZES = {
+    ENTITY_ENEMY: (24, 32),
+    ENTITY_PLATFORM: (96, 16),
+    ENTITY_PROJECTILE: (8, 8),
+}
+ENTITY_SEED = 502  # Расстановка тел одинакова в игре, headless-прогоне и повторе
+ENEMY_SPEED = 1.5  # Скорость патрулирования врага (пикс/кадр)
+PLATFORM_SPEED = 2  # Скорость движущейся платформы (пикс/кадр)
+PLATFORM_TRAVEL = 128  # Насколько платформа отходит от начальной точки
+PLATFORM_SNAP = 12  # С какой глубины игрок, падающий на платформу, ставится на неё
+PROJECTILE_SPEED = 6  # Скорость снаряда (пикс/кадр)
+KNOCKBACK_SPEED = 8  # Скорость отбрасывания игрока врагом или снарядом
+
+# Фиксированный шаг симуляции. Скорости и ускорения заданы в пикселях
+# за кадр при FPS, поэтому за шаг они масштабируются на SIM_DT * FPS.
+SIM_HZ = 120
+SIM_DT = 1.0 / SIM_HZ
+MAX_SIM_STEPS = 8  # Максимум шагов догонки за один кадр
+STREAM_INTERVAL_STEPS = SIM_HZ // FPS  # Headless: подгрузка чанков раз в кадр
+MAX_FRAME_TIME = 0.25  # Ограничение длительности кадра (сек)
+IDLE_WAIT_MS = 1000  # Сколько меню ждёт событий, если перерисовывать нечего
+RESIZE_DEBOUNCE_MS = 150  # Пауза после последнего VIDEORESIZE перед пересборкой фонов
+BACKGROUND_CACHE_SIZE = 4  # Сколько размеров окна хранить в кэше фонов
+LEVEL_CACHE_SIZE = 4  # Сколько разобранных карт уровней хранить
+BACKGROUND_READY = pygame.USEREVENT + 1  # Событие: фоновый поток собрал фоны
+ASSETS_READY = pygame.USEREVENT + 2  # Событие: фоновый поток загрузил изображение
+BLUR_RADIUS = 12  # Радиус размытия фона паузы (пикселей при высоте BASE_HEIGHT)
+BLUR_PASSES = 3   # Проходов box-blur: три прохода близки к гауссову размытию
+
+# Режимы планировщика кадров
+FRAME_MODE_FPS = "fps"  # Спать до целевой длительности кадра
+FRAME_MODE_VSYNC = "vsync"  # Темп задаёт вертикальная синхронизация дисплея
+FRAME_MODE_UNCAPPED = "uncapped"  # Без ограничения, только уступить циклу событий
+VSYNC_MAX_FPS = 240  # Потолок частоты кадров в режиме vsync, если дисплей синхронизацию не соблюдает
+FRAME_STATS_SIZE = 600  # Сколько последних кадров учитывать в статистике
+MISSED_FRAME_TOLERANCE = 1.2  # Кадр длиннее бюджета в столько раз считается пропущенным
+
+# Профилировщик фаз кадра
+PROFILE_PHASES = ("events", "physics", "hook", "animation", "entities", "level", "player", "hud", "flip")
+PROFILE_COLORS = {
+    "events": (255, 200, 0),
+    "physics": (255, 80, 80),
+    "hook": (255, 140, 0),
+    "animation": (200, 100, 255),
+    "entities": (255, 80, 200),
+    "level": (0, 200, 255),
+    "player": (0, 255, 120),
+    "hud": (180, 180, 180),
+    "flip": (80, 120, 255),
+}
+PROFILE_HISTORY = 240  # Кадров в скользящем окне графика и гистограмм
+PROFILE_BUCKETS = (0.1, 0.25, 0.5, 1, 2, 4, 8, 16, 33)  # Верхние границы корзин гистограммы (мс)
+
+# Пути к ресурсам
+MENU_BACKGROUND_PATH = 'src/Assets/background_play1.png'
+LEVEL_BACKGROUND_PATH = 'src/Assets/level_background.png'
+SPRITESHEET_PATH = 'src/Assets/character_spritesheet.png'
+# Ресурсы уровня загружаются в фоне, пока показывается меню
+LEVEL_ASSETS = (SPRITESHEET_PATH, LEVEL_BACKGROUND_PATH)
+
+# Дисковый кэш готовых к выводу поверхностей
+ASSET_CACHE_DIR = '.asset_cache'
+ASSET_CACHE_VERSION = 1  # Увеличивать при изменении масштабирования, размытия или формата файла
+ASSET_CACHE_MAGIC = b"PKSC"
+ASSET_CACHE_HEADER = struct.Struct("<4sHHII")  # сигнатура, версия, резерв, ширина, высота
+ASSET_CACHE_MAX_FILES = 48  # Сверх этого числа удаляются самые старые файлы
+
+# Уровни: текстовый формат для редактирования и двоичный для поставки
+LEVEL_PATH = 'src/Levels/level1.txt'
+LEVEL_MAGIC = b"PKLV"
+LEVEL_VERSION = 1
+LEVEL_HEADER = struct.Struct("<4sHHII")  # сигнатура, версия, флаги, ширина, высота
+LEVEL_FLAG_ZLIB = 1  # Клетки сжаты zlib
+LEVEL_FLAG_CHUNKED = 2  # Клетки лежат по чанкам (для отображения в память)
+LEVEL_CHUNK_HEADER = struct.Struct("<I")  # сторона чанка, следует за заголовком при LEVEL_FLAG_CHUNKED
+LEVEL_SOLID_CHARS = "#"  # Символы твёрдых тайлов ("█" заменяется на "#" при разборе)
+TILE_EMPTY = 0
+TILE_SOLID = 1
+
+# Дискретные действия ввода (общие для игры и headless-режима)
+ACTION_JUMP = "jump"
+ACTION_DASH = "dash"
+ACTION_RELEASE = "release"
+ACTION_HOOK = "hook"
+# Порядок применения действий внутри шага; индекс - бит во флагах записи ввода
+ACTION_ORDER = (ACTION_RELEASE, ACTION_JUMP, ACTION_DASH, ACTION_HOOK)
+
+# Запись ввода: заголовок, записи (повторы, маска клавиш, флаги действий), точки
+REPLAY_MAGIC = b"PKRP"
+REPLAY_VERSION = 2
+REPLAY_HEADER = struct.Struct("<4sHHI")  # сигнатура, версия, SIM_HZ, длина настроек сессии (JSON) за заголовком
+REPLAY_RECORD = struct.Struct("<HBB")  # повторы (0 - конец записи), маска, флаги
+REPLAY_POINT = struct.Struct("<dd")  # цель крюка или итоговая позиция игрока
+REPLAY_MAX_REPEAT = 0xFFFF
+# Клавиши, состояние которых записывается; индекс - бит в маске
+RECORDED_KEYS = (pygame.K_a, pygame.K_d, pygame.K_w, pygame.K_s, pygame.K_LEFT, pygame.K_RIGHT, pygame.K_UP, pygame.K_DOWN)
 
 # Цвета
 WHITE = (255, 255, 255)
@@ -65,6 +195,218 @@ GRAY = (150, 150, 150)
 BLACK = (0, 0, 0)
 CYAN = (0, 255, 255)
 RED = (255, 0, 0)
+ENTITY_COLORS = {ENTITY_ENEMY: RED, ENTITY_PLATFORM: GRAY, ENTITY_PROJECTILE: CYAN}
+
+# Хеш содержимого файла
+def file_sha1(path):
+    """SHA-1 содержимого файла или None, если его не удалось прочитать."""
+    try:
+        with open(path, "rb") as file:
+            return hashlib.sha1(file.read()).hexdigest()
+    except OSError:
+        return None
+
+# Дисковый кэш поверхностей
+class SurfaceDiskCache:
+    """Версионированный кэш пикселей на диске в формате convert_alpha() окна."""
+    def __init__(self, directory):
+        self.directory = directory
+        self.enabled = platform.system() != "Emscripten"
+        self.pixel_format = None  # "BGRA"/"RGBA"/"ARGB" или None, пока неизвестен
+        self.hashes = {}  # путь -> SHA-1 содержимого
+
+    def detect_pixel_format(self):
+        """Находит порядок байт, совпадающий с convert_alpha(); вызывать после создания окна."""
+        masks = pygame.Surface((1, 1), pygame.SRCALPHA).convert_alpha().get_masks()
+        for name in ("BGRA", "RGBA", "ARGB"):
+            if pygame.image.frombuffer(bytearray(4), (1, 1), name).get_masks() == masks:
+                self.pixel_format = name
+                return
+        print(f"Дисковый кэш ресурсов выключен: неизвестный формат пикселей {masks}")
+        self.enabled = False
+
+    def is_active(self):
+        return self.enabled and self.pixel_format is not None
+
+    def source_key(self, path):
+        """SHA-1 файла path или None, если кэш не используется или файла нет."""
+        if not self.is_active():
+            return None
+        if path not in self.hashes:
+            source_key = file_sha1(path)
+            if source_key is None:
+                return None
+            self.hashes[path] = source_key
+        return self.hashes[path]
+
+    def file_path(self, source_key, variant, size):
+        key = f"{source_key}|{variant}|{size}|{self.pixel_format}|{ASSET_CACHE_VERSION}"
+        return os.path.join(self.directory, hashlib.sha1(key.encode()).hexdigest() + ".surf")
+
+    def load(self, source_key, variant, size=None):
+        """Поверхность из кэша или None; size=None - размер берётся из файла."""
+        path = self.file_path(source_key, variant, size)
+        try:
+            with open(path, "rb") as file:
+                # ACCESS_COPY: запись в поверхность не попадёт в файл
+                mapped = mmap.mmap(file.fileno(), 0, access=mmap.ACCESS_COPY)
+            os.utime(path)
+        except (OSError, ValueError):
+            return None
+        if len(mapped) < ASSET_CACHE_HEADER.size:
+            return None
+        magic, version, _, width, height = ASSET_CACHE_HEADER.unpack_from(mapped, 0)
+        if (magic != ASSET_CACHE_MAGIC or version != ASSET_CACHE_VERSION
+                or (size is not None and (width, height) != tuple(size))
+                or len(mapped) != ASSET_CACHE_HEADER.size + width * height * 4):
+            return None
+        # Поверхность держит ссылку на отображение, пока существует сама
+        return pygame.image.frombuffer(memoryview(mapped)[ASSET_CACHE_HEADER.size:], (width, height), self.pixel_format)
+
+    def store(self, source_key, variant, surface, size=None):
+        path = self.file_path(source_key, variant, size)
+        temp_path = f"{path}.{threading.get_ident()}.tmp"
+        try:
+            os.makedirs(self.directory, exist_ok=True)
+            with open(temp_path, "wb") as file:
+                file.write(ASSET_CACHE_HEADER.pack(ASSET_CACHE_MAGIC, ASSET_CACHE_VERSION, 0, *surface.get_size()))
+                file.write(pygame.image.tobytes(surface, self.pixel_format))
+            os.replace(temp_path, path)
+            self.prune()
+        except (OSError, pygame.error) as e:
+            print(f"Ошибка записи кэша ресурсов: {e}")
+
+    def prune(self):
+        """Удаляет самые давно использованные файлы сверх ASSET_CACHE_MAX_FILES."""
+        files = [os.path.join(self.directory, name) for name in os.listdir(self.directory) if name.endswith(".surf")]
+        if len(files) <= ASSET_CACHE_MAX_FILES:
+            return
+        files.sort(key=os.path.getmtime)
+        for path in files[:len(files) - ASSET_CACHE_MAX_FILES]:
+            try:
+                os.remove(path)
+            except OSError:
+                pass
+
+    def get_or_build(self, source_key, variant, size, build):
+        """Вариант из кэша, а при промахе - результат build(), который сохраняется."""
+        if source_key is None or not self.is_active():
+            return build()
+        surface = self.load(source_key, variant, size)
+        if surface is None:
+            surface = build()
+            if surface is not None:
+                self.store(source_key, variant, surface, size)
+        return surface
+
+disk_cache = SurfaceDiskCache(ASSET_CACHE_DIR)
+
+# Загрузка изображений
+class AssetManager:
+    """Загружает изображения по пути и кэширует их."""
+    def __init__(self):
+        self.surfaces = {}  # путь -> готовый Surface или None
+        self.unconverted = set()  # пути, загруженные до создания окна
+        self.decoded = {}  # путь -> (Surface, из дискового кэша) из рабочего потока
+        self.requested = []  # пути из preload() для подсчёта прогресса
+        self.done = {}  # путь -> threading.Event окончания декодирования
+        self.lock = threading.Lock()
+        self.jobs = queue.Queue()
+        self.thread = None
+        self.use_thread = platform.system() != "Emscripten"
+
+    def decode(self, path):
+        """Возвращает (Surface или None, взят ли он из дискового кэша)."""
+        try:
+            source_key = disk_cache.source_key(path)
+            if source_key is not None:
+                surface = disk_cache.load(source_key, "image")
+                if surface is not None:
+                    return surface, True
+            return pygame.image.load(path), False
+        except Exception as e:
+            print(f"Ошибка загрузки {path}: {e}")
+            return None, False
+
+    def finish(self, path, decoded):
+        surface, from_disk_cache = decoded
+        if surface is not None and not from_disk_cache:
+            if pygame.display.get_surface() is not None:
+                surface = surface.convert_alpha()
+                self.unconverted.discard(path)
+                source_key = disk_cache.source_key(path)
+                if source_key is not None:
+                    disk_cache.store(source_key, "image", surface)
+            else:
+                self.unconverted.add(path)
+        self.surfaces[path] = surface
+        return surface
+
+    def load(self, path):
+        """Возвращает изображение path, загружая его сразу, если оно ещё не готово."""
+        if path in self.surfaces:
+            if path in self.unconverted and pygame.display.get_surface() is not None:
+                return self.finish(path, (self.surfaces[path], False))
+            return self.surfaces[path]
+        done = self.done.get(path)
+        if done is not None and self.use_thread:
+            done.wait()  # Файл уже декодируется в рабочем потоке
+        with self.lock:
+            if path in self.decoded:
+                return self.finish(path, self.decoded.pop(path))
+        return self.finish(path, self.decode(path))
+
+    def get(self, path):
+        """Готовое изображение path или None, если оно ещё не загружено."""
+        return self.surfaces.get(path)
+
+    def preload(self, paths):
+        """Ставит изображения в очередь фоновой загрузки."""
+        for path in paths:
+            if path in self.surfaces or path in self.done:
+                continue
+            self.done[path] = threading.Event()
+            self.requested.append(path)
+            self.jobs.put(path)
+        if self.use_thread and self.thread is None and not self.jobs.empty():
+            self.thread = threading.Thread(target=self.worker, daemon=True)
+            self.thread.start()
+
+    def poll(self):
+        """Доводит загруженные в фоне изображения до готовности; возвращает их пути."""
+        if not self.use_thread and not self.jobs.empty():
+            # Без потоков загружаем по одному файлу за вызов
+            path = self.jobs.get()
+            if path not in self.surfaces:
+                self.decoded[path] = self.decode(path)
+            self.done[path].set()
+        with self.lock:
+            decoded, self.decoded = self.decoded, {}
+        ready = []
+        for path, result in decoded.items():
+            if path not in self.surfaces:
+                self.finish(path, result)
+                ready.append(path)
+        return ready
+
+    def progress(self):
+        """(готово, всего) среди изображений, поставленных в preload()."""
+        ready = sum(1 for path in self.requested if path in self.surfaces)
+        return ready, len(self.requested)
+
+    def worker(self):
+        while True:
+            path = self.jobs.get()
+            result = self.decode(path)
+            with self.lock:
+                self.decoded[path] = result
+            self.done[path].set()
+            try:
+                pygame.event.post(pygame.event.Event(ASSETS_READY))
+            except pygame.error:
+                pass
+
+assets = AssetManager()
 
 # Функция для масштабирования фонового изображения
 def scale_background(image, target_width, target_height):
@@ -76,39 +418,447 @@ def scale_background(image, target_width, target_height):
     except:
         return None
 
+# Движок размытия
+class BlurEngine:
+    """Размывает поверхность: уменьшение, разделимый box-blur на NumPy, увеличение."""
+    def __init__(self, passes=BLUR_PASSES):
+        self.passes = passes
+        self.surfaces = {}  # размер -> уменьшенная поверхность
+        self.planes = {}  # размер -> (плоскость канала, префиксные суммы по x и по y)
+        self.inverse_counts = {}  # (длина, радиус) -> 1 / размер окна для каждой позиции
+        self.lock = threading.Lock()
+
+    def blur(self, surface, radius, use_numpy=True):
+        """Возвращает размытую копию surface с радиусом radius пикселей."""
+        if surface is None:
+            return None
+        # smoothscale работает только с 24- и 32-битными поверхностями
+        if surface.get_bitsize() not in (24, 32):
+            surface = surface.convert_alpha()
+        use_numpy = use_numpy and np is not None
+        width, height = surface.get_size()
+        # С NumPy радиус на уменьшенном изображении оставляем не меньше 2 пикселей,
+        # без него уменьшаем до самого радиуса
+        min_radius = 2 if use_numpy else 1
+        factor = 1
+        while radius / (factor * 2) >= min_radius and width // (factor * 2) >= 8 and height // (factor * 2) >= 8:
+            factor *= 2
+        small_size = (width // factor, height // factor)
+        with self.lock:
+            small = self.surfaces.get(small_size)
+            if small is None or small.get_bitsize() != surface.get_bitsize():
+                small = pygame.Surface(small_size, surface.get_flags() & pygame.SRCALPHA, surface.get_bitsize())
+                self.surfaces[small_size] = small
+            pygame.transform.smoothscale(surface, small_size, small)
+            if use_numpy:
+                self.box_blur(small, max(1, round(radius / factor)))
+                return pygame.transform.smoothscale(small, (width, height))
+            # Поэтапное увеличение сглаживает ступеньки билинейной интерполяции
+            result = small
+            while factor > 1:
+                factor //= 2
+                result = pygame.transform.smoothscale(result, (width // factor, height // factor))
+            if result is small:
+                result = small.copy()
+            return result
+
+    def box_blur(self, surface, radius):
+        """Разделимый box-blur поверхности на месте."""
+        width, height = surface.get_size()
+        buffers = self.planes.get((width, height))
+        if buffers is None:
+            buffers = (
+                np.empty((width, height), dtype=np.float32),
+                np.empty((width + 1, height), dtype=np.float32),
+                np.empty((height + 1, width), dtype=np.float32),
+            )
+            self.planes[(width, height)] = buffers
+        plane, prefix_x, prefix_y = buffers
+        pixels = pygame.surfarray.pixels3d(surface)
+        for channel in range(3):
+            plane[...] = pixels[:, :, channel]
+            for _ in range(self.passes):
+                self.box_pass(plane, prefix_x, radius)
+                self.box_pass(plane.T, prefix_y, radius)
+            plane += 0.5
+            np.copyto(pixels[:, :, channel], plane, casting='unsafe')
+        del pixels
+
+    def box_pass(self, plane, prefix, radius):
+        """Один проход box-blur вдоль оси 0 через префиксные суммы."""
+        n = plane.shape[0]
+        radius = min(radius, (n - 1) // 2)
+        if radius <= 0:
+            return
+        prefix[0] = 0
+        np.cumsum(plane, axis=0, out=prefix[1:])
+        np.subtract(prefix[radius + 1:2 * radius + 2], prefix[0], out=plane[0:radius + 1])
+        np.subtract(prefix[2 * radius + 2:n + 1], prefix[1:n - 2 * radius], out=plane[radius + 1:n - radius])
+        np.subtract(prefix[n], prefix[n - 2 * radius:n - radius], out=plane[n - radius:n])
+        plane *= self.get_inverse_counts(n, radius)
+
+    def get_inverse_counts(self, n, radius):
+        key = (n, radius)
+        inverse_counts = self.inverse_counts.get(key)
+        if inverse_counts is None:
+            index = np.arange(n)
+            counts = np.minimum(index + radius + 1, n) - np.maximum(index - radius, 0)
+            inverse_counts = (1.0 / counts).astype(np.float32)[:, None]
+            self.inverse_counts[key] = inverse_counts
+        return inverse_counts
+
+blur_engine = BlurEngine()
+
 # Функция для размытия изображения
-def blur_surface(surface, blur_radius=5):
-    if surface is None:
+def blur_surface(surface, blur_radius=BLUR_RADIUS):
+    return blur_engine.blur(surface, blur_radius)
+
+# Подготовка фонов под размер окна
+class BackgroundPipeline:
+    """Масштабирует и размывает фоны в рабочем потоке, с кэшем по размеру области."""
+    def __init__(self, menu_original, level_original, menu_key=None, level_key=None):
+        self.menu_original = menu_original
+        self.level_original = level_original
+        self.menu_key = menu_key  # Ключи исходников в disk_cache (None - без кэша)
+        self.level_key = level_key
+        self.cache = OrderedDict()  # (ширина, высота) -> (меню, уровень, размытый уровень)
+        self.target_size = None
+        self.pending_size = None
+        self.request_time = 0
+        self.in_progress = set()  # (размер, поколение) сборок в рабочем потоке
+        self.generation = 0  # Растёт при смене исходников; результаты старых поколений отбрасываются
+        self.jobs = queue.Queue()
+        self.results = queue.Queue()
+        self.thread = None
+        self.use_thread = platform.system() != "Emscripten"
+
+    def build(self, size):
+        width, height = size
+        menu = disk_cache.get_or_build(self.menu_key, "scaled", size, lambda: scale_background(self.menu_original, width, height))
+        level = disk_cache.get_or_build(self.level_key, "scaled", size, lambda: scale_background(self.level_original, width, height))
+        # Радиус задан для BASE_HEIGHT, чтобы размытие выглядело одинаково при любом окне
+        radius = BLUR_RADIUS * height / BASE_HEIGHT
+        variant = f"blur:{radius:.3f}:{BLUR_PASSES}:{'numpy' if np is not None else 'pyramid'}"
+        return menu, level, disk_cache.get_or_build(self.level_key, variant, size, lambda: blur_surface(level, blur_radius=radius))
+
+    def store(self, size, variants):
+        self.cache[size] = variants
+        self.cache.move_to_end(size)
+        while len(self.cache) > BACKGROUND_CACHE_SIZE:
+            self.cache.popitem(last=False)
+
+    def get_now(self, size):
+        """Синхронно возвращает фоны для size (используется при запуске)."""
+        self.target_size = size
+        if size not in self.cache:
+            self.store(size, self.build(size))
+        return self.cache[size]
+
+    def request(self, size):
+        """Запрашивает фоны под size; возвращает их сразу, если они уже в кэше."""
+        self.target_size = size
+        if size in self.cache:
+            self.pending_size = None
+            self.cache.move_to_end(size)
+            return self.cache[size]
+        self.pending_size = size
+        self.request_time = pygame.time.get_ticks()
         return None
-    # Конвертируем поверхность в 32-битный формат
-    surface = surface.convert_alpha()
-    width, height = surface.get_size()
-    for _ in range(blur_radius):
-        surface = pygame.transform.smoothscale(surface, (width // 2, height // 2))
-        surface = pygame.transform.smoothscale(surface, (width, height))
-    return surface
-
-# Загрузка фонового изображения для меню
-try:
-    menu_background = pygame.image.load('src/Assets/background_play1.png')
-except Exception as e:
-    print(f"Ошибка загрузки фона меню: {e}")
-    menu_background = None
 
-# Загрузка фонового изображения для уровней
-try:
-    level_background = pygame.image.load('src/Assets/level_background.png')
-except Exception as e:
-    print(f"Ошибка загрузки фона уровня: {e}")
-    level_background = None
+    def set_level_original(self, level_original, level_key=None):
+        """Подставляет загруженный фон уровня и пересобирает фоны без ожидания."""
+        self.level_original = level_original
+        self.level_key = level_key
+        self.generation += 1
+        self.cache.clear()
+        if self.target_size is not None:
+            self.pending_size = self.target_size
+            self.request_time = pygame.time.get_ticks() - RESIZE_DEBOUNCE_MS
+
+    def time_until_due(self):
+        """Сколько мс осталось до запуска отложенной сборки (None, если её нет)."""
+        if self.pending_size is None:
+            return None
+        return max(0, RESIZE_DEBOUNCE_MS - (pygame.time.get_ticks() - self.request_time))
+
+    def poll(self):
+        """Запускает созревшую сборку и возвращает готовые фоны для текущего размера."""
+        ready = None
+        while not self.results.empty():
+            size, generation, variants = self.results.get()
+            self.in_progress.discard((size, generation))
+            if generation != self.generation:
+                continue  # Собрано из старого фона уровня
+            self.store(size, variants)
+            if size == self.target_size:
+                ready = variants
+        if self.pending_size is not None and self.time_until_due() == 0:
+            size = self.pending_size
+            self.pending_size = None
+            if size in self.cache:
+                ready = self.cache[size]
+            elif not self.use_thread:
+                self.store(size, self.build(size))
+                ready = self.cache[size]
+            elif (size, self.generation) not in self.in_progress:
+                self.in_progress.add((size, self.generation))
+                self.jobs.put((size, self.generation))
+                if self.thread is None:
+                    self.thread = threading.Thread(target=self.worker, daemon=True)
+                    self.thread.start()
+        return ready
+
+    def worker(self):
+        while True:
+            size, generation = self.jobs.get()
+            try:
+                variants = self.build(size)
+            except Exception as e:
+                print(f"Ошибка обновления фона: {e}")
+                variants = (None, None, None)
+            self.results.put((size, generation, variants))
+            try:
+                pygame.event.post(pygame.event.Event(BACKGROUND_READY))
+            except pygame.error:
+                pass
 
-# Загрузка фоновой музыки
-try:
-    pygame.mixer.music.load('src/Resources/background_music.mp3')
-    pygame.mixer.music.set_volume(0.5)
-    pygame.mixer.music.play(-1)
-except Exception as e:
-    print(f"Ошибка загрузки музыки: {e}")
+background_pipeline = None
+
+# Планировщик кадров
+class FrameScheduler:
+    """Выдерживает темп кадров одним ожиданием и собирает статистику."""
+    def __init__(self, mode=FRAME_MODE_FPS, target_fps=FPS):
+        self.mode = mode
+        self.target_fps = target_fps
+        self.frame_times = deque(maxlen=FRAME_STATS_SIZE)
+        self.frames = 0
+        self.missed = 0
+        self.frame_start = time.perf_counter()
+        self.deadline = self.frame_start
+
+    def budget(self):
+        """Бюджет кадра (сек), по которому считаются пропущенные кадры."""
+        return 1.0 / self.target_fps
+
+    async def wait(self, record=True):
+        """Завершает кадр: ждёт остаток бюджета и учитывает длительность кадра."""
+        now = time.perf_counter()
+        delay = 0.0
+        if self.mode != FRAME_MODE_UNCAPPED:
+            # При vsync кадр обычно и так ждёт flip, дедлайн лишь не даёт крутиться вхолостую
+            budget = self.budget() if self.mode == FRAME_MODE_FPS else 1.0 / VSYNC_MAX_FPS
+            self.deadline += budget
+            if now - self.deadline > budget:
+                self.deadline = now
+            delay = max(0.0, self.deadline - now)
+        await asyncio.sleep(delay)
+        end = time.perf_counter()
+        if record:
+            frame_time = end - self.frame_start
+            self.frame_times.append(frame_time)
+            self.frames += 1
+            if frame_time > self.budget() * MISSED_FRAME_TOLERANCE:
+                self.missed += 1
+        self.frame_start = end
+
+    def stats(self):
+        """Средняя, p95 и p99 длительность кадра (мс) по последним кадрам и число пропусков."""
+        if not self.frame_times:
+            return None
+        times = sorted(self.frame_times)
+        def percentile(fraction):
+            return times[min(len(times) - 1, int(len(times) * fraction))] * 1000
+        return {
+            "frames": self.frames,
+            "mean_ms": sum(times) / len(times) * 1000,
+            "p95_ms": percentile(0.95),
+            "p99_ms": percentile(0.99),
+            "missed": self.missed,
+        }
+
+    def report(self):
+        stats = self.stats()
+        if stats:
+            print(f"Кадры ({self.mode}): {stats['frames']}, среднее {stats['mean_ms']:.2f} мс, "
+                  f"p95 {stats['p95_ms']:.2f} мс, p99 {stats['p99_ms']:.2f} мс, пропущено {stats['missed']}")
+
+frame_scheduler = FrameScheduler()
+
+# Задержка ввода
+class InputLatency:
+    """Считает задержку от опроса действия до показа кадра с его результатом."""
+    def __init__(self):
+        self.waiting = []  # Снимки ввода, действия которых уже выполнены, но ещё не показаны
+        self.frames = deque(maxlen=FRAME_STATS_SIZE)
+        self.times = deque(maxlen=FRAME_STATS_SIZE)
+
+    def reset(self):
+        self.waiting = []
+        self.frames.clear()
+        self.times.clear()
+
+    def consumed(self, snapshot):
+        """Действия снимка snapshot выполнены шагом симуляции."""
+        self.waiting.append(snapshot)
+
+    def presented(self, frame):
+        """Кадр frame показан на экране."""
+        if not self.waiting:
+            return
+        now = time.perf_counter()
+        for snapshot in self.waiting:
+            self.frames.append(frame - snapshot.frame + 1)
+            self.times.append(now - snapshot.time)
+        self.waiting = []
+
+    def report(self):
+        if not self.frames:
+            return
+        frames = sorted(self.frames)
+        print(f"Задержка ввода: среднее {sum(frames) / len(frames):.2f} кадра "
+              f"({sum(self.times) / len(self.times) * 1000:.1f} мс), p95 {frames[int(len(frames) * 0.95)]} кадра, "
+              f"максимум {frames[-1]}, действий {len(frames)}")
+
+input_latency = InputLatency()
+
+# Профилировщик фаз кадра
+class FrameProfiler:
+    """Замеряет время фаз кадра, ведёт скользящие гистограммы и пишет записи в файл."""
+    def __init__(self):
+        self.enabled = False
+        self.overlay = False
+        self.mark_time = 0.0
+        self.current = dict.fromkeys(PROFILE_PHASES, 0.0)
+        self.history = deque(maxlen=PROFILE_HISTORY)  # Кадры: кортежи мс по фазам
+        self.sums = dict.fromkeys(PROFILE_PHASES, 0.0)
+        self.histograms = {phase: [0] * (len(PROFILE_BUCKETS) + 1) for phase in PROFILE_PHASES}
+        self.frame_index = 0
+        self.output = None
+        self.writer = None
+
+    def start(self):
+        """Начинает отсчёт без записи в какую-либо фазу."""
+        if not self.enabled:
+            return
+        self.mark_time = time.perf_counter()
+
+    def mark(self, phase):
+        """Засчитывает время с предыдущей отметки в фазу phase."""
+        if not self.enabled:
+            return
+        now = time.perf_counter()
+        self.current[phase] += now - self.mark_time
+        self.mark_time = now
+
+    def end_frame(self):
+        """Завершает кадр: обновляет историю, гистограммы и пишет запись в файл."""
+        if not self.enabled:
+            return
+        record = tuple(self.current[phase] * 1000 for phase in PROFILE_PHASES)
+        if len(self.history) == self.history.maxlen:
+            self.account(self.history[0], -1)
+        self.history.append(record)
+        self.account(record, 1)
+        if self.writer is not None:
+            self.write_record(record)
+        for phase in PROFILE_PHASES:
+            self.current[phase] = 0.0
+        self.frame_index += 1
+
+    def account(self, record, sign):
+        for phase, ms in zip(PROFILE_PHASES, record):
+            self.sums[phase] += sign * ms
+            self.histograms[phase][self.bucket(ms)] += sign
+
+    def bucket(self, ms):
+        for index, bound in enumerate(PROFILE_BUCKETS):
+            if ms <= bound:
+                return index
+        return len(PROFILE_BUCKETS)
+
+    def percentile_bound(self, phase, fraction):
+        """Верхняя граница корзины, в которую попадает заданная доля кадров."""
+        needed = len(self.history) * fraction
+        total = 0
+        for index, count in enumerate(self.histograms[phase]):
+            total += count
+            if total >= needed:
+                return PROFILE_BUCKETS[index] if index < len(PROFILE_BUCKETS) else float('inf')
+        return float('inf')
+
+    def toggle_overlay(self):
+        self.overlay = not self.overlay
+        if self.overlay and not self.enabled:
+            self.enabled = True
+            self.mark_time = time.perf_counter()
+
+    def open_output(self, path):
+        """Включает профилировщик и потоково пишет кадры в CSV или JSONL (по расширению)."""
+        self.enabled = True
+        self.output = open(path, "w", newline="")
+        if path.endswith(".jsonl"):
+            self.writer = "jsonl"
+        else:
+            self.writer = csv.writer(self.output)
+            self.writer.writerow(("frame",) + PROFILE_PHASES + ("total",))
+
+    def write_record(self, record):
+        if self.writer == "jsonl":
+            entry = {"frame": self.frame_index}
+            entry.update(zip(PROFILE_PHASES, (round(ms, 4) for ms in record)))
+            entry["total"] = round(sum(record), 4)
+            self.output.write(json.dumps(entry) + "\n")
+        else:
+            self.writer.writerow((self.frame_index,) + tuple(f"{ms:.4f}" for ms in record) + (f"{sum(record):.4f}",))
+
+    def close(self):
+        if self.output is not None:
+            self.output.close()
+            self.output = None
+            self.writer = None
+
+    def draw_overlay(self, surface, font, viewport):
+        """Рисует график фаз за последние кадры и средние значения с p95."""
+        if not self.overlay or not self.history:
+            return
+        graph_height = viewport.height // 4
+        bar_width = max(1, viewport.width // (2 * PROFILE_HISTORY))
+        left = viewport.left + 10
+        bottom = viewport.bottom - 10
+        ms_to_px = graph_height / 33.3  # Высота графика соответствует двум кадрам при 60 FPS
+        panel = pygame.Rect(left, bottom - graph_height, bar_width * PROFILE_HISTORY, graph_height)
+        surface.fill((0, 0, 0), panel)
+        for index, record in enumerate(self.history):
+            y = bottom
+            for phase, ms in zip(PROFILE_PHASES, record):
+                height = int(ms * ms_to_px)
+                if height > 0:
+                    surface.fill(PROFILE_COLORS[phase], (left + index * bar_width, y - height, bar_width, height))
+                    y -= height
+        budget_y = bottom - int(1000 / FPS * ms_to_px)
+        pygame.draw.line(surface, WHITE, (panel.left, budget_y), (panel.right, budget_y))
+        line_height = font.get_linesize()
+        text_y = panel.top
+        surface.fill((0, 0, 0), (panel.left, text_y - line_height * len(PROFILE_PHASES), panel.width, line_height * len(PROFILE_PHASES)))
+        for phase in reversed(PROFILE_PHASES):
+            text_y -= line_height
+            average = self.sums[phase] / len(self.history)
+            text = f"{phase}: {average:.2f} ms, p95 <= {self.percentile_bound(phase, 0.95)} ms"
+            # Числа меняются каждый кадр: в text_cache они только вытесняли бы постоянные надписи
+            surface.blit(font.render(text, True, PROFILE_COLORS[phase]), (left, text_y))
+
+profiler = FrameProfiler()
+
+def create_window(size):
+    """Создаёт окно; в режиме vsync пробует включить вертикальную синхронизацию."""
+    if frame_scheduler.mode == FRAME_MODE_VSYNC:
+        try:
+            # pygame включает vsync только для окон SCALED или OPENGL
+            return pygame.display.set_mode(size, pygame.RESIZABLE | pygame.SCALED, vsync=1)
+        except pygame.error as e:
+            print(f"VSync недоступен, ограничиваем FPS: {e}")
+            frame_scheduler.mode = FRAME_MODE_FPS
+    return pygame.display.set_mode(size, pygame.RESIZABLE)
 
 # Функция для получения масштабированного шрифта
 def get_scaled_font(scale):
@@ -118,6 +868,35 @@ def get_scaled_font(scale):
     except:
         return pygame.font.SysFont('monospace', font_size)
 
+# LRU-кэш отрендеренного текста
+class TextCache:
+    """Хранит поверхности текста по ключу (шрифт, текст, цвет, сглаживание)."""
+    def __init__(self, max_size=256):
+        self.max_size = max_size
+        self.surfaces = OrderedDict()
+
+    def render(self, font, text, color, antialias=True):
+        key = (font, text, tuple(color), antialias)
+        surface = self.surfaces.get(key)
+        if surface is not None:
+            self.surfaces.move_to_end(key)
+            return surface
+        surface = font.render(text, antialias, color)
+        self.surfaces[key] = surface
+        if len(self.surfaces) > self.max_size:
+            self.surfaces.popitem(last=False)
+        return surface
+
+    def invalidate(self, font=None):
+        """Удаляет записи шрифта font (или все записи, если font не указан)."""
+        if font is None:
+            self.surfaces.clear()
+            return
+        for key in [key for key in self.surfaces if key[0] is font]:
+            del self.surfaces[key]
+
+text_cache = TextCache()
+
 # Функция для расчета области отображения
 def calculate_viewport():
     global WIDTH, HEIGHT
@@ -134,14 +913,14 @@ def calculate_viewport():
         offset = Vector2(0, (HEIGHT - viewport_height) / 2)
     return scale_factor, offset, pygame.Rect(offset.x, offset.y, viewport_width, viewport_height)
 
-# Инициализация масштаба и области отображения
+# Окно, фоны и шрифт создаются в setup(); до этого модуль можно
+# импортировать без дисплея (например, для headless-симуляции)
+screen = None
+menu_background = None
+level_background = None
+level_background_blurred = None
+font = None
 scale_factor, offset, viewport = calculate_viewport()
-font = get_scaled_font(scale_factor)
-if menu_background:
-    menu_background = scale_background(menu_background, viewport.width, viewport.height)
-if level_background:
-    level_background = scale_background(level_background, viewport.width, viewport.height)
-    level_background_blurred = blur_surface(level_background, blur_radius=5)
 
 # Класс для кнопок меню
 class Button:
@@ -163,7 +942,7 @@ class Button:
         )
 
     def draw(self, surface):
-        text_surface = font.render(self.text, True, self.current_color)
+        text_surface = text_cache.render(font, self.text, self.current_color)
         text_rect = text_surface.get_rect(center=self.rect.center)
         if viewport.colliderect(text_rect):
             surface.blit(text_surface, text_rect)
@@ -171,11 +950,19 @@ class Button:
     def is_hovered(self, mouse_pos):
         return self.rect.collidepoint(mouse_pos)
 
+    def get_dirty_rect(self):
+        """Область экрана, которую занимает кнопка вместе с подписью."""
+        text_rect = text_cache.render(font, self.text, self.current_color).get_rect(center=self.rect.center)
+        return self.rect.union(text_rect)
+
     def update(self, mouse_pos):
+        """Обновляет подсветку; возвращает True, если вид кнопки изменился."""
+        old_color = self.current_color
         if self.is_hovered(mouse_pos):
             self.current_color = self.hover_color
         else:
             self.current_color = self.color
+        return self.current_color != old_color
 
 # Класс для ползунка громкости
 class Slider:
@@ -204,18 +991,27 @@ class Slider:
         )
 
     def draw(self, surface):
-        label_surface = font.render(self.label, True, WHITE)
+        label_surface = text_cache.render(font, self.label, WHITE)
         label_rect = label_surface.get_rect(topleft=(self.rect.x - int(350 * scale_factor), self.rect.y - int(10 * scale_factor)))
         if viewport.colliderect(label_rect):
             surface.blit(label_surface, label_rect)
         pygame.draw.rect(surface, WHITE, self.rect, int(2 * scale_factor))
         pygame.draw.rect(surface, GRAY, self.handle_rect)
-        text_surface = font.render(f"{int(self.value)}%", True, WHITE)
+        text_surface = text_cache.render(font, f"{int(self.value)}%", WHITE)
         text_rect = text_surface.get_rect(topleft=(self.rect.x + self.rect.width + int(20 * scale_factor), self.rect.y - int(10 * scale_factor)))
         if viewport.colliderect(text_rect):
             surface.blit(text_surface, text_rect)
 
+    def get_dirty_rect(self):
+        """Область экрана, которую занимают подпись, полоса, ручка и процент."""
+        label_rect = text_cache.render(font, self.label, WHITE).get_rect(topleft=(self.rect.x - int(350 * scale_factor), self.rect.y - int(10 * scale_factor)))
+        text_rect = text_cache.render(font, f"{int(self.value)}%", WHITE).get_rect(topleft=(self.rect.x + self.rect.width + int(20 * scale_factor), self.rect.y - int(10 * scale_factor)))
+        return self.rect.unionall([label_rect, text_rect, self.handle_rect])
+
     def update(self, mouse_pos, mouse_pressed):
+        """Двигает ручку за мышью; возвращает True, если значение изменилось."""
+        old_value = self.value
+        old_handle_x = self.handle_rect.x
         if mouse_pressed and self.rect.collidepoint(mouse_pos):
             handle_width = int(20 * scale_factor)
             self.handle_rect.x = max(self.rect.x, min(mouse_pos[0] - handle_width / 2, self.rect.x + self.rect.width - handle_width))
@@ -230,6 +1026,67 @@ class Slider:
                 pygame.mixer.music.set_volume(self.value / 100)
             except:
                 pass
+        return self.value != old_value or self.handle_rect.x != old_handle_x
+
+# Учёт изменённых областей экрана для меню
+class DirtyRegions:
+    """Копит изменённые области и выводит на экран только их."""
+    def __init__(self):
+        self.rects = []
+        self.full = True
+
+    def mark(self, rect):
+        if not self.full:
+            self.rects.append(pygame.Rect(rect))
+
+    def mark_all(self):
+        self.full = True
+        self.rects = []
+
+    def is_dirty(self):
+        return self.full or bool(self.rects)
+
+    def render(self, surface, draw):
+        """Перерисовывает изменённые области функцией draw() и обновляет дисплей."""
+        if self.full:
+            draw()
+            pygame.display.flip()
+        elif self.rects:
+            old_clip = surface.get_clip()
+            for rect in self.rects:
+                surface.set_clip(rect)
+                draw()
+            surface.set_clip(old_clip)
+            pygame.display.update(self.rects)
+        self.full = False
+        self.rects = []
+
+dirty_regions = DirtyRegions()
+
+def wait_for_events():
+    """Забирает события; если их нет и экран не изменился, ждёт их, не нагружая CPU."""
+    events = pygame.event.get()
+    if events or dirty_regions.is_dirty() or platform.system() == "Emscripten":
+        return events
+    timeout = IDLE_WAIT_MS
+    if background_pipeline is not None and background_pipeline.pending_size is not None:
+        timeout = min(timeout, background_pipeline.time_until_due() + 1)
+    event = pygame.event.wait(timeout)
+    if event.type == pygame.NOEVENT:
+        return []
+    return [event] + pygame.event.get()
+
+def update_menu_elements(elements, mouse_pos, mouse_pressed):
+    """Обновляет кнопки и ползунки меню и помечает изменившиеся области."""
+    for element in elements:
+        old_rect = element.get_dirty_rect()
+        if isinstance(element, Slider):
+            changed = element.update(mouse_pos, mouse_pressed)
+        else:
+            changed = element.update(mouse_pos)
+        if changed:
+            dirty_regions.mark(old_rect)
+            dirty_regions.mark(element.get_dirty_rect())
 
 def get_animation_frames(spritesheet, row):
     frames = []
@@ -245,78 +1102,235 @@ def get_animation_frames(spritesheet, row):
         frames.append(fallback_frame)
     return frames
 
+# Общие для всех игроков кадры анимаций
+class AnimationSet:
+    """Кадры анимаций из спрайт-листа и их масштабированные копии."""
+    def __init__(self, spritesheet):
+        if spritesheet is not None:
+            self.animations = {state: get_animation_frames(spritesheet, ROWS[state]) for state in [STAND, WALK, IDLE, DEAD]}
+            self.image_loaded = True
+        else:
+            self.image_loaded = False
+            self.animations = {state: [pygame.Surface((24, 32), pygame.SRCALPHA)] for state in [STAND, WALK, IDLE, DEAD]}
+            for state in self.animations:
+                self.animations[state][0].fill(RED)
+        self.frame_cache = {}  # (состояние, кадр, facing_right) -> масштабированный Surface
+        self.frame_cache_scale = None
+
+    def rebuild_frame_cache(self, scale_factor):
+        """Заранее масштабирует все кадры анимаций в обе стороны для scale_factor."""
+        size = (int(24 * scale_factor), int(32 * scale_factor))
+        convert = pygame.display.get_surface() is not None
+        self.frame_cache = {}
+        for state, frames in self.animations.items():
+            for index, frame in enumerate(frames):
+                scaled_frame = pygame.transform.scale(frame, size)
+                if convert:
+                    scaled_frame = scaled_frame.convert_alpha()
+                self.frame_cache[(state, index, True)] = scaled_frame
+                self.frame_cache[(state, index, False)] = pygame.transform.flip(scaled_frame, True, False)
+        self.frame_cache_scale = scale_factor
+
+    def get_frame(self, state, index, facing_right, scale_factor):
+        if self.frame_cache_scale != scale_factor:
+            self.rebuild_frame_cache(scale_factor)
+        return self.frame_cache[(state, index, facing_right)]
+
+animation_sets = {}  # путь к спрайт-листу -> AnimationSet
+
+def get_animation_set(path=SPRITESHEET_PATH):
+    """AnimationSet для спрайт-листа path; загружается один раз."""
+    animation_set = animation_sets.get(path)
+    if animation_set is None:
+        spritesheet = assets.load(path)
+        if spritesheet is None:
+            print(f"Ошибка загрузки спрайт-листа: {path}")
+        animation_set = AnimationSet(spritesheet)
+        animation_sets[path] = animation_set
+    return animation_set
+
+# Гибкая верёвка крюка
+class VerletRope:
+    """Верёвка из частиц, интегрируемых методом Верле (режим ROPE_VERLET)."""
+    def __init__(self, anchor, end, displacement, length, segments=ROPE_SEGMENTS):
+        count = segments + 1
+        t = np.linspace(0.0, 1.0, count)[:, None]
+        self.anchor = np.array(anchor, dtype=float)
+        self.points = self.anchor * (1 - t) + np.array(end, dtype=float) * t
+        # Скорость частиц растёт от нуля у крюка до скорости игрока
+        self.previous = self.points - np.array(displacement, dtype=float) * t
+        self.segments = segments
+        self.length = length
+        self.step = 1.0  # Длина последнего шага в кадрах (для скорости при отпускании)
+        inverse_mass = np.ones(count)
+        inverse_mass[0] = 0.0
+        inverse_mass[-1] = 1.0 / ROPE_PLAYER_MASS
+        # Срезы-представления points: концы чётных и нечётных отрезков и их доли поправки
+        self.batches = []
+        for first in (0, 1):
+            starts = slice(first, segments, 2)
+            ends = slice(first + 1, segments + 1, 2)
+            total = inverse_mass[starts] + inverse_mass[ends]
+            self.batches.append((self.points[starts], self.points[ends],
+                                 (inverse_mass[starts] / total)[:, None], (inverse_mass[ends] / total)[:, None]))
+        # Частица i не дальше i отрезков от крюка (ограничение от растяжения)
+        self.reach_index = np.arange(count, dtype=float)
+
+    def update(self, level, step, force):
+        """Шаг длительностью step кадров с ускорением force (x, y) на конце верёвки."""
+        self.step = step
+        velocity = (self.points - self.previous) * (ROPE_DAMPING ** step)
+        self.previous[:] = self.points
+        self.points += velocity
+        self.points[:, 1] += GRAVITY * step * step
+        self.points[-1, 0] += force[0] * step * step
+        self.points[-1, 1] += force[1] * step * step
+        self.points[0] = self.anchor
+        segment_length = self.length / self.segments
+        for _ in range(ROPE_ITERATIONS):
+            for starts, ends, weight_a, weight_b in self.batches:
+                delta = ends - starts
+                distance = np.sqrt(np.einsum("ij,ij->i", delta, delta))
+                np.maximum(distance, 1e-6, out=distance)
+                delta *= ((distance - segment_length) / distance)[:, None]
+                starts += delta * weight_a
+                ends -= delta * weight_b
+        self.limit_reach(segment_length)
+        self.collide(level)
+
+    def limit_reach(self, segment_length):
+        offset = self.points - self.anchor
+        distance = np.sqrt((offset * offset).sum(axis=1))
+        limit = self.reach_index * segment_length
+        over = distance > limit
+        if over.any():
+            self.points[over] = self.anchor + offset[over] * (limit[over] / distance[over])[:, None]
+
+    def collide(self, level):
+        """Выталкивает частицы (кроме крюка) из тайлов к ближайшей свободной грани."""
+        cells = np.floor(self.points[1:] / TILE_SIZE).astype(int).tolist()
+        for number, (cell_x, cell_y) in enumerate(cells, 1):
+            if not level.is_solid(cell_x, cell_y):
+                continue
+            x, y = self.points[number]
+            left = cell_x * TILE_SIZE
+            top = cell_y * TILE_SIZE
+            exits = []
+            if not level.is_solid(cell_x - 1, cell_y):
+                exits.append((x - left, 0, left - 0.01))
+            if not level.is_solid(cell_x + 1, cell_y):
+                exits.append((left + TILE_SIZE - x, 0, left + TILE_SIZE + 0.01))
+            if not level.is_solid(cell_x, cell_y - 1):
+                exits.append((y - top, 1, top - 0.01))
+            if not level.is_solid(cell_x, cell_y + 1):
+                exits.append((top + TILE_SIZE - y, 1, top + TILE_SIZE + 0.01))
+            if exits:
+                _, axis, value = min(exits)
+                self.points[number, axis] = value
+                self.previous[number, axis] = value  # Гасим скорость по нормали
+
+    def end_velocity(self, out):
+        """Записывает в вектор out скорость конца верёвки (игрока) в пикселях за кадр."""
+        out.update((self.points[-1, 0] - self.previous[-1, 0]) / self.step,
+                   (self.points[-1, 1] - self.previous[-1, 1]) / self.step)
+
+# Состояние крюка: векторы создаются один раз и меняются на месте
+class HookState:
+    __slots__ = ("state", "pos", "vel", "origin", "last_pos", "prev_pos", "has_prev",
+                 "angle", "speed", "length", "rope")
+
+    def __init__(self):
+        self.pos = Vector2(0, 0)
+        self.vel = Vector2(0, 0)
+        self.origin = Vector2(0, 0)
+        self.last_pos = Vector2(0, 0)  # Позиция до движения в этом шаге (для raycast)
+        self.prev_pos = Vector2(0, 0)  # Позиция до шага симуляции (для интерполяции)
+        self.clear()
+
+    def clear(self):
+        """Крюк убран; векторы остаются, их значения больше не используются."""
+        self.state = None  # None, "extending", "attached" или "retracting"
+        self.has_prev = False
+        self.angle = 0
+        self.speed = 0
+        self.length = 0
+        self.rope = None  # VerletRope, пока крюк зацеплен в режиме ROPE_VERLET
+
+def truncate(value):
+    """int(value) в виде float: Rect принимает целый float, а int больше 256 - новый объект."""
+    return value - math.fmod(value, 1.0)
+
+def clamp(value, low, high):
+    """max(low, min(value, high)) без вызова min/max: они создают итератор по аргументам."""
+    if value > high:
+        value = high
+    return low if value < low else value
+
 # Класс игрока
 class Player:
+    # Слоты вместо __dict__: шаг симуляции обновляет поля на месте, ничего не создавая
+    __slots__ = ("animation_set", "animations", "image_loaded", "frame_rate",
+                 "pos", "vel", "acc", "rect", "test_rect", "speed", "jump_power", "on_ground",
+                 "hook", "facing_right", "dash_timer", "dash_cooldown", "dash_time",
+                 "dash_duration", "dash_direction", "jump_buffer", "coyote_time", "health",
+                 "prev_pos", "anim_time", "last_movement_time", "state", "frame_index",
+                 "image", "last_update")
+
     def __init__(self, x, y):
+        self.animation_set = get_animation_set()
+        self.animations = self.animation_set.animations
+        self.image_loaded = self.animation_set.image_loaded
+        self.frame_rate = 100  # milliseconds
         self.pos = Vector2(x, y)
         self.vel = Vector2(0, 0)
         self.acc = Vector2(0, 0)
+        self.prev_pos = Vector2(x, y)  # Состояние предыдущего шага для интерполяции
         self.rect = pygame.Rect(x, y, 24, 32)
+        self.test_rect = pygame.Rect(x, y, 24, 32)  # Пробная позиция при изменении длины верёвки
+        self.hook = HookState()
+        self.reset(x, y)
+
+    def reset(self, x, y):
+        """Возвращает изменяемое состояние к началу игры; кадры анимаций не трогает."""
+        self.pos.update(x, y)
+        self.vel.update(0, 0)
+        self.acc.update(0, 0)
+        self.rect.update(x, y, 24, 32)
         self.speed = 5
         self.jump_power = -15
         self.on_ground = False
-        self.hook_state = None
-        self.hook_pos = None
-        self.hook_vel = None
-        self.hook_origin = None
-        self.swing_angle = 0
-        self.swing_speed = 0
+        self.hook.clear()
         self.facing_right = True
-        self.rope_length = 0
         self.dash_timer = 0
         self.dash_cooldown = DASH_COOLDOWN
         self.dash_time = 0
         self.dash_duration = DASH_DURATION
         self.dash_direction = 0
+        self.jump_buffer = 0  # Сколько ещё сек ждёт нажатый прыжок
+        self.coyote_time = 0  # Сколько ещё сек можно прыгнуть после схода с опоры
         self.health = 100
-        self.last_movement_time = pygame.time.get_ticks()
-
-        # Загрузка спрайт-листа
-        SPRITESHEET_PATH = 'src/Assets/character_spritesheet.png'
-        try:
-            spritesheet = pygame.image.load(SPRITESHEET_PATH).convert_alpha()
-            self.animations = {
-                STAND: get_animation_frames(spritesheet, ROWS[STAND]),
-                WALK: get_animation_frames(spritesheet, ROWS[WALK]),
-                IDLE: get_animation_frames(spritesheet, ROWS[IDLE]),
-                DEAD: get_animation_frames(spritesheet, ROWS[DEAD])
-            }
-            self.image_loaded = True
-        except Exception as e:
-            print(f"Ошибка загрузки спрайт-листа: {e}")
-            self.image_loaded = False
-            self.animations = {state: [pygame.Surface((24, 32), pygame.SRCALPHA)] for state in [STAND, WALK, IDLE, DEAD]}
-            for state in self.animations:
-                self.animations[state][0].fill(RED)
-
+        self.prev_pos.update(x, y)
+        self.anim_time = 0  # Время симуляции (мс) для анимации
+        self.last_movement_time = 0
         self.state = STAND
         self.frame_index = 0
         self.image = self.animations[self.state][self.frame_index]
-        self.last_update = pygame.time.get_ticks()
-        self.frame_rate = 100  # milliseconds
+        self.last_update = 0
 
     def update_animation(self, dt, keys):
-        now = pygame.time.get_ticks()
+        self.anim_time += dt * 1000
+        now = self.anim_time
         moving = False
 
-        # Movement and state logic
+        # Состояние анимации по вводу (скорость меняет apply_movement_input)
         if self.health <= 0:
             self.state = DEAD
         else:
-            if keys[pygame.K_a] or keys[pygame.K_LEFT]:
-                self.move_left()
-                moving = True
-            if keys[pygame.K_d] or keys[pygame.K_RIGHT]:
-                self.move_right()
-                moving = True
-            if keys[pygame.K_w] or keys[pygame.K_UP]:
-                self.vel.y = -self.speed
-                moving = True
-            if keys[pygame.K_s] or keys[pygame.K_DOWN]:
-                self.vel.y = self.speed
-                moving = True
+            # Те же клавиши, что в RECORDED_KEYS, без генератора в шаге
+            moving = (keys[pygame.K_a] or keys[pygame.K_d] or keys[pygame.K_w] or keys[pygame.K_s]
+                      or keys[pygame.K_LEFT] or keys[pygame.K_RIGHT] or keys[pygame.K_UP] or keys[pygame.K_DOWN])
 
-            if self.hook_state == "attached":
+            if self.hook.state == "attached":
                 self.state = WALK  # Используем WALK для качания
             elif self.vel.y != 0 and not self.on_ground:
                 self.state = WALK  # Используем WALK для прыжков
@@ -336,68 +1350,133 @@ class Player:
 
         self.image = self.animations[self.state][self.frame_index]
 
+    def rebuild_frame_cache(self, scale_factor):
+        self.animation_set.rebuild_frame_cache(scale_factor)
+
     def get_current_frame(self, scale_factor):
-        scaled_frame = pygame.transform.scale(self.image, (int(24 * scale_factor), int(32 * scale_factor)))
-        if not self.facing_right:
-            scaled_frame = pygame.transform.flip(scaled_frame, True, False)
-        return scaled_frame
+        return self.animation_set.get_frame(self.state, self.frame_index, self.facing_right, scale_factor)
+
+    def save_state(self):
+        """Запоминает позиции перед шагом симуляции для интерполяции отрисовки."""
+        self.prev_pos.x = self.pos.x
+        self.prev_pos.y = self.pos.y
+        hook = self.hook
+        hook.has_prev = hook.state is not None
+        if hook.has_prev:
+            hook.prev_pos.x = hook.pos.x
+            hook.prev_pos.y = hook.pos.y
+
+    def get_render_pos(self, alpha):
+        return self.prev_pos.lerp(self.pos, alpha)
+
+    def get_render_hook_pos(self, alpha):
+        if not self.hook.has_prev:
+            return Vector2(self.hook.pos)
+        return self.hook.prev_pos.lerp(self.hook.pos, alpha)
 
     def update(self, level, dt, keys):
         if self.dash_timer > 0:
             self.dash_timer -= dt
+        if self.jump_buffer > 0:
+            self.jump_buffer -= dt
         if self.dash_time > 0:
             self.handle_dash(level, dt)
-        if self.hook_state == "attached":
-            self.handle_swinging(level)
+        hook_state = self.hook.state
+        if hook_state == "attached":
+            profiler.mark("physics")  # Таймеры и рывок
+            self.handle_swinging(level, dt, keys)
+            profiler.mark("hook")
         else:
-            self.apply_physics(level)
-            if self.hook_state in ["extending", "retracting"]:
-                self.handle_hook_motion(level)
-        self.rect.x = int(self.pos.x)
-        self.rect.y = int(self.pos.y)
+            self.apply_physics(level, dt)
+            profiler.mark("physics")
+            if hook_state == "extending" or hook_state == "retracting":
+                self.handle_hook_motion(level, dt)
+            profiler.mark("hook")
+        self.sync_rect()
+        if self.on_ground:
+            self.coyote_time = COYOTE_TIME
+        elif self.coyote_time > 0:
+            self.coyote_time -= dt
         # Обновление анимации
         self.update_animation(dt, keys)
         # Обновление направления для поворота спрайта
-        if self.hook_state != "attached" and self.vel.x != 0:
+        if self.hook.state != "attached" and self.vel.x != 0:
             self.facing_right = self.vel.x > 0
+        profiler.mark("animation")
 
-    def apply_physics(self, level):
+    def sync_rect(self):
+        """Ставит rect в позицию игрока (как int(pos), но без временных int)."""
+        self.rect.x = truncate(self.pos.x)
+        self.rect.y = truncate(self.pos.y)
+
+    def apply_physics(self, level, dt):
+        step = dt * FPS
         self.acc.y = GRAVITY
-        self.vel += self.acc
-        self.vel.x *= 0.9
-        self.vel.y = min(self.vel.y, 20)
-        self.pos.y += self.vel.y
-        self.rect.y = int(self.pos.y)
+        self.vel.x += self.acc.x * step
+        self.vel.y += self.acc.y * step
+        self.vel.x *= FRICTION ** step
+        self.vel.y = clamp(self.vel.y, -math.inf, 20)
+        self.pos.y += self.vel.y * step
+        self.rect.y = truncate(self.pos.y)
         self.check_collision_y(level)
-        self.pos.x += self.vel.x
-        self.rect.x = int(self.pos.x)
+        self.pos.x += self.vel.x * step
+        self.rect.x = truncate(self.pos.x)
         self.check_collision_x(level)
 
     def check_collision_x(self, level):
-        for tile in level.tiles:
-            if self.rect.colliderect(tile):
-                if self.vel.x > 0:
-                    self.rect.right = tile.left
-                    self.pos.x = self.rect.x
-                    self.vel.x = 0
-                elif self.vel.x < 0:
-                    self.rect.left = tile.right
-                    self.pos.x = self.rect.x
-                    self.vel.x = 0
+        # После первого столкновения скорость обнуляется, остальные тайлы ничего не меняют
+        tile = level.first_collision_at(self.rect, self.pos.x, self.pos.y)
+        if tile is not None:
+            if self.vel.x > 0:
+                self.pos.x = tile[0] - self.rect.width
+                self.rect.x = self.pos.x
+                self.vel.x = 0
+            elif self.vel.x < 0:
+                self.pos.x = tile[2]
+                self.rect.x = self.pos.x
+                self.vel.x = 0
 
     def check_collision_y(self, level):
         self.on_ground = False
-        for tile in level.tiles:
-            if self.rect.colliderect(tile):
-                if self.vel.y > 0:
-                    self.rect.bottom = tile.top
-                    self.pos.y = self.rect.y
-                    self.vel.y = 0
-                    self.on_ground = True
-                elif self.vel.y < 0:
-                    self.rect.top = tile.bottom
-                    self.pos.y = self.rect.y
-                    self.vel.y = 0
+        tile = level.first_collision_at(self.rect, self.pos.x, self.pos.y)
+        if tile is not None:
+            if self.vel.y > 0:
+                self.pos.y = tile[1] - self.rect.height
+                self.rect.y = self.pos.y
+                self.vel.y = 0
+                self.on_ground = True
+            elif self.vel.y < 0:
+                self.pos.y = tile[3]
+                self.rect.y = self.pos.y
+                self.vel.y = 0
+
+    def apply_movement_input(self, keys):
+        """Движение по удерживаемым клавишам и отложенный прыжок; на верёвке не действует."""
+        if self.hook.state == "attached":
+            return
+        if self.jump_buffer > 0:
+            self.try_jump()
+        if self.dash_time <= 0:
+            if keys[pygame.K_a] or keys[pygame.K_LEFT]:
+                self.move_left()
+            if keys[pygame.K_d] or keys[pygame.K_RIGHT]:
+                self.move_right()
+            if keys[pygame.K_w] or keys[pygame.K_UP]:
+                self.vel.y = -self.speed
+            if keys[pygame.K_s] or keys[pygame.K_DOWN]:
+                self.vel.y = self.speed
+
+    def apply_action(self, action):
+        """Выполняет дискретное действие ввода: (ACTION_JUMP,), (ACTION_HOOK, x, y) и т.д."""
+        kind = action[0]
+        if kind == ACTION_JUMP:
+            self.jump()
+        elif kind == ACTION_DASH:
+            self.dash()
+        elif kind == ACTION_RELEASE:
+            self.release_hook()
+        elif kind == ACTION_HOOK:
+            self.launch_hook_at(action[1], action[2])
 
     def move_left(self):
         self.vel.x = -self.speed
@@ -406,9 +1485,17 @@ class Player:
         self.vel.x = self.speed
 
     def jump(self):
-        if self.on_ground:
+        """Прыжок сразу или, если опоры нет, в течение JUMP_BUFFER_TIME после приземления."""
+        self.jump_buffer = JUMP_BUFFER_TIME
+        if self.hook.state != "attached":
+            self.try_jump()
+
+    def try_jump(self):
+        if self.on_ground or self.coyote_time > 0:
             self.vel.y = self.jump_power
             self.on_ground = False
+            self.jump_buffer = 0
+            self.coyote_time = 0
 
     def dash(self):
         if self.dash_timer <= 0:
@@ -422,290 +1509,1543 @@ class Player:
         if self.dash_time <= 0:
             self.dash_time = 0
             return
-        move_x = self.dash_direction * dash_speed * dt
-        old_pos = Vector2(self.pos)
-        self.pos.x += move_x
-        self.rect.x = int(self.pos.x)
-        for tile in level.tiles:
-            if self.rect.colliderect(tile):
-                if self.dash_direction > 0:
-                    self.rect.right = tile.left
-                else:
-                    self.rect.left = tile.right
-                self.pos.x = self.rect.x
-                self.dash_time = 0
-                break
+        self.pos.x += self.dash_direction * dash_speed * dt
+        self.rect.x = truncate(self.pos.x)
+        tile = level.first_collision_at(self.rect, self.pos.x, self.pos.y)
+        if tile is not None:
+            if self.dash_direction > 0:
+                self.pos.x = tile[0] - self.rect.width
+            else:
+                self.pos.x = tile[2]
+            self.rect.x = self.pos.x
+            self.dash_time = 0
 
-    def launch_hook(self, mouse_pos, scale_factor, offset, camera):
-        if self.hook_state:
+    def launch_hook_at(self, target_x, target_y):
+        """Запускает крюк в точку (target_x, target_y) в мировых координатах."""
+        hook = self.hook
+        if hook.state:
             return
-        self.hook_state = "extending"
-        self.hook_pos = Vector2(self.pos.x + 12, self.pos.y)
-        self.hook_origin = Vector2(self.pos.x + 12, self.pos.y)
-        adjusted_mouse_pos = Vector2(
-            (mouse_pos.x - offset.x) / scale_factor + camera.x,
-            (mouse_pos.y - offset.y) / scale_factor + camera.y
-        )
-        direction = adjusted_mouse_pos - self.hook_pos
-        if direction.length() > 0:
-            direction = direction.normalize()
-        self.hook_vel = direction * HOOK_SPEED
-        self.rope_length = 0
-
-    def handle_hook_motion(self, level):
-        if self.hook_state == "extending":
-            old_hook_pos = Vector2(self.hook_pos)
-            self.hook_pos += self.hook_vel
-            distance = (self.hook_pos - self.hook_origin).length()
-            if distance > HOOK_RANGE:
-                self.hook_state = "retracting"
+        hook.state = "extending"
+        hook.pos.x = self.pos.x + 12
+        hook.pos.y = self.pos.y
+        hook.origin.x = hook.pos.x
+        hook.origin.y = hook.pos.y
+        hook.vel.x = 0
+        hook.vel.y = 0
+        self.aim_hook(target_x - hook.pos.x, target_y - hook.pos.y)
+        hook.length = 0
+
+    def aim_hook(self, direction_x, direction_y):
+        """Скорость крюка HOOK_SPEED по направлению; при нулевом направлении скорость не меняется."""
+        # По компонентам, как normalize_ip и *=: методы Vector2 создают объекты на каждом вызове
+        length = math.sqrt(direction_x * direction_x + direction_y * direction_y)
+        if length > 0:
+            self.hook.vel.x = direction_x / length * HOOK_SPEED
+            self.hook.vel.y = direction_y / length * HOOK_SPEED
+
+    def handle_hook_motion(self, level, dt):
+        step = dt * FPS
+        hook = self.hook
+        if hook.state == "extending":
+            hook.last_pos.x = hook.pos.x
+            hook.last_pos.y = hook.pos.y
+            hook.pos.x += hook.vel.x * step
+            hook.pos.y += hook.vel.y * step
+            dx = hook.pos.x - hook.origin.x
+            dy = hook.pos.y - hook.origin.y
+            if math.sqrt(dx * dx + dy * dy) > HOOK_RANGE:
+                hook.state = "retracting"
                 self.set_retract_velocity()
                 return
-            hits = []
-            for tile in level.tiles:
-                tile_rect = pygame.Rect(tile.x, tile.y, tile.width, tile.height)
-                dx = self.hook_pos.x - old_hook_pos.x
-                dy = self.hook_pos.y - old_hook_pos.y
-                hit = False
-                hit_pos = Vector2(self.hook_pos)
-                hit_side = None
-                hit_t = float('inf')
-                if dx != 0 or dy != 0:
-                    # Проверка верхней грани
-                    if dy != 0 and old_hook_pos.y >= tile_rect.top >= self.hook_pos.y:
-                        t = (tile_rect.top - old_hook_pos.y) / dy
-                        if 0 <= t <= 1:
-                            x = old_hook_pos.x + t * dx
-                            if tile_rect.left <= x <= tile_rect.right:
-                                hit = True
-                                hit_pos = Vector2(x, tile_rect.top)
-                                hit_side = 'top'
-                                hit_t = t
-                    # Проверка нижней грани
-                    elif dy != 0 and old_hook_pos.y <= tile_rect.bottom <= self.hook_pos.y:
-                        t = (tile_rect.bottom - old_hook_pos.y) / dy
-                        if 0 <= t <= 1:
-                            x = old_hook_pos.x + t * dx
-                            if tile_rect.left <= x <= tile_rect.right:
-                                hit = True
-                                hit_pos = Vector2(x, tile_rect.bottom)
-                                hit_side = 'bottom'
-                                hit_t = t
-                    # Проверка правой грани
-                    if dx != 0 and old_hook_pos.x <= tile_rect.left <= self.hook_pos.x:
-                        t = (tile_rect.left - old_hook_pos.x) / dx
-                        if 0 <= t <= 1:
-                            y = old_hook_pos.y + t * dy
-                            if tile_rect.top <= y <= tile_rect.bottom:
-                                hit = True
-                                hit_pos = Vector2(tile_rect.left, y)
-                                hit_side = 'left'
-                                hit_t = t
-                    # Проверка левой грани
-                    elif dx != 0 and self.hook_pos.x <= tile_rect.right <= old_hook_pos.x:
-                        t = (tile_rect.right - old_hook_pos.x) / dx
-                        if 0 <= t <= 1:
-                            y = old_hook_pos.y + t * dy
-                            if tile_rect.top <= y <= tile_rect.bottom:
-                                hit = True
-                                hit_pos = Vector2(tile_rect.right, y)
-                                hit_side = 'right'
-                                hit_t = t
-                if hit:
-                    hits.append((hit_t, hit_pos, hit_side, tile_rect))
-            if hits:
-                hits.sort(key=lambda x: x[0])
-                for hit_t, hit_pos, hit_side, tile_rect in hits:
-                    valid = False
-                    offset = Vector2(0, 0)
-                    if hit_side == 'top' and self.hook_vel.y < 0:
-                        valid = True
-                        offset = Vector2(0, 2)
-                    elif hit_side == 'bottom' and self.hook_vel.y > 0:
-                        valid = True
-                        offset = Vector2(0, -2)
-                    elif hit_side == 'left' and self.hook_vel.x > 0:
-                        valid = True
-                        offset = Vector2(-2, 0)
-                    elif hit_side == 'right' and self.hook_vel.x < 0:
-                        valid = True
-                        offset = Vector2(2, 0)
-                    if not valid:
-                        normal = {'top': Vector2(0, -1), 'bottom': Vector2(0, 1), 'left': Vector2(-1, 0), 'right': Vector2(1, 0)}[hit_side]
-                        dot_product = self.hook_vel.dot(normal)
-                        if dot_product < 0:
-                            valid = True
-                            offset = {'top': Vector2(0, 2), 'bottom': Vector2(0, -2), 'left': Vector2(-2, 0), 'right': Vector2(2, 0)}[hit_side]
-                    if valid:
-                        dist_to_surface = abs({'top': hit_pos.y - tile_rect.top, 'bottom': hit_pos.y - tile_rect.bottom, 'left': hit_pos.x - tile_rect.left, 'right': hit_pos.x - tile_rect.right}[hit_side])
-                        if dist_to_surface < 10:
-                            self.hook_state = "attached"
-                            self.hook_pos = hit_pos + offset
-                            self.hook_pos.x = max(tile_rect.left, min(self.hook_pos.x, tile_rect.right))
-                            self.hook_pos.y = max(tile_rect.top, min(self.hook_pos.y, tile_rect.bottom))
-                            self.vel = Vector2(0, 0)
-                            self.swing_angle = math.atan2(self.pos.y - self.hook_pos.y, self.pos.x - self.hook_pos.x)
-                            self.swing_speed = 0
-                            self.rope_length = (self.pos - self.hook_pos).length()
-                            return
-                self.hook_state = "retracting"
+            hit = level.raycast(hook.last_pos, hook.pos)
+            if hit:
+                hit_pos, normal, tile = hit
+                # Цепляемся только за грань, обращённую навстречу крюку
+                if normal is not None and hook.vel.x * normal[0] + hook.vel.y * normal[1] < 0:
+                    hook.state = "attached"
+                    hook.pos.x = clamp(hit_pos[0] - normal[0] * 2, tile[0], tile[2])
+                    hook.pos.y = clamp(hit_pos[1] - normal[1] * 2, tile[1], tile[3])
+                    if rope_mode == ROPE_VERLET and np is not None:
+                        # Гибкая верёвка сохраняет скорость игрока в момент зацепа
+                        end = Vector2(self.pos.x + 12, self.pos.y)
+                        hook.length = clamp(end.distance_to(hook.pos), MIN_ROPE_LENGTH, math.inf)
+                        hook.rope = VerletRope(hook.pos, end, self.vel * step, hook.length)
+                        return
+                    self.vel.x = 0
+                    self.vel.y = 0
+                    dx = self.pos.x - hook.pos.x
+                    dy = self.pos.y - hook.pos.y
+                    hook.angle = math.atan2(dy, dx)
+                    hook.speed = 0
+                    hook.length = math.sqrt(dx * dx + dy * dy)
+                    return
+                hook.state = "retracting"
                 self.set_retract_velocity()
-        elif self.hook_state == "retracting":
-            self.hook_pos += self.hook_vel
-            distance = (self.hook_pos - Vector2(self.pos.x + 12, self.pos.y)).length()
-            if distance < 10:
-                self.hook_state = None
-                self.hook_pos = None
-                self.hook_vel = None
-                self.hook_origin = None
-                self.rope_length = 0
+        elif hook.state == "retracting":
+            hook.pos.x += hook.vel.x * step
+            hook.pos.y += hook.vel.y * step
+            if math.hypot(self.pos.x + 12 - hook.pos.x, self.pos.y - hook.pos.y) < 10:
+                hook.clear()
             else:
                 self.set_retract_velocity()
 
     def set_retract_velocity(self):
-        direction = Vector2(self.pos.x + 12, self.pos.y) - self.hook_pos
-        if direction.length() > 0:
-            direction = direction.normalize()
-            self.hook_vel = direction * HOOK_SPEED
-
-    def handle_swinging(self, level):
-        keys = pygame.key.get_pressed()
-        new_rope_length = self.rope_length
-        if keys[pygame.K_w] and self.hook_state == "attached":
-            new_rope_length -= ROPE_SPEED
-        if keys[pygame.K_s] and self.hook_state == "attached":
-            new_rope_length += ROPE_SPEED
-        new_rope_length = max(MIN_ROPE_LENGTH, min(new_rope_length, HOOK_RANGE))
-        old_pos = Vector2(self.pos)
-        test_pos = Vector2(self.hook_pos.x + math.cos(self.swing_angle) * new_rope_length, self.hook_pos.y + math.sin(self.swing_angle) * new_rope_length)
-        test_rect = self.rect.copy()
-        test_rect.x = int(test_pos.x)
-        test_rect.y = int(test_pos.y)
-        collision = False
-        for tile in level.tiles:
-            if test_rect.colliderect(tile):
-                collision = True
-                break
-        if not collision:
-            self.rope_length = new_rope_length
-            self.pos = test_pos
-        else:
-            self.pos = old_pos
-        if keys[pygame.K_a] and self.hook_state == "attached":
-            self.swing_speed += SWING_SPEED
-        if keys[pygame.K_d] and self.hook_state == "attached":
-            self.swing_speed -= SWING_SPEED
-        self.swing_speed = max(min(self.swing_speed, 0.1), -0.1)
-        self.swing_speed *= 0.9
-        self.swing_angle += self.swing_speed
-        self.pos.x = self.hook_pos.x + math.cos(self.swing_angle) * self.rope_length
-        self.pos.y = self.hook_pos.y + math.sin(self.swing_angle) * self.rope_length
-        self.rect.x = int(self.pos.x)
-        self.rect.y = int(self.pos.y)
-        for tile in level.tiles:
-            if self.rect.colliderect(tile):
-                self.release_hook()
-                break
+        self.aim_hook(self.pos.x + 12 - self.hook.pos.x, self.pos.y - self.hook.pos.y)
+
+    def handle_swinging(self, level, dt, keys):
+        hook = self.hook
+        if hook.rope is not None:
+            self.handle_rope(level, dt, keys)
+            return
+        step = dt * FPS
+        new_rope_length = hook.length
+        if keys[pygame.K_w] or keys[pygame.K_UP]:
+            new_rope_length -= ROPE_SPEED * step
+        if keys[pygame.K_s] or keys[pygame.K_DOWN]:
+            new_rope_length += ROPE_SPEED * step
+        new_rope_length = clamp(new_rope_length, MIN_ROPE_LENGTH, HOOK_RANGE)
+        old_x = self.pos.x
+        old_y = self.pos.y
+        test_x = hook.pos.x + math.cos(hook.angle) * new_rope_length
+        test_y = hook.pos.y + math.sin(hook.angle) * new_rope_length
+        self.test_rect.x = truncate(test_x)
+        self.test_rect.y = truncate(test_y)
+        if level.first_collision_at(self.test_rect, test_x, test_y) is None:
+            hook.length = new_rope_length
+            self.pos.x = test_x
+            self.pos.y = test_y
+        if keys[pygame.K_a] or keys[pygame.K_LEFT]:
+            hook.speed += SWING_SPEED * step
+        if keys[pygame.K_d] or keys[pygame.K_RIGHT]:
+            hook.speed -= SWING_SPEED * step
+        hook.speed = clamp(hook.speed, -0.1, 0.1)
+        hook.speed *= FRICTION ** step
+        hook.angle += hook.speed * step
+        self.pos.x = hook.pos.x + math.cos(hook.angle) * hook.length
+        self.pos.y = hook.pos.y + math.sin(hook.angle) * hook.length
+        self.sync_rect()
+        if level.first_collision_at(self.rect, self.pos.x, self.pos.y) is not None:
+            # Возвращаемся в последнюю свободную позицию, иначе игрок застревает в тайле
+            self.pos.x = old_x
+            self.pos.y = old_y
+            self.sync_rect()
+            self.release_hook()
+
+    def handle_rope(self, level, dt, keys):
+        """Качание на гибкой верёвке: игрок - последняя частица VerletRope."""
+        step = dt * FPS
+        hook = self.hook
+        rope = hook.rope
+        if keys[pygame.K_w] or keys[pygame.K_UP]:
+            hook.length -= ROPE_SPEED * step
+        if keys[pygame.K_s] or keys[pygame.K_DOWN]:
+            hook.length += ROPE_SPEED * step
+        hook.length = clamp(hook.length, MIN_ROPE_LENGTH, HOOK_RANGE)
+        rope.length = hook.length
+        force = 0.0
+        if keys[pygame.K_a] or keys[pygame.K_LEFT]:
+            force -= ROPE_SWING_FORCE
+        if keys[pygame.K_d] or keys[pygame.K_RIGHT]:
+            force += ROPE_SWING_FORCE
+        rope.update(level, step, (force, 0.0))
+        # Игрок сдвигается за концом верёвки по осям, пока не упрётся в тайл
+        end = rope.points[-1]
+        for axis, value in ((0, end[0] - 12), (1, end[1])):
+            old_value = self.pos[axis]
+            self.pos[axis] = value
+            self.sync_rect()
+            if level.collides(self.rect):
+                self.pos[axis] = old_value
+                self.sync_rect()
+                rope.previous[-1, axis] = rope.points[-1, axis] = self.pos[axis] + (12 if axis == 0 else 0)
+        rope.end_velocity(self.vel)
 
     def release_hook(self):
-        if self.hook_state == "attached":
-            tangential_vel = self.swing_speed * self.rope_length
-            self.vel.x = -math.sin(self.swing_angle) * tangential_vel
-            self.vel.y = math.cos(self.swing_angle) * tangential_vel
-        self.hook_state = None
-        self.hook_pos = None
-        self.hook_vel = None
-        self.hook_origin = None
-        self.swing_angle = 0
-        self.swing_speed = 0
-        self.rope_length = 0
+        hook = self.hook
+        if hook.rope is not None:
+            hook.rope.end_velocity(self.vel)
+        elif hook.state == "attached":
+            tangential_vel = hook.speed * hook.length
+            self.vel.x = -math.sin(hook.angle) * tangential_vel
+            self.vel.y = math.cos(hook.angle) * tangential_vel
+        hook.clear()
+
+# Встроенная карта уровня
+DEFAULT_LEVEL_MAP = [
+    "████████████████████████████████████████████████",
+    "█                                              █",
+    "█                                              █",
+    "█          ████                                █",
+    "█                                              █",
+    "█                                              █",
+    "█      ████                                    █",
+    "█                                              █",
+    "█                                              █",
+    "█              ████                            █",
+    "█                                              █",
+    "█                                              █",
+    "█  ████                                        █",
+    "█                                              █",
+    "█                                              █",
+    "█                      ████                    █",
+    "█                                              █",
+    "█                                              █",
+    "█      ████                                    █",
+    "█                                              █",
+    "█                                              █",
+    "████████████████████████████████████████████████",
+]
+
+# Таблица перевода текстовой карты (после замены "█" на "#") в байты клеток
+LEVEL_TEXT_TABLE = bytes(TILE_SOLID if chr(code) in LEVEL_SOLID_CHARS else TILE_EMPTY for code in range(256))
+
+def parse_level_text(lines):
+    """Текстовая карта -> (ширина, высота, bytearray клеток)."""
+    rows = [line.rstrip("\r\n") for line in lines]
+    while rows and not rows[-1].strip():
+        rows.pop()
+    width = max((len(row) for row in rows), default=0)
+    cells = bytearray()
+    for row in rows:
+        cells += row.ljust(width).replace("█", "#").encode("ascii", "replace").translate(LEVEL_TEXT_TABLE)
+    return width, len(rows), cells
+
+def read_level_header(data, path):
+    """(флаги, ширина, высота, смещение клеток) двоичного файла уровня."""
+    magic, version, flags, width, height = LEVEL_HEADER.unpack_from(data, 0)
+    if version != LEVEL_VERSION:
+        raise ValueError(f"{path}: версия формата {version}, поддерживается {LEVEL_VERSION}")
+    offset = LEVEL_HEADER.size
+    if flags & LEVEL_FLAG_CHUNKED:
+        chunk_tiles, = LEVEL_CHUNK_HEADER.unpack_from(data, offset)
+        if chunk_tiles != LEVEL_CHUNK_TILES:
+            raise ValueError(f"{path}: чанки {chunk_tiles} тайлов, нужно {LEVEL_CHUNK_TILES}")
+        offset += LEVEL_CHUNK_HEADER.size
+    return flags, width, height, offset
+
+def is_chunked_level_file(path):
+    """Записан ли файл уровня по чанкам (такие уровни читаются потоково через mmap)."""
+    with open(path, "rb") as file:
+        data = file.read(LEVEL_HEADER.size)
+    return len(data) == LEVEL_HEADER.size and data[:len(LEVEL_MAGIC)] == LEVEL_MAGIC and bool(LEVEL_HEADER.unpack(data)[2] & LEVEL_FLAG_CHUNKED)
+
+def load_level_file(path):
+    """Читает уровень в текстовом или двоичном формате: (ширина, высота, bytearray клеток)."""
+    with open(path, "rb") as file:
+        data = file.read()
+    if data[:len(LEVEL_MAGIC)] != LEVEL_MAGIC:
+        return parse_level_text(data.decode("utf-8").splitlines())
+    flags, width, height, offset = read_level_header(data, path)
+    payload = data[offset:]
+    if flags & LEVEL_FLAG_ZLIB:
+        payload = zlib.decompress(payload)
+    if flags & LEVEL_FLAG_CHUNKED:
+        source = MappedChunkSource(payload, 0, width, height)
+        grid = bytearray(width * height)
+        for chunk_y in range(source.chunks_y):
+            for chunk_x in range(source.chunks_x):
+                chunk = source.read_chunk(chunk_x, chunk_y)
+                first_x = chunk_x * LEVEL_CHUNK_TILES
+                row_width = min(LEVEL_CHUNK_TILES, width - first_x)
+                for row in range(min(LEVEL_CHUNK_TILES, height - chunk_y * LEVEL_CHUNK_TILES)):
+                    start = (chunk_y * LEVEL_CHUNK_TILES + row) * width + first_x
+                    grid[start:start + row_width] = chunk[row * LEVEL_CHUNK_TILES:row * LEVEL_CHUNK_TILES + row_width]
+        return width, height, grid
+    if len(payload) != width * height:
+        raise ValueError(f"{path}: ожидалось {width * height} клеток, в файле {len(payload)}")
+    return width, height, bytearray(payload)
+
+def save_level_binary(path, width, height, cells, compress=True, chunked=False):
+    """Записывает уровень в двоичном формате: заголовок и по байту на клетку."""
+    flags = 0
+    header = b""
+    payload = bytes(cells)
+    if chunked:
+        flags |= LEVEL_FLAG_CHUNKED
+        header = LEVEL_CHUNK_HEADER.pack(LEVEL_CHUNK_TILES)
+        source = GridChunkSource(width, height, cells)
+        payload = b"".join(source.read_chunk(chunk_x, chunk_y) for chunk_y in range(source.chunks_y) for chunk_x in range(source.chunks_x))
+        compress = False
+    if compress:
+        flags |= LEVEL_FLAG_ZLIB
+        payload = zlib.compress(payload, 9)
+    with open(path, "wb") as file:
+        file.write(LEVEL_HEADER.pack(LEVEL_MAGIC, LEVEL_VERSION, flags, width, height))
+        file.write(header)
+        file.write(payload)
+
+# Источники клеток уровня по чанкам
+class GridChunkSource:
+    """Чанки из сетки клеток в памяти (bytearray по строкам)."""
+    def __init__(self, width, height, cells):
+        self.width = width
+        self.height = height
+        self.cells = cells
+        self.chunks_x = (width + LEVEL_CHUNK_TILES - 1) // LEVEL_CHUNK_TILES
+        self.chunks_y = (height + LEVEL_CHUNK_TILES - 1) // LEVEL_CHUNK_TILES
+
+    def read_chunk(self, chunk_x, chunk_y):
+        """Клетки чанка по строкам; клетки за краем уровня пустые."""
+        chunk = bytearray(LEVEL_CHUNK_TILES * LEVEL_CHUNK_TILES)
+        first_x = chunk_x * LEVEL_CHUNK_TILES
+        row_width = min(LEVEL_CHUNK_TILES, self.width - first_x)
+        for row in range(min(LEVEL_CHUNK_TILES, self.height - chunk_y * LEVEL_CHUNK_TILES)):
+            start = (chunk_y * LEVEL_CHUNK_TILES + row) * self.width + first_x
+            chunk[row * LEVEL_CHUNK_TILES:row * LEVEL_CHUNK_TILES + row_width] = self.cells[start:start + row_width]
+        return bytes(chunk)
+
+    def close(self):
+        pass
+
+class MappedChunkSource:
+    """Чанки из буфера с раскладкой по чанкам, обычно файла уровня, отображённого в память."""
+    def __init__(self, buffer, offset, width, height):
+        self.buffer = buffer
+        self.offset = offset
+        self.width = width
+        self.height = height
+        self.chunks_x = (width + LEVEL_CHUNK_TILES - 1) // LEVEL_CHUNK_TILES
+        self.chunks_y = (height + LEVEL_CHUNK_TILES - 1) // LEVEL_CHUNK_TILES
+        chunk_bytes = LEVEL_CHUNK_TILES * LEVEL_CHUNK_TILES
+        if len(buffer) - offset != self.chunks_x * self.chunks_y * chunk_bytes:
+            raise ValueError(f"ожидалось {self.chunks_x * self.chunks_y} чанков по {chunk_bytes} байт")
+
+    def read_chunk(self, chunk_x, chunk_y):
+        chunk_bytes = LEVEL_CHUNK_TILES * LEVEL_CHUNK_TILES
+        start = self.offset + (chunk_y * self.chunks_x + chunk_x) * chunk_bytes
+        return bytes(self.buffer[start:start + chunk_bytes])
+
+    def close(self):
+        if isinstance(self.buffer, mmap.mmap):
+            self.buffer.close()
+
+def merge_solid_cells(cells, width, first_x, first_y, last_x, last_y):
+    """Жадно объединяет твёрдые клетки области в крупные прямоугольники (greedy meshing)."""
+    region_width = last_x - first_x
+    used = bytearray(region_width * (last_y - first_y))
+    rects = []
+    for y in range(first_y, last_y):
+        row = y * width
+        used_row = (y - first_y) * region_width - first_x
+        x = first_x
+        while x < last_x:
+            if cells[row + x] == TILE_EMPTY or used[used_row + x]:
+                x += 1
+                continue
+            run = 1
+            while x + run < last_x and cells[row + x + run] != TILE_EMPTY and not used[used_row + x + run]:
+                run += 1
+            height = 1
+            while y + height < last_y:
+                below = (y + height) * width + x
+                used_below = used_row + height * region_width + x
+                if TILE_EMPTY in cells[below:below + run] or 1 in used[used_below:used_below + run]:
+                    break
+                height += 1
+            for cell_y in range(height):
+                start = used_row + cell_y * region_width + x
+                used[start:start + run] = b"\x01" * run
+            rects.append(pygame.Rect(x * TILE_SIZE, y * TILE_SIZE, run * TILE_SIZE, height * TILE_SIZE))
+            x += run
+    return rects
+
+def rect_edges(rect):
+    """Грани прямоугольника (left, top, right, bottom) во float."""
+    return float(rect.left), float(rect.top), float(rect.right), float(rect.bottom)
+
+# Клетки чанка, который ещё не сгенерирован (сплошной)
+MISSING_CHUNK_CELLS = bytes([TILE_SOLID]) * (LEVEL_CHUNK_TILES * LEVEL_CHUNK_TILES)
+
+# Разобранные карты: ключ (путь или карта) -> (ширина, высота, источник чанков, чанки).
+# Общие для всех Level с той же картой; клетки не изменяются после разбора.
+level_geometry_cache = OrderedDict()
 
 # Класс уровня
 class Level:
-    def __init__(self):
-        self.tiles = []
+    """Уровень из чанков LEVEL_CHUNK_TILES x LEVEL_CHUNK_TILES клеток по байту."""
+    def __init__(self, level_map=None, path=None, source=None):
         self.width = 0
         self.height = 0
-        self.load_level()
-
-    def load_level(self):
-        level_map = [
-            "████████████████████████████████████████████████",
-            "█                                              █",
-            "█                                              █",
-            "█          ████                                █",
-            "█                                              █",
-            "█                                              █",
-            "█      ████                                    █",
-            "█                                              █",
-            "█                                              █",
-            "█              ████                            █",
-            "█                                              █",
-            "█                                              █",
-            "█  ████                                        █",
-            "█                                              █",
-            "█                                              █",
-            "█                      ████                    █",
-            "█                                              █",
-            "█                                              █",
-            "█      ████                                    █",
-            "█                                              █",
-            "█                                              █",
-            "████████████████████████████████████████████████",
-        ]
-        self.height = len(level_map)
-        self.width = len(level_map[0]) if level_map else 0
-        for y, row in enumerate(level_map):
-            for x, tile in enumerate(row):
-                if tile == "█":
-                    self.tiles.append(pygame.Rect(x * TILE_SIZE, y * TILE_SIZE, TILE_SIZE, TILE_SIZE))
+        self.spawn = (100, 600)  # Точка появления игрока
+        self.source = None  # GridChunkSource, MappedChunkSource или EndlessChunkSource
+        self.chunks = OrderedDict()  # Чанк (x, y) -> (клетки, прямоугольники столкновений, их грани)
+        self.chunk_budget = None  # Предел числа чанков (None - без вытеснения)
+        self.pinned = set()  # Чанки вокруг камеры и крюка, которые нельзя вытеснять
+        self.render_chunks = OrderedDict()  # Кэш отрисовки: чанк (x, y) -> Surface или None
+        self.render_scale = None  # scale_factor, для которого построен кэш
+        self.last_camera = None  # Камера прошлого кадра: направление для подготовки чанков
+        self.path = None  # Файл уровня (None - карта из памяти или генератор)
+        self.cell_probe = pygame.Rect(0, 0, 1, 1)  # Клетка, которую ищет tile_at_cell
+        if source is not None:
+            self.source = source
+            self.width = source.width
+            self.height = source.height
+            self.chunk_budget = LEVEL_CHUNK_BUDGET
+            return
+        if level_map is None:
+            path = path if path is not None else level_path
+            try:
+                self.load_file(path)
+                self.path = path
+                return
+            except Exception as e:
+                print(f"Ошибка загрузки уровня {path}: {e}")
+                level_map = DEFAULT_LEVEL_MAP
+        self.load_level(level_map)
+
+    def load_level(self, level_map):
+        """Загружает карту из списка строк."""
+        self.use_geometry(tuple(level_map), lambda: parse_level_text(level_map))
+
+    def load_file(self, path):
+        """Загружает уровень из файла; файл с раскладкой по чанкам отображается в память."""
+        if is_chunked_level_file(path):
+            with open(path, "rb") as file:
+                mapped = mmap.mmap(file.fileno(), 0, access=mmap.ACCESS_READ)
+            flags, self.width, self.height, offset = read_level_header(mapped, path)
+            self.source = MappedChunkSource(mapped, offset, self.width, self.height)
+            self.chunk_budget = LEVEL_CHUNK_BUDGET
+            return
+        stat = os.stat(path)
+        self.use_geometry((path, stat.st_mtime_ns, stat.st_size), lambda: load_level_file(path))
+
+    def use_geometry(self, key, parse):
+        geometry = level_geometry_cache.get(key)
+        if geometry is None:
+            width, height, cells = parse()
+            geometry = (width, height, GridChunkSource(width, height, cells), OrderedDict())
+            level_geometry_cache[key] = geometry
+            while len(level_geometry_cache) > LEVEL_CACHE_SIZE:
+                level_geometry_cache.popitem(last=False)
+        else:
+            level_geometry_cache.move_to_end(key)
+        self.width, self.height, self.source, self.chunks = geometry
+
+    def get_chunk(self, chunk_x, chunk_y):
+        """(клетки, прямоугольники, грани) чанка или None за пределами уровня; загружает его при необходимости."""
+        key = (chunk_x, chunk_y)
+        chunk = self.chunks.get(key)
+        if chunk is not None:
+            if self.chunk_budget is not None:
+                self.chunks.move_to_end(key)
+            return chunk
+        if not (0 <= chunk_x < self.source.chunks_x and 0 <= chunk_y < self.source.chunks_y):
+            return None
+        cells = self.source.read_chunk(chunk_x, chunk_y)
+        if cells is None:
+            # Чанк ещё не готов (генерируется в фоне): до готовности он сплошная стена
+            chunk_size = LEVEL_CHUNK_SIZE
+            wall = pygame.Rect(chunk_x * chunk_size, chunk_y * chunk_size, chunk_size, chunk_size)
+            return MISSING_CHUNK_CELLS, [wall], [rect_edges(wall)]
+        rects = merge_solid_cells(cells, LEVEL_CHUNK_TILES, 0, 0, LEVEL_CHUNK_TILES, LEVEL_CHUNK_TILES)
+        for rect in rects:
+            rect.move_ip(chunk_x * LEVEL_CHUNK_SIZE, chunk_y * LEVEL_CHUNK_SIZE)
+        # Грани заранее во float: игрок выравнивается по ним, не читая int из Rect на каждом шаге
+        chunk = (cells, rects, [rect_edges(rect) for rect in rects])
+        self.chunks[key] = chunk
+        if self.chunk_budget is not None and len(self.chunks) > self.chunk_budget:
+            self.evict_chunks()
+        return chunk
+
+    def evict_chunks(self):
+        """Вытесняет давно не использованные чанки сверх бюджета, кроме закреплённых."""
+        excess = len(self.chunks) - self.chunk_budget
+        for key in list(self.chunks):
+            if excess <= 0:
+                break
+            if key not in self.pinned:
+                del self.chunks[key]
+                self.render_chunks.pop(key, None)
+                excess -= 1
+
+    def chunks_in_rect(self, rect):
+        """Ключи чанков уровня, которые пересекает прямоугольник rect (мировые координаты)."""
+        chunk_size = LEVEL_CHUNK_TILES * TILE_SIZE
+        first_x = max(0, rect.left // chunk_size)
+        first_y = max(0, rect.top // chunk_size)
+        last_x = min(self.source.chunks_x - 1, (rect.right - 1) // chunk_size)
+        last_y = min(self.source.chunks_y - 1, (rect.bottom - 1) // chunk_size)
+        return [(x, y) for y in range(first_y, last_y + 1) for x in range(first_x, last_x + 1)]
+
+    def stream(self, areas, velocity):
+        """Держит загруженными чанки под areas и подгружает их впереди по velocity."""
+        shift = (int(velocity.x * LEVEL_PREFETCH_FRAMES), int(velocity.y * LEVEL_PREFETCH_FRAMES))
+        pinned = set()
+        for area in areas:
+            pinned.update(self.chunks_in_rect(area))
+            pinned.update(self.chunks_in_rect(area.move(shift)))
+        self.pinned = pinned
+        for key in sorted(pinned):
+            self.get_chunk(*key)
+
+    def is_solid(self, cell_x, cell_y):
+        """Твёрдая ли клетка; клетки за пределами уровня пустые."""
+        chunk = self.get_chunk(cell_x // LEVEL_CHUNK_TILES, cell_y // LEVEL_CHUNK_TILES)
+        if chunk is None:
+            return False
+        return chunk[0][cell_y % LEVEL_CHUNK_TILES * LEVEL_CHUNK_TILES + cell_x % LEVEL_CHUNK_TILES] != TILE_EMPTY
+
+    def get_chunk_rects(self, chunk_x, chunk_y):
+        """Прямоугольники столкновений чанка (пустой кортеж за пределами уровня)."""
+        chunk = self.get_chunk(chunk_x, chunk_y)
+        return chunk[1] if chunk is not None else ()
+
+    def query_rect(self, rect):
+        """Возвращает прямоугольники столкновений, пересекающиеся с rect."""
+        if rect.width <= 0 or rect.height <= 0:
+            return []
+        chunk_size = LEVEL_CHUNK_TILES * TILE_SIZE
+        hits = []
+        for chunk_y in range(rect.top // chunk_size, (rect.bottom - 1) // chunk_size + 1):
+            for chunk_x in range(rect.left // chunk_size, (rect.right - 1) // chunk_size + 1):
+                rects = self.get_chunk_rects(chunk_x, chunk_y)
+                if rects:
+                    hits.extend(rects[i] for i in rect.collidelistall(rects))
+        return hits
+
+    def first_collision(self, rect):
+        """Первый прямоугольник столкновений, пересекающий rect, или None."""
+        if rect.width <= 0 or rect.height <= 0:
+            return None
+        chunk_size = LEVEL_CHUNK_TILES * TILE_SIZE
+        last_x = (rect.right - 1) // chunk_size
+        last_y = (rect.bottom - 1) // chunk_size
+        chunk_y = rect.top // chunk_size
+        while chunk_y <= last_y:
+            chunk_x = rect.left // chunk_size
+            while chunk_x <= last_x:
+                rects = self.get_chunk_rects(chunk_x, chunk_y)
+                if rects:
+                    index = rect.collidelist(rects)
+                    if index != -1:
+                        return rects[index]
+                chunk_x += 1
+            chunk_y += 1
+        return None
+
+    def collides(self, rect):
+        """Проверяет, пересекается ли прямоугольник хотя бы с одним тайлом."""
+        return self.first_collision(rect) is not None
+
+    def first_collision_at(self, rect, x, y):
+        """Грани первого тайла, пересекающего rect, или None; (x, y) - float-позиция, по которой выставлен rect."""
+        # Чанки ищутся по float-позиции с запасом в пиксель (rect.x отличается от x меньше чем на 1):
+        # чтение rect.left/right создавало бы int на каждом вызове. Лишний чанк результат не меняет.
+        chunk_size = LEVEL_CHUNK_SIZE
+        first_x = int((x - 1) // chunk_size)
+        last_x = int((x + rect.width) // chunk_size)
+        last_y = int((y + rect.height) // chunk_size)
+        chunk_y = int((y - 1) // chunk_size)
+        while chunk_y <= last_y:
+            chunk_x = first_x
+            while chunk_x <= last_x:
+                chunk = self.get_chunk(chunk_x, chunk_y)
+                if chunk is not None and chunk[1]:
+                    index = rect.collidelist(chunk[1])
+                    if index != -1:
+                        return chunk[2][index]
+                chunk_x += 1
+            chunk_y += 1
+        return None
+
+    def tile_at_cell(self, cell_x, cell_y):
+        """Возвращает грани прямоугольника столкновений, покрывающего клетку сетки, или None."""
+        if not self.is_solid(cell_x, cell_y):
+            return None
+        chunk = self.get_chunk(cell_x // LEVEL_CHUNK_TILES, cell_y // LEVEL_CHUNK_TILES)
+        # Координаты пробы во float: Rect принимает целый float, а cell_x * TILE_SIZE - новый int
+        self.cell_probe.x = cell_x * float(TILE_SIZE)
+        self.cell_probe.y = cell_y * float(TILE_SIZE)
+        return chunk[2][self.cell_probe.collidelist(chunk[1])]
+
+    def raycast(self, start, end):
+        """Луч по сетке тайлов (Amanatides–Woo): ((x, y) попадания, нормаль грани, грани тайла) или None."""
+        dx = end[0] - start[0]
+        dy = end[1] - start[1]
+        tile_size = float(TILE_SIZE)
+        cell_x = int(start[0] // TILE_SIZE)
+        cell_y = int(start[1] // TILE_SIZE)
+        tile = self.tile_at_cell(cell_x, cell_y)
+        if tile is not None:
+            return (start[0], start[1]), None, tile
+
+        if dx > 0:
+            step_x = 1
+            t_max_x = ((cell_x + 1) * tile_size - start[0]) / dx
+            t_delta_x = TILE_SIZE / dx
+        elif dx < 0:
+            step_x = -1
+            t_max_x = (cell_x * tile_size - start[0]) / dx
+            t_delta_x = TILE_SIZE / -dx  # -TILE_SIZE - новый int (вне кэша малых чисел)
+        else:
+            step_x = 0
+            t_max_x = t_delta_x = math.inf
+        if dy > 0:
+            step_y = 1
+            t_max_y = ((cell_y + 1) * tile_size - start[1]) / dy
+            t_delta_y = TILE_SIZE / dy
+        elif dy < 0:
+            step_y = -1
+            t_max_y = (cell_y * tile_size - start[1]) / dy
+            t_delta_y = TILE_SIZE / -dy
+        else:
+            step_y = 0
+            t_max_y = t_delta_y = math.inf
+
+        while True:
+            if t_max_x < t_max_y:
+                t = t_max_x
+                if t > 1:
+                    return None
+                cell_x += step_x
+                t_max_x += t_delta_x
+                normal = (-step_x, 0)
+            else:
+                t = t_max_y
+                if t > 1:
+                    return None
+                cell_y += step_y
+                t_max_y += t_delta_y
+                normal = (0, -step_y)
+            tile = self.tile_at_cell(cell_x, cell_y)
+            if tile is not None:
+                return (start[0] + t * dx, start[1] + t * dy), normal, tile
+
+    def clear_render_cache(self):
+        """Сбрасывает кэш отрисованных чанков (например, при изменении размера окна)."""
+        self.render_chunks = OrderedDict()
+        self.render_scale = None
+
+    def get_render_chunk(self, chunk_x, chunk_y, scale_factor):
+        """Возвращает заранее отрисованный чанк тайлов или None, если он пустой."""
+        key = (chunk_x, chunk_y)
+        if key in self.render_chunks:
+            self.render_chunks.move_to_end(key)
+            return self.render_chunks[key]
+        chunk = None
+        level_chunk = self.get_chunk(chunk_x, chunk_y)
+        if level_chunk is not None and level_chunk[0] is MISSING_CHUNK_CELLS:
+            return None  # Не кэшируем: чанк появится, когда будет готов
+        if level_chunk is not None and level_chunk[1]:
+            tile_size = int(TILE_SIZE * scale_factor)
+            chunk_size = math.ceil(LEVEL_CHUNK_TILES * TILE_SIZE * scale_factor) + 1
+            chunk = pygame.Surface((chunk_size, chunk_size), pygame.SRCALPHA)
+            for index, cell in enumerate(level_chunk[0]):
+                if cell != TILE_EMPTY:
+                    rect = pygame.Rect(
+                        int(index % LEVEL_CHUNK_TILES * TILE_SIZE * scale_factor),
+                        int(index // LEVEL_CHUNK_TILES * TILE_SIZE * scale_factor),
+                        tile_size,
+                        tile_size
+                    )
+                    pygame.draw.rect(chunk, CYAN, rect, 1)
+            if pygame.display.get_surface() is not None:
+                chunk = chunk.convert_alpha()
+        self.render_chunks[key] = chunk
+        while len(self.render_chunks) > RENDER_CHUNK_BUDGET:
+            self.render_chunks.popitem(last=False)
+        return chunk
 
     def draw(self, surface, camera, scale_factor, offset, viewport):
-        for tile in self.tiles:
-            rect = pygame.Rect(
-                int(tile.x * scale_factor + offset.x - camera.x * scale_factor),
-                int(tile.y * scale_factor + offset.y - camera.y * scale_factor),
-                int(TILE_SIZE * scale_factor),
-                int(TILE_SIZE * scale_factor)
-            )
-            if rect.colliderect(viewport):
-                pygame.draw.rect(surface, CYAN, rect, 1)
+        if self.render_scale != scale_factor:
+            self.clear_render_cache()
+            self.render_scale = scale_factor
+        chunk_world_size = LEVEL_CHUNK_TILES * TILE_SIZE
+        # Видимая часть уровня в мировых координатах
+        left = camera.x + (viewport.left - offset.x) / scale_factor
+        top = camera.y + (viewport.top - offset.y) / scale_factor
+        right = camera.x + (viewport.right - offset.x) / scale_factor
+        bottom = camera.y + (viewport.bottom - offset.y) / scale_factor
+        first_chunk_x = max(0, int(left // chunk_world_size))
+        first_chunk_y = max(0, int(top // chunk_world_size))
+        last_chunk_x = min((self.width - 1) // LEVEL_CHUNK_TILES, int(right // chunk_world_size))
+        last_chunk_y = min((self.height - 1) // LEVEL_CHUNK_TILES, int(bottom // chunk_world_size))
+        old_clip = surface.get_clip()
+        surface.set_clip(viewport)
+        for chunk_y in range(first_chunk_y, last_chunk_y + 1):
+            for chunk_x in range(first_chunk_x, last_chunk_x + 1):
+                chunk = self.get_render_chunk(chunk_x, chunk_y, scale_factor)
+                if chunk:
+                    surface.blit(chunk, (
+                        int(chunk_x * chunk_world_size * scale_factor + offset.x - camera.x * scale_factor),
+                        int(chunk_y * chunk_world_size * scale_factor + offset.y - camera.y * scale_factor)
+                    ))
+        surface.set_clip(old_clip)
+        self.prefetch_render_chunk(camera, first_chunk_x, first_chunk_y, last_chunk_x, last_chunk_y, scale_factor)
+
+    def prefetch_render_chunk(self, camera, first_chunk_x, first_chunk_y, last_chunk_x, last_chunk_y, scale_factor):
+        """Отрисовывает заранее один чанк, который скоро покажется по ходу камеры."""
+        last_camera = self.last_camera
+        self.last_camera = (camera.x, camera.y)
+        if last_camera is None:
+            return
+        step_x = (camera.x > last_camera[0]) - (camera.x < last_camera[0])
+        step_y = (camera.y > last_camera[1]) - (camera.y < last_camera[1])
+        if not step_x and not step_y:
+            return
+        if step_x:
+            # Следующий столбец чанков по ходу камеры
+            column = last_chunk_x + 1 if step_x > 0 else first_chunk_x - 1
+            keys = [(column, chunk_y) for chunk_y in range(first_chunk_y, last_chunk_y + 1)]
+        else:
+            keys = []
+        if step_y:
+            row = last_chunk_y + 1 if step_y > 0 else first_chunk_y - 1
+            keys += [(chunk_x, row) for chunk_x in range(first_chunk_x, last_chunk_x + 1)]
+        for chunk_x, chunk_y in keys:
+            if (chunk_x, chunk_y) not in self.render_chunks and self.get_chunk(chunk_x, chunk_y) is not None:
+                self.get_render_chunk(chunk_x, chunk_y, scale_factor)
+                return
+
+    def close(self):
+        """Освобождает источник клеток (отображение файла, поток генерации)."""
+        self.source.close()
+
+# Бесконечный уровень
+def crossing_limits(jump_power, speed):
+    """(подъём, прыжок, рывок, крюк): предельные перепады и провалы в тайлах."""
+    jump_height = jump_power * jump_power / (2 * GRAVITY)
+    jump_length = speed * FRICTION * 2 * abs(jump_power) / GRAVITY
+    rise = int(jump_height // TILE_SIZE) - 1
+    jump_gap = int(jump_length // TILE_SIZE) - 1
+    dash_gap = int((jump_length + DASH_DISTANCE) // TILE_SIZE) - 2
+    hook_gap = min(dash_gap + 3, HOOK_RANGE // TILE_SIZE - 1)
+    return rise, jump_gap, dash_gap, hook_gap
+
+class EndlessGenerator:
+    """Строит столбцы чанков слева направо: пол со ступенями и провалы."""
+    def __init__(self, seed, jump_power, speed):
+        self.random = random.Random(seed)
+        self.rise, self.jump_gap, self.dash_gap, self.hook_gap = crossing_limits(jump_power, speed)
+        self.floor = ENDLESS_HEIGHT_TILES - 10  # Верхняя клетка пола
+        self.gap = False  # Идёт ли сейчас провал
+        self.run = ENDLESS_START_TILES  # Сколько клеток осталось до конца участка
+        self.anchor = None  # (x, y) тайла для крюка над текущим провалом
+        self.x = 0  # Следующая клетка по горизонтали
+        self.column = 0  # Следующий столбец чанков
+
+    def next_segment(self):
+        if not self.gap and self.random.random() < 0.55:
+            width = self.random.randint(2, self.hook_gap)
+            self.gap = True
+            self.run = width
+            self.anchor = None
+            if width > self.dash_gap:
+                # Длинный провал: тайл для крюка над серединой, не дальше HOOK_RANGE от края
+                height = 7
+                while height > 3 and math.hypot(width / 2 * TILE_SIZE, height * TILE_SIZE) > HOOK_RANGE * 0.9:
+                    height -= 1
+                self.anchor = (self.x + width // 2, self.floor - height)
+            # После провала можно только спуститься
+            self.floor += self.random.randint(0, 3)
+        else:
+            if not self.gap:
+                # Ступень вверх не выше прыжка или вниз
+                self.floor -= self.random.randint(-3, self.rise)
+            self.gap = False
+            self.run = self.random.randint(3, 10)
+        self.floor = max(12, min(ENDLESS_HEIGHT_TILES - 3, self.floor))
+
+    def generate(self):
+        """Клетки следующего столбца: список чанков по chunk_y (bytes по строкам)."""
+        chunks_y = ENDLESS_HEIGHT_TILES // LEVEL_CHUNK_TILES
+        chunks = [bytearray(LEVEL_CHUNK_TILES * LEVEL_CHUNK_TILES) for _ in range(chunks_y)]
+        for local_x in range(LEVEL_CHUNK_TILES):
+            if self.run <= 0:
+                self.next_segment()
+            if self.gap:
+                if self.anchor is not None and self.anchor[0] == self.x:
+                    row = self.anchor[1]
+                    chunks[row // LEVEL_CHUNK_TILES][row % LEVEL_CHUNK_TILES * LEVEL_CHUNK_TILES + local_x] = TILE_SOLID
+            else:
+                for row in range(self.floor, ENDLESS_HEIGHT_TILES):
+                    chunks[row // LEVEL_CHUNK_TILES][row % LEVEL_CHUNK_TILES * LEVEL_CHUNK_TILES + local_x] = TILE_SOLID
+            self.run -= 1
+            self.x += 1
+        self.column += 1
+        return [bytes(chunk) for chunk in chunks]
+
+class EndlessChunkSource:
+    """Чанки бесконечного уровня, которые генерирует рабочий поток."""
+    def __init__(self, seed, jump_power=-15, speed=5):
+        self.width = ENDLESS_COLUMNS * LEVEL_CHUNK_TILES
+        self.height = ENDLESS_HEIGHT_TILES
+        self.chunks_x = ENDLESS_COLUMNS
+        self.chunks_y = ENDLESS_HEIGHT_TILES // LEVEL_CHUNK_TILES
+        self.generator = EndlessGenerator(seed, jump_power, speed)
+        self.columns = {}  # Столбец -> список чанков по chunk_y
+        self.first_column = 0  # Столбцы левее уже выброшены
+        self.target = -1  # Последний запрошенный столбец
+        self.ready = []  # Сгенерированные, но ещё не принятые (столбец, чанки)
+        self.lock = threading.Lock()
+        self.jobs = queue.Queue()
+        self.thread = None
+        self.use_thread = platform.system() != "Emscripten"
+        self.blocking = False  # Строить столбцы сразу в вызывающем потоке; включается до первого request
+
+    def read_chunk(self, chunk_x, chunk_y):
+        if self.blocking and chunk_x >= self.generator.column:
+            self.request(chunk_x)
+        column = self.columns.get(chunk_x)
+        return column[chunk_y] if column is not None else None
+
+    def request(self, last_column):
+        """Ставит в очередь генерацию столбцов до last_column включительно."""
+        if last_column <= self.target:
+            return
+        self.target = last_column
+        if self.blocking:
+            # Недостроенный столбец - стена, и с потоком запись ввода зависела бы от его скорости
+            while self.generator.column <= last_column:
+                self.columns[self.generator.column] = self.generator.generate()
+        elif self.use_thread:
+            if self.thread is None:
+                self.thread = threading.Thread(target=self.worker, daemon=True)
+                self.thread.start()
+            self.jobs.put(last_column)
+
+    def poll(self):
+        """Принимает готовые столбцы; возвращает их число."""
+        if not self.use_thread and self.generator.column <= self.target:
+            self.ready.append((self.generator.column, self.generator.generate()))
+        with self.lock:
+            ready, self.ready = self.ready, []
+        for column, chunks in ready:
+            if column >= self.first_column:
+                self.columns[column] = chunks
+        return len(ready)
+
+    def discard(self, first_column):
+        """Выбрасывает столбцы левее first_column."""
+        if first_column <= self.first_column:
+            return
+        for column in range(self.first_column, first_column):
+            self.columns.pop(column, None)
+        self.first_column = first_column
+
+    def worker(self):
+        while True:
+            target = self.jobs.get()
+            if target is None:
+                return
+            while self.generator.column <= target:
+                column = self.generator.column
+                chunks = self.generator.generate()
+                with self.lock:
+                    self.ready.append((column, chunks))
+
+    def close(self):
+        if self.thread is not None:
+            self.jobs.put(None)
+
+class EndlessLevel(Level):
+    """Бесконечный уровень: столбцы чанков генерируются впереди камеры и выбрасываются позади."""
+    def __init__(self, seed=None, jump_power=-15, speed=5):
+        self.seed = seed if seed is not None else random.randrange(1 << 30)
+        self.jump_power = jump_power
+        self.speed = speed
+        source = EndlessChunkSource(self.seed, jump_power, speed)
+        super().__init__(source=source)
+        self.spawn = (100, (source.generator.floor - 1) * TILE_SIZE)
+        # Первый экран нужен сразу: строим его столбцы без ожидания потока
+        for column in range(BASE_WIDTH // (LEVEL_CHUNK_TILES * TILE_SIZE) + 2):
+            source.columns[column] = source.generator.generate()
+        source.target = source.generator.column - 1
+
+    def next_run(self):
+        """Уровень следующего забега; его зерно выводится из текущего, чтобы запись ввода повторялась."""
+        level = EndlessLevel(random.Random(self.seed).randrange(1 << 30), self.jump_power, self.speed)
+        level.source.blocking = self.source.blocking
+        return level
+
+    def stream(self, areas, velocity):
+        chunk_size = LEVEL_CHUNK_TILES * TILE_SIZE
+        view = areas[0]
+        self.source.poll()
+        self.source.request(min(self.source.chunks_x - 1, view.right // chunk_size + ENDLESS_AHEAD_COLUMNS))
+        super().stream(areas, velocity)
+
+    def discard_behind(self, x):
+        """Выбрасывает столбцы позади игрока с мировой координатой x; вызывается каждый шаг симуляции."""
+        # По позиции игрока, а не камеры: выброшенный столбец - стена, и запись ввода
+        # не должна зависеть от того, как часто и где опрашивается камера
+        first_column = max(0, int(x - BASE_WIDTH / 2) // LEVEL_CHUNK_SIZE - ENDLESS_BEHIND_COLUMNS)
+        if first_column > self.source.first_column:
+            self.source.discard(first_column)
+            for key in [key for key in self.chunks if key[0] < first_column]:
+                del self.chunks[key]
+                self.render_chunks.pop(key, None)
+
+# Подвижные тела уровня
+class Entity:
+    """Враг, движущаяся платформа или снаряд; столкновения с тайлами - как у игрока."""
+    __slots__ = ("kind", "pos", "vel", "origin", "prev_pos", "rect", "alive")
+
+    def __init__(self, kind, x, y, vel_x=0, vel_y=0):
+        width, height = ENTITY_SIZES[kind]
+        self.kind = kind
+        self.pos = Vector2(x, y)
+        self.vel = Vector2(vel_x, vel_y)
+        self.origin = Vector2(x, y)  # Центр хода платформы
+        self.prev_pos = Vector2(x, y)  # Положение до шага для интерполяции отрисовки
+        self.rect = pygame.Rect(int(x), int(y), width, height)
+        self.alive = True
+
+    def get_render_pos(self, alpha):
+        return self.prev_pos.lerp(self.pos, alpha)
+
+class EntityWorld:
+    """Подвижные тела уровня с широкой фазой sweep-and-prune по оси X."""
+    def __init__(self):
+        self.entities = []  # По возрастанию rect.left
+        self.lefts = []  # Левые края тел в том же порядке (для bisect)
+        self.rects = []  # Прямоугольники тел в том же порядке (для collidelistall)
+        self.max_width = 0
+        self.pairs = []  # Пересекающиеся пары тел после update; список переиспользуется
+        self.hits = []  # Результат query_rect; список переиспользуется
+        self.dirty = False  # Список не отсортирован после add
+        self.count = 0  # Число тел последней расстановки (пишется в запись ввода)
+        self.seed = ENTITY_SEED  # Зерно последней расстановки
+        self.probe = pygame.Rect(0, 0, 0, 0)  # Прямоугольник игрока на пиксель выше опоры
+
+    def clear(self):
+        self.entities.clear()
+        self.lefts.clear()
+        self.rects.clear()
+        self.max_width = 0
+        self.pairs.clear()
+        self.dirty = False
+
+    def add(self, entity):
+        """Добавляет тело; сортировка откладывается до ближайшего запроса или update."""
+        self.entities.append(entity)
+        self.rects.append(entity.rect)
+        self.lefts.append(entity.rect.left)
+        self.max_width = max(self.max_width, entity.rect.width)
+        self.dirty = True
+
+    def populate(self, level, count, seed=ENTITY_SEED, kinds=ENTITY_KINDS):
+        """Расставляет count тел видов kinds по пустым клеткам уровня."""
+        self.clear()
+        self.count = count
+        self.seed = seed
+        rng = random.Random(seed)
+        placements = []
+        attempts = count * 20
+        while len(placements) < count and attempts > 0:
+            attempts -= 1
+            cell_x = rng.randrange(level.width)
+            cell_y = rng.randrange(level.height)
+            if level.is_solid(cell_x, cell_y):
+                continue
+            kind = rng.choice(kinds)
+            x = cell_x * TILE_SIZE
+            y = cell_y * TILE_SIZE
+            if kind == ENTITY_ENEMY:
+                placements.append((kind, x, y, rng.choice((-ENEMY_SPEED, ENEMY_SPEED)), 0))
+            elif kind == ENTITY_PLATFORM:
+                placements.append((kind, x, y, rng.choice((-PLATFORM_SPEED, PLATFORM_SPEED)), 0))
+            else:
+                angle = rng.uniform(0, 2 * math.pi)
+                placements.append((kind, x, y, math.cos(angle) * PROJECTILE_SPEED, math.sin(angle) * PROJECTILE_SPEED))
+        # Тела создаются уже в порядке x (сортировка устойчивая - порядок тот же, что дал бы sort):
+        # соседние по списку тела лежат рядом и в памяти, и проход update/resort не скачет по куче
+        placements.sort(key=itemgetter(1))
+        for kind, x, y, vel_x, vel_y in placements:
+            self.add(Entity(kind, x, y, vel_x, vel_y))
+        self.sort()
+
+    def sort(self):
+        """Полная сортировка после add; списки строятся заново."""
+        self.entities.sort(key=attrgetter("rect.left"))
+        self.rects[:] = [entity.rect for entity in self.entities]
+        self.lefts[:] = [rect.left for rect in self.rects]
+        self.dirty = False
+
+    def resort(self):
+        """Сортировка вставками на месте: за шаг тела сдвигаются мало, и перестановок почти нет."""
+        if self.dirty:
+            self.sort()
+            return
+        entities = self.entities
+        rects = self.rects
+        lefts = self.lefts
+        count = len(entities)
+        if count:
+            lefts[0] = rects[0].left
+        index = 1
+        while index < count:
+            rect = rects[index]
+            left = rect.left
+            lefts[index] = left
+            other = index - 1
+            if lefts[other] > left:
+                entity = entities[index]
+                while other >= 0 and lefts[other] > left:
+                    entities[other + 1] = entities[other]
+                    rects[other + 1] = rects[other]
+                    lefts[other + 1] = lefts[other]
+                    other -= 1
+                entities[other + 1] = entity
+                rects[other + 1] = rect
+                lefts[other + 1] = left
+            index += 1
+
+    def update(self, level, dt):
+        """Шаг всех тел, затем пересортировка и поиск пересекающихся пар."""
+        step = dt * FPS
+        removed = False
+        for entity in self.entities:
+            entity.prev_pos.update(entity.pos)
+            if entity.kind == ENTITY_ENEMY:
+                self.move_enemy(entity, level, step)
+            elif entity.kind == ENTITY_PLATFORM:
+                self.move_platform(entity, step)
+            else:
+                self.move_projectile(entity, level, step)
+            removed |= not entity.alive
+        if removed:
+            self.remove_dead()
+        else:
+            self.resort()
+        self.find_pairs()
+        if self.resolve_pairs():
+            self.remove_dead()
+
+    def remove_dead(self):
+        """Убирает погибшие тела на месте: на место погибшего встаёт последнее, порядок чинит resort."""
+        entities = self.entities
+        rects = self.rects
+        lefts = self.lefts
+        index = 0
+        while index < len(entities):
+            if entities[index].alive:
+                index += 1
+                continue
+            entity = entities.pop()
+            rect = rects.pop()
+            left = lefts.pop()
+            if index < len(entities):
+                entities[index] = entity
+                rects[index] = rect
+                lefts[index] = left
+        self.resort()
+
+    def move_enemy(self, entity, level, step):
+        """Враг ходит по полу под действием гравитации и разворачивается у стен."""
+        rect = entity.rect
+        entity.vel.y = clamp(entity.vel.y + GRAVITY * step, -math.inf, 20)
+        entity.pos.y += entity.vel.y * step
+        rect.y = int(entity.pos.y)
+        tile = level.first_collision(rect)
+        if tile is not None:
+            if entity.vel.y > 0:
+                rect.bottom = tile.top
+            else:
+                rect.top = tile.bottom
+            entity.pos.y = rect.y
+            entity.vel.y = 0
+        entity.pos.x += entity.vel.x * step
+        rect.x = int(entity.pos.x)
+        tile = level.first_collision(rect)
+        if tile is not None:
+            if entity.vel.x > 0:
+                rect.right = tile.left
+            else:
+                rect.left = tile.right
+            entity.pos.x = rect.x
+            entity.vel.x = -entity.vel.x
+        if rect.top > level.height * TILE_SIZE:
+            entity.alive = False  # Упал за пределы уровня
+
+    def move_platform(self, entity, step):
+        """Платформа ходит по горизонтали на PLATFORM_TRAVEL от начальной точки, сквозь тайлы."""
+        entity.pos.x += entity.vel.x * step
+        if (entity.pos.x - entity.origin.x) * entity.vel.x > PLATFORM_TRAVEL * abs(entity.vel.x):
+            entity.vel.x = -entity.vel.x
+        entity.rect.x = int(entity.pos.x)
+
+    def move_projectile(self, entity, level, step):
+        """Снаряд летит по прямой и исчезает в первом тайле."""
+        entity.pos.x += entity.vel.x * step
+        entity.pos.y += entity.vel.y * step
+        entity.rect.x = int(entity.pos.x)
+        entity.rect.y = int(entity.pos.y)
+        if level.collides(entity.rect) or not (0 <= entity.rect.centerx < level.width * TILE_SIZE
+                                               and 0 <= entity.rect.centery < level.height * TILE_SIZE):
+            entity.alive = False
+
+    def find_pairs(self):
+        """Пересекающиеся пары: каждое тело проверяется только с соседями, перекрывающими его по X."""
+        pairs = self.pairs
+        pairs.clear()
+        entities = self.entities
+        lefts = self.lefts
+        rects = self.rects
+        count = len(rects)
+        index = 0
+        while index < count:
+            rect = rects[index]
+            right = rect.right
+            other = index + 1
+            while other < count and lefts[other] < right:
+                if rect.colliderect(rects[other]):
+                    pairs.append((entities[index], entities[other]))
+                other += 1
+            index += 1
+        return pairs
+
+    def resolve_pairs(self):
+        """Снаряд уничтожает врага, враги расходятся. Возвращает True, если кто-то погиб."""
+        removed = False
+        for first, second in self.pairs:
+            if not (first.alive and second.alive):
+                continue
+            first_kind = first.kind
+            second_kind = second.kind
+            if first_kind == ENTITY_ENEMY and second_kind == ENTITY_PROJECTILE or first_kind == ENTITY_PROJECTILE and second_kind == ENTITY_ENEMY:
+                first.alive = second.alive = False
+                removed = True
+            elif first_kind == ENTITY_ENEMY and second_kind == ENTITY_ENEMY:
+                left, right = (first, second) if first.rect.centerx <= second.rect.centerx else (second, first)
+                left.vel.x = -abs(left.vel.x)
+                right.vel.x = abs(right.vel.x)
+        return removed
+
+    def query_rect(self, rect):
+        """Живые тела, пересекающие rect (мировые координаты); список действителен до следующего вызова."""
+        if self.dirty:
+            self.sort()
+        hits = self.hits
+        hits.clear()
+        lefts = self.lefts
+        rects = self.rects
+        index = bisect.bisect_left(lefts, rect.left - self.max_width + 1)
+        end = bisect.bisect_left(lefts, rect.right, index)
+        while index < end:
+            if rect.colliderect(rects[index]) and self.entities[index].alive:
+                hits.append(self.entities[index])
+            index += 1
+        return hits
+
+    def query_segment(self, start, end):
+        """Ближайшее к start тело на отрезке start-end: (тело, точка входа) или None."""
+        left = math.floor(min(start[0], end[0]))
+        top = math.floor(min(start[1], end[1]))
+        box = pygame.Rect(left, top, math.ceil(max(start[0], end[0])) - left + 1, math.ceil(max(start[1], end[1])) - top + 1)
+        best = None
+        best_distance = 0
+        for entity in self.query_rect(box):
+            clipped = entity.rect.clipline(start, end)
+            if not clipped:
+                continue
+            point = clipped[0]
+            distance = (point[0] - start[0]) ** 2 + (point[1] - start[1]) ** 2
+            if best is None or distance < best_distance:
+                best = (entity, Vector2(point))
+                best_distance = distance
+        return best
+
+# Состояние клавиш для headless-режима
+class KeyState:
+    """Набор нажатых клавиш с той же индексацией, что у pygame.key.get_pressed()."""
+    def __init__(self, pressed=()):
+        self.pressed = set(pressed)
+
+    def __getitem__(self, key):
+        return key in self.pressed
+
+# Ввод кадра игры
+class InputSnapshot:
+    """Ввод одного кадра: клавиши читаются один раз, действия собираются из событий."""
+    def __init__(self, frame):
+        self.frame = frame  # Номер кадра игры (для задержки ввода)
+        self.time = time.perf_counter()
+        self.actions = []
+        self.tapped = set()
+        self.keys = KeyState()
+
+    def key_down(self, key):
+        if key in RECORDED_KEYS:
+            self.tapped.add(key)
+
+    def finish(self):
+        """Читает удерживаемые клавиши; возвращает сам снимок."""
+        pressed = pygame.key.get_pressed()
+        self.keys = KeyState(key for key in RECORDED_KEYS if pressed[key] or key in self.tapped)
+        return self
+
+# Источник ввода по сценарию вместо клавиатуры
+class ScriptedInput:
+    """Воспроизводит сценарий ввода по номерам шагов симуляции."""
+    def __init__(self, script=()):
+        self.script = sorted(script, key=lambda entry: entry[0])
+        self.index = 0
+        self.keys = KeyState()
+
+    def poll(self, step):
+        """Возвращает (клавиши, действия) для шага step."""
+        actions = []
+        while self.index < len(self.script) and self.script[self.index][0] <= step:
+            entry = self.script[self.index]
+            if entry[1] == "keydown":
+                self.keys.pressed.add(entry[2])
+            elif entry[1] == "keyup":
+                self.keys.pressed.discard(entry[2])
+            else:
+                actions.append(entry[1:])
+            self.index += 1
+        return self.keys, actions
+
+def order_actions(actions):
+    """Действия шага в порядке ACTION_ORDER, по одному каждого вида."""
+    if len(actions) < 2:
+        return actions
+    ordered = []
+    for kind in ACTION_ORDER:
+        for action in actions:
+            if action[0] == kind:
+                ordered.append(tuple(action))
+                break
+    return ordered
+
+def apply_input(player, keys, actions, recorder=None):
+    """Применяет ввод шага к игроку (общий путь для игры, headless и повтора)."""
+    if recorder is not None:
+        recorder.record(keys, order_actions(actions))
+    if actions:
+        # Тот же порядок, что у order_actions, но без нового списка и итераторов
+        kind_index = 0
+        while kind_index < len(ACTION_ORDER):
+            index = 0
+            while index < len(actions):
+                if actions[index][0] == ACTION_ORDER[kind_index]:
+                    player.apply_action(actions[index])
+                    break
+                index += 1
+            kind_index += 1
+    player.apply_movement_input(keys)
+
+def key_mask(keys):
+    """Битовая маска RECORDED_KEYS по состоянию клавиш."""
+    mask = 0
+    for bit, key in enumerate(RECORDED_KEYS):
+        if keys[key]:
+            mask |= 1 << bit
+    return mask
+
+def session_settings(level, entities):
+    """Настройки, от которых зависит симуляция сессии на уровне level."""
+    if isinstance(level, EndlessLevel):
+        settings = {"level_kind": "endless", "level": None, "seed": level.seed,
+                    "jump_power": level.jump_power, "speed": level.speed}
+    else:
+        settings = {"level_kind": "file", "level": level.path,
+                    "level_hash": file_sha1(level.path) if level.path is not None else None}
+    settings["rope"] = rope_mode
+    settings["entities"] = entities.count
+    settings["entity_seed"] = entities.seed
+    return settings
+
+# Запись ввода по шагам симуляции
+class InputRecorder:
+    """Пишет настройки сессии и ввод каждого шага в двоичный файл."""
+    def __init__(self, path, settings):
+        encoded = json.dumps(settings).encode("utf-8")
+        self.file = open(path, "wb")
+        self.file.write(REPLAY_HEADER.pack(REPLAY_MAGIC, REPLAY_VERSION, SIM_HZ, len(encoded)))
+        self.file.write(encoded)
+        self.mask = 0
+        self.repeat = 0
+        self.steps = 0
+
+    def record(self, keys, actions):
+        mask = key_mask(keys)
+        self.steps += 1
+        if not actions and self.repeat and mask == self.mask and self.repeat < REPLAY_MAX_REPEAT:
+            self.repeat += 1
+            return
+        self.flush()
+        if not actions:
+            self.mask = mask
+            self.repeat = 1
+            return
+        flags = 0
+        for action in actions:
+            flags |= 1 << ACTION_ORDER.index(action[0])
+        self.file.write(REPLAY_RECORD.pack(1, mask, flags))
+        for action in actions:
+            if action[0] == ACTION_HOOK:
+                self.file.write(REPLAY_POINT.pack(action[1], action[2]))
+
+    def flush(self):
+        if self.repeat:
+            self.file.write(REPLAY_RECORD.pack(self.repeat, self.mask, 0))
+            self.repeat = 0
+
+    def close(self, final_pos):
+        """Дописывает конец записи с итоговой позицией игрока для проверки повтора."""
+        self.flush()
+        self.file.write(REPLAY_RECORD.pack(0, 0, 0))
+        self.file.write(REPLAY_POINT.pack(final_pos.x, final_pos.y))
+        self.file.close()
+
+# Повтор записанного ввода
+class ReplayInput:
+    """Источник ввода из файла InputRecorder с тем же poll(), что у ScriptedInput."""
+    def __init__(self, path):
+        with open(path, "rb") as file:
+            data = file.read()
+        magic, version, sim_hz, settings_size = REPLAY_HEADER.unpack_from(data, 0)
+        if magic != REPLAY_MAGIC or version != REPLAY_VERSION:
+            raise ValueError(f"{path}: не файл записи ввода версии {REPLAY_VERSION}")
+        if sim_hz != SIM_HZ:
+            raise ValueError(f"{path}: записан при SIM_HZ={sim_hz}, а сейчас {SIM_HZ}")
+        position = REPLAY_HEADER.size + settings_size
+        self.settings = json.loads(data[REPLAY_HEADER.size:position].decode("utf-8"))
+        self.records = []  # (повторы, клавиши, действия)
+        self.final_pos = None
+        masks = {}
+        while position < len(data):
+            repeat, mask, flags = REPLAY_RECORD.unpack_from(data, position)
+            position += REPLAY_RECORD.size
+            if repeat == 0:
+                self.final_pos = Vector2(REPLAY_POINT.unpack_from(data, position))
+                break
+            actions = []
+            for bit, kind in enumerate(ACTION_ORDER):
+                if flags & (1 << bit):
+                    if kind == ACTION_HOOK:
+                        actions.append((kind,) + REPLAY_POINT.unpack_from(data, position))
+                        position += REPLAY_POINT.size
+                    else:
+                        actions.append((kind,))
+            if mask not in masks:
+                masks[mask] = KeyState(key for bit, key in enumerate(RECORDED_KEYS) if mask & (1 << bit))
+            self.records.append((repeat, masks[mask], actions))
+        self.steps = sum(record[0] for record in self.records)
+        self.index = 0
+        self.used = 0  # Сколько повторов текущей записи уже выдано
+        self.finished = not self.records
+        self.empty_keys = KeyState()
+
+    def poll(self, step):
+        """Ввод следующего шага; шаги выдаются подряд, step не используется."""
+        if self.finished:
+            return self.empty_keys, ()
+        # Действия бывают только у записей из одного шага
+        repeat, keys, actions = self.records[self.index]
+        self.used += 1
+        if self.used >= repeat:
+            self.index += 1
+            self.used = 0
+            self.finished = self.index >= len(self.records)
+        return keys, actions
+
+    def apply_settings(self):
+        """Восстанавливает глобальные настройки сессии из записи."""
+        mode = self.settings.get("rope", ROPE_RIGID)
+        if mode != rope_mode:
+            print(f"Запись сделана с верёвкой {mode}, режим переключён")
+            set_rope_mode(mode)
+            if rope_mode != mode:
+                print("Режим верёвки записи недоступен: повтор может разойтись")
+
+    def populate(self, world, level):
+        """Расставляет тела на level так же, как в записанной сессии."""
+        world.populate(level, self.settings.get("entities", 0), self.settings.get("entity_seed", ENTITY_SEED))
+
+    def load_level(self, current=None):
+        """Уровень записи: current, если это он, иначе загружается заново; расхождения выводятся."""
+        settings = self.settings
+        path = settings.get("level")
+        if settings.get("level_kind") == "endless":
+            if isinstance(current, EndlessLevel) and current.seed == settings["seed"]:
+                return current
+            if current is not None:
+                print(f"Запись сделана в бесконечном забеге (зерно {settings['seed']}), он начинается заново")
+            return EndlessLevel(settings["seed"], settings["jump_power"], settings["speed"])
+        if current is not None and current.path == path and not isinstance(current, EndlessLevel):
+            level = current
+        else:
+            if current is not None:
+                print(f"Запись сделана на уровне {path or 'по умолчанию'}, он загружается вместо текущего")
+            level = Level(path=path) if path is not None else Level(DEFAULT_LEVEL_MAP)
+        if level.path != path:
+            print(f"Уровень записи {path} не загрузился: повтор может разойтись")
+        elif path is not None and file_sha1(path) != self.settings.get("level_hash"):
+            print(f"Файл уровня {path} изменился после записи: повтор может разойтись")
+        return level
+
+def make_demo_script(steps):
+    """Сценарий для демонстрации и замеров: бег, прыжки, рывки и крюк."""
+    script = []
+    for start in range(0, steps, SIM_HZ * 4):
+        script.append((start, "keydown", pygame.K_d))
+        script.append((start + SIM_HZ * 2, "keyup", pygame.K_d))
+        script.append((start + SIM_HZ * 2, "keydown", pygame.K_a))
+        script.append((start + SIM_HZ * 4 - 1, "keyup", pygame.K_a))
+        script.append((start + SIM_HZ // 2, ACTION_JUMP))
+        script.append((start + SIM_HZ, ACTION_DASH))
+        script.append((start + SIM_HZ * 3 // 2, ACTION_HOOK, 700, 100))
+        script.append((start + SIM_HZ * 3, ACTION_RELEASE))
+    return script
+
+def stream_level(level, player, camera):
+    """Подгружает чанки потокового уровня под камерой и в досягаемости крюка."""
+    if level.chunk_budget is None:
+        return  # Уровень целиком в памяти, чанки строятся по обращению
+    view = pygame.Rect(int(camera.x), int(camera.y), BASE_WIDTH, BASE_HEIGHT)
+    reach = pygame.Rect(0, 0, HOOK_RANGE * 2, HOOK_RANGE * 2)
+    reach.center = (int(player.pos.x), int(player.pos.y))
+    level.stream((view, reach), player.vel)
+
+def update_entities(world, level, player, dt):
+    """Шаг подвижных тел после Player.update: крюк и касания игрока с телами."""
+    if not world.entities:
+        return
+    step = dt * FPS
+    world.update(level, dt)
+    removed = False
+    hook = player.hook
+    if hook.state == "extending":
+        # Крюк сбивает врагов и снаряды и отскакивает от платформ
+        hit = world.query_segment(hook.last_pos, hook.pos)
+        if hit is not None:
+            entity, point = hit
+            if entity.kind != ENTITY_PLATFORM:
+                entity.alive = False
+                removed = True
+            hook.pos.update(point)
+            hook.state = "retracting"
+            player.set_retract_velocity()
+    probe = world.probe
+    probe.update(player.rect.x, player.rect.y, player.rect.width, player.rect.height + 1)
+    for entity in world.query_rect(probe):
+        if entity.kind == ENTITY_PLATFORM:
+            # Платформа проницаема снизу; стоящего на ней игрока она везёт с собой
+            if hook.state != "attached" and player.vel.y >= 0 and player.rect.bottom - entity.rect.top <= PLATFORM_SNAP:
+                player.rect.bottom = entity.rect.top
+                player.pos.y = player.rect.y
+                player.vel.y = 0
+                player.on_ground = True
+                player.pos.x += entity.vel.x * step
+                player.rect.x = int(player.pos.x)
+                if level.collides(player.rect):
+                    player.pos.x -= entity.vel.x * step
+                    player.rect.x = int(player.pos.x)
+        elif entity.alive and player.rect.colliderect(entity.rect):
+            direction = 1 if player.rect.centerx >= entity.rect.centerx else -1
+            if hook.state == "attached":
+                player.release_hook()
+            player.vel.x = direction * KNOCKBACK_SPEED
+            player.vel.y = -KNOCKBACK_SPEED
+            if entity.kind == ENTITY_PROJECTILE:
+                entity.alive = False
+                removed = True
+            else:
+                entity.vel.x = -direction * abs(entity.vel.x)
+    if removed:
+        world.remove_dead()
+
+# Симуляция без окна, звука и шрифтов
+class HeadlessSimulation:
+    """Прогоняет Player.update на уровне без дисплея с максимальной скоростью."""
+    def __init__(self, level=None, player=None, input_source=None, dt=SIM_DT, recorder=None, entities=None):
+        if isinstance(input_source, ReplayInput):
+            # Повтор идёт с настройками и на уровне из записи
+            input_source.apply_settings()
+            if level is None:
+                level = input_source.load_level()
+        elif level is None:
+            level = Level()
+        if isinstance(level, EndlessLevel):
+            level.source.blocking = True
+        self.level = level
+        self.player = player if player is not None else Player(*level.spawn)
+        if entities is None:
+            entities = EntityWorld()
+            if isinstance(input_source, ReplayInput):
+                input_source.populate(entities, level)
+            else:
+                entities.populate(level, entity_count)
+        self.entities = entities
+        self.input_source = input_source if input_source is not None else ScriptedInput()
+        self.dt = dt
+        self.recorder = recorder
+        self.step_count = 0  # Шагов, выполненных run
+        self.stream_countdown = 0  # Шагов до следующей подгрузки чанков
+        self.camera = Vector2(0, 0)  # Камера для stream_level, меняется на месте
+
+    def step(self, keys, actions=()):
+        """Один шаг симуляции с заданным вводом (порядок как в Game); шаги считает run."""
+        apply_input(self.player, keys, actions, self.recorder)
+        self.player.save_state()
+        self.player.update(self.level, self.dt, keys)
+        update_entities(self.entities, self.level, self.player, self.dt)
+        if isinstance(self.level, EndlessLevel):
+            if self.player.rect.top > self.level.height * TILE_SIZE:
+                # Как Game.restart_endless
+                self.level.close()
+                self.level = self.level.next_run()
+                self.player.reset(*self.level.spawn)
+            self.level.discard_behind(self.player.pos.x)
+        # Обратный отсчёт вместо номера шага: step ничего не выделяет, а номер больше 256 - новый int
+        if self.stream_countdown == 0:
+            self.camera.x = self.player.pos.x - BASE_WIDTH / 2
+            self.camera.y = self.player.pos.y - BASE_HEIGHT / 2
+            stream_level(self.level, self.player, self.camera)
+            self.stream_countdown = STREAM_INTERVAL_STEPS
+        self.stream_countdown -= 1
+
+    def run(self, steps):
+        """Выполняет steps шагов из источника ввода и возвращает шагов в секунду."""
+        start = time.perf_counter()
+        for _ in range(steps):
+            keys, actions = self.input_source.poll(self.step_count)
+            self.step(keys, actions)
+            self.step_count += 1
+        elapsed = time.perf_counter() - start
+        return steps / elapsed if elapsed > 0 else float('inf')
 
 # Класс HUD
 class HUD:
     def __init__(self, player, clock):
         self.player = player
         self.clock = clock
+        self.font = None
         self.update_font(scale_factor)
 
     def update_font(self, scale_factor):
+        if self.font is not None:
+            text_cache.invalidate(self.font)
         self.font = pygame.font.SysFont('monospace', int(36 * scale_factor))
 
     def draw(self, surface, offset, viewport):
         hud_x = int(offset.x + 10 * scale_factor)
         hud_y = int(offset.y + 10 * scale_factor)
-        hook_status = "Hook: " + (self.player.hook_state or "Ready")
-        text = self.font.render(hook_status, True, WHITE)
+        hook_status = "Hook: " + (self.player.hook.state or "Ready")
+        text = text_cache.render(self.font, hook_status, WHITE)
         text_rect = text.get_rect(topleft=(hud_x, hud_y))
         if viewport.colliderect(text_rect):
             surface.blit(text, text_rect)
         fps = str(int(self.clock.get_fps()))
-        fps_text = self.font.render(f"FPS: {fps}", True, WHITE)
+        fps_text = text_cache.render(self.font, f"FPS: {fps}", WHITE)
         fps_rect = fps_text.get_rect(topleft=(hud_x, hud_y + int(40 * scale_factor)))
         if viewport.colliderect(fps_rect):
             surface.blit(fps_text, fps_rect)
-        rope_length_text = f"Rope Length: {int(self.player.rope_length)}"
-        rope_text = self.font.render(rope_length_text, True, WHITE)
+        rope_length_text = f"Rope Length: {int(self.player.hook.length)}"
+        rope_text = text_cache.render(self.font, rope_length_text, WHITE)
         rope_rect = rope_text.get_rect(topleft=(hud_x, hud_y + int(80 * scale_factor)))
         if viewport.colliderect(rope_rect):
             surface.blit(rope_text, rope_rect)
         dash_text = f"Dash: {'Ready' if self.player.dash_timer <= 0 else f'{self.player.dash_timer:.1f}s'}"
-        dash_text_surface = self.font.render(dash_text, True, WHITE)
+        dash_text_surface = text_cache.render(self.font, dash_text, WHITE)
         dash_rect = dash_text_surface.get_rect(topleft=(hud_x, hud_y + int(120 * scale_factor)))
         if viewport.colliderect(dash_rect):
             surface.blit(dash_text_surface, dash_rect)
         health_text = f"Health: {self.player.health}"
-        health_surface = self.font.render(health_text, True, WHITE)
+        health_surface = text_cache.render(self.font, health_text, WHITE)
         health_rect = health_surface.get_rect(topleft=(hud_x, hud_y + int(160 * scale_factor)))
         if viewport.colliderect(health_rect):
             surface.blit(health_surface, health_rect)
@@ -717,74 +3057,165 @@ class Game:
         self.clock = pygame.time.Clock()
         self.player = Player(100, 600)
         self.level = Level()
+        self.main_level = self.level  # Уровень кнопки "Играть"; бесконечные уровни создаются заново
+        self.entities = EntityWorld()
+        self.entities.populate(self.level, entity_count)
         self.camera = Vector2(0, 0)
+        self.prev_camera = Vector2(0, 0)
         self.hud = HUD(self.player, self.clock)
         self.running = True
-        self.dt = 1 / FPS
-
-    def reset(self):
-        """Сброс состояния игры для новой сессии."""
-        self.player = Player(100, 600)
-        self.level = Level()
-        self.camera = Vector2(0, 0)
-        self.hud = HUD(self.player, self.clock)
+        self.accumulator = 0.0  # Накопленное, но ещё не просимулированное время
+        self.alpha = 0.0  # Доля шага для интерполяции отрисовки
+        self.discard_frame_time = False  # Не засчитывать время, проведённое в паузе
+        self.pending_actions = []  # Действия из событий, ждущие ближайшего шага
+        self.pending_snapshots = []  # Снимки ввода, из которых пришли pending_actions
+        self.snapshot = InputSnapshot(0)  # Ввод текущего кадра
+        self.frame_count = 0
+        self.step_count = 0
+        self.recorder = None
+        self.replay = None
+
+    def reset(self, level=None):
+        """Сброс состояния игры для новой сессии на уровне level (по умолчанию - текущем)."""
+        if level is not None and level is not self.level:
+            if self.level is not self.main_level:
+                self.level.close()
+            self.level = level
+        self.player.reset(*self.level.spawn)
+        # Враги и платформы расставлены только на основном уровне
+        self.entities.populate(self.level, entity_count if self.level is self.main_level else 0)
+        self.camera.update(0, 0)
+        self.prev_camera.update(0, 0)
         self.running = True
-        self.dt = 1 / FPS
+        self.accumulator = 0.0  # Накопленное, но ещё не просимулированное время
+        self.alpha = 0.0  # Доля шага для интерполяции отрисовки
+        self.discard_frame_time = False  # Не засчитывать время, проведённое в паузе
+        self.pending_actions = []  # Действия из событий, ждущие ближайшего шага
+        self.pending_snapshots = []  # Снимки ввода, из которых пришли pending_actions
+        self.snapshot = InputSnapshot(0)  # Ввод текущего кадра
+        self.frame_count = 0
+        self.step_count = 0
+        self.recorder = None
+        self.replay = None
+
+    def start_input_log(self):
+        """Начинает запись или повтор ввода сессии, если они заданы в командной строке."""
+        if replay_path:
+            try:
+                replay = ReplayInput(replay_path)
+            except Exception as e:
+                print(f"Ошибка загрузки записи ввода: {e}")
+            else:
+                replay.apply_settings()
+                level = replay.load_level(self.level)
+                if level is not self.level:
+                    self.reset(level)  # reset сбрасывает и self.replay, поэтому он задаётся после
+                replay.populate(self.entities, self.level)
+                self.replay = replay
+        if record_path:
+            try:
+                self.recorder = InputRecorder(record_path, session_settings(self.level, self.entities))
+            except Exception as e:
+                print(f"Ошибка создания записи ввода: {e}")
+                self.recorder = None
+        if (self.recorder is not None or self.replay is not None) and isinstance(self.level, EndlessLevel):
+            self.level.source.blocking = True
+
+    def stop_input_log(self):
+        if self.recorder is not None:
+            self.recorder.close(self.player.pos)
+            print(f"Ввод записан: {self.recorder.steps} шагов в {record_path}")
+            self.recorder = None
+
+    def check_replay(self):
+        """Сверяет позицию игрока с записью сразу после последнего шага повтора."""
+        if self.replay.final_pos is not None:
+            match = "совпадает" if self.player.pos == self.replay.final_pos else "НЕ совпадает"
+            print(f"Повтор завершён, позиция игрока {match} с записью")
 
     async def run(self, current_menu):
+        previous_state = None
+        self.start_input_log()
+        input_latency.reset()
         while self.running and current_menu[0] in ["game", "pause", "settings"]:
-            if current_menu[0] == "game":
+            state = current_menu[0]
+            update_backgrounds()
+            if state == "game":
+                if previous_state in ["pause", "settings"]:
+                    self.discard_frame_time = True
+                profiler.start()
                 self.handle_events(current_menu)
+                profiler.mark("events")
                 self.update()
                 self.draw()
-            elif current_menu[0] == "pause":
+                profiler.draw_overlay(self.screen, self.hud.font, viewport)
+                profiler.mark("hud")
+                pygame.display.flip()
+                input_latency.presented(self.frame_count)
+                self.frame_count += 1
+                profiler.mark("flip")
+                profiler.end_frame()
+            elif state == "pause":
                 self.handle_pause_events(current_menu)
-                self.draw_pause()
-            elif current_menu[0] == "settings":
+                dirty_regions.render(self.screen, self.draw_pause)
+            elif state == "settings":
                 self.handle_settings_events(current_menu)
-                self.draw_settings()
-            self.clock.tick(FPS)
-            pygame.display.flip()
-            await asyncio.sleep(1.0 / FPS)
+                dirty_regions.render(self.screen, self.draw_settings)
+            if current_menu[0] != state:
+                # Следующий экран рисуется целиком
+                dirty_regions.mark_all()
+            previous_state = state
+            self.clock.tick()
+            # Статистику темпа собираем только по игровым кадрам
+            await frame_scheduler.wait(record=state == "game")
         if not self.running:
             current_menu[0] = "main"
             current_menu[1] = None
-        self.reset()
+        frame_scheduler.report()
+        input_latency.report()
+        self.stop_input_log()
+        self.reset(self.main_level)
 
     def handle_events(self, current_menu):
+        """Разбирает события кадра и снимает ввод кадра в self.snapshot."""
+        snapshot = InputSnapshot(self.frame_count)
         for event in pygame.event.get():
             if event.type == pygame.QUIT:
                 self.running = False
             elif event.type == pygame.VIDEORESIZE:
                 handle_resize(event.w, event.h)
             elif event.type == pygame.KEYDOWN:
+                snapshot.key_down(event.key)
                 if event.key == pygame.K_ESCAPE:
                     current_menu[0] = "pause"
                     current_menu[1] = "game"
                 elif event.key == pygame.K_SPACE:
-                    self.player.jump()
+                    snapshot.actions.append((ACTION_JUMP,))
                 elif event.key == pygame.K_r:
-                    self.player.release_hook()
+                    snapshot.actions.append((ACTION_RELEASE,))
                 elif event.key == pygame.K_LSHIFT:
-                    self.player.dash()
+                    snapshot.actions.append((ACTION_DASH,))
                 elif event.key == pygame.K_h:
                     self.player.health -= 1
+                elif event.key == pygame.K_F3:
+                    profiler.toggle_overlay()
             elif event.type == pygame.MOUSEBUTTONDOWN:
                 if event.button == 1:
-                    mouse_pos = Vector2(event.pos)
-                    self.player.launch_hook(mouse_pos, scale_factor, offset, self.camera)
+                    snapshot.actions.append(self.hook_action(Vector2(event.pos)))
             elif event.type == pygame.FINGERDOWN:
-                mouse_pos = Vector2(event.x * WIDTH, event.y * HEIGHT)
-                self.player.launch_hook(mouse_pos, scale_factor, offset, self.camera)
-        keys = pygame.key.get_pressed()
-        if self.player.hook_state != "attached" and self.player.dash_time <= 0:
-            if keys[pygame.K_a] or keys[pygame.K_LEFT]:
-                self.player.move_left()
-            if keys[pygame.K_d] or keys[pygame.K_RIGHT]:
-                self.player.move_right()
+                snapshot.actions.append(self.hook_action(Vector2(event.x * WIDTH, event.y * HEIGHT)))
+        self.snapshot = snapshot.finish()
+
+    def hook_action(self, mouse_pos):
+        """Действие выстрела крюком; цель переводится в мировые координаты сразу."""
+        target = Vector2(
+            (mouse_pos.x - offset.x) / scale_factor + self.camera.x,
+            (mouse_pos.y - offset.y) / scale_factor + self.camera.y
+        )
+        return (ACTION_HOOK, target.x, target.y)
 
     def handle_pause_events(self, current_menu):
-        for event in pygame.event.get():
+        for event in wait_for_events():
             if event.type == pygame.QUIT:
                 self.running = False
             elif event.type == pygame.VIDEORESIZE:
@@ -805,11 +3236,13 @@ class Game:
                             current_menu[1] = "pause"
                         elif button.text == "Главное меню":
                             self.running = False
+        update_menu_elements(pause_buttons, pygame.mouse.get_pos(), False)
 
     def handle_settings_events(self, current_menu):
+        events = wait_for_events()
         mouse_pos = pygame.mouse.get_pos()
         mouse_pressed = pygame.mouse.get_pressed()[0]
-        for event in pygame.event.get():
+        for event in events:
             if event.type == pygame.QUIT:
                 self.running = False
             elif event.type == pygame.VIDEORESIZE:
@@ -818,7 +3251,13 @@ class Game:
                 mouse_pos = Vector2(event.pos) if event.type == pygame.MOUSEBUTTONDOWN else Vector2(event.x * WIDTH, event.y * HEIGHT)
                 for element in settings_menu_elements:
                     if isinstance(element, Button) and element.is_hovered(mouse_pos):
-                        if element.text == "Назад":
+                        if element is rope_button:
+                            if self.recorder is not None or self.replay is not None:
+                                # Режим верёвки пишется в заголовок записи один раз на сессию
+                                print("Режим верёвки нельзя менять во время записи или повтора ввода")
+                            else:
+                                toggle_rope_mode()
+                        elif element.text == "Назад":
                             if current_menu[1] == "pause":
                                 current_menu[0] = "pause"
                                 current_menu[1] = "game"
@@ -826,14 +3265,70 @@ class Game:
                                 current_menu[0] = "main"
                                 current_menu[1] = None
         # Обновление состояния элементов меню настроек
-        for element in settings_menu_elements:
-            if isinstance(element, Slider):
-                element.update(mouse_pos, mouse_pressed)
-            elif isinstance(element, Button):
-                element.update(mouse_pos)
+        update_menu_elements(settings_menu_elements, mouse_pos, mouse_pressed)
 
     def update(self):
-        self.player.update(self.level, self.dt, pygame.key.get_pressed())
+        """Продвигает симуляцию фиксированными шагами SIM_DT на время прошедшего кадра."""
+        frame_time = min(self.clock.get_time() / 1000.0, MAX_FRAME_TIME)
+        if self.discard_frame_time:
+            frame_time = 0.0
+            self.discard_frame_time = False
+        self.accumulator += frame_time
+        snapshot = self.snapshot
+        if snapshot.actions:
+            # Действия ждут ближайшего шага, даже если в этом кадре шагов нет
+            self.pending_actions.extend(snapshot.actions)
+            self.pending_snapshots.append(snapshot)
+            snapshot.actions = []
+        steps = 0
+        while self.accumulator >= SIM_DT and steps < MAX_SIM_STEPS:
+            replaying = self.replay is not None and not self.replay.finished
+            if replaying:
+                # Во время повтора живой ввод игнорируется
+                keys, actions = self.replay.poll(self.step_count)
+                self.pending_actions = []
+                self.pending_snapshots = []
+            else:
+                keys, actions = snapshot.keys, self.pending_actions
+                self.pending_actions = []
+                for pending in self.pending_snapshots:
+                    input_latency.consumed(pending)
+                self.pending_snapshots = []
+            self.step(keys, actions)
+            if replaying and self.replay.finished:
+                self.check_replay()
+            self.accumulator -= SIM_DT
+            steps += 1
+        if self.accumulator >= SIM_DT:
+            # Не успеваем догнать: отбрасываем остаток, чтобы не копить отставание
+            self.accumulator %= SIM_DT
+        self.alpha = self.accumulator / SIM_DT
+        stream_level(self.level, self.player, self.camera)
+
+    def step(self, keys, actions=()):
+        """Один шаг симуляции длительностью SIM_DT."""
+        apply_input(self.player, keys, actions, self.recorder)
+        self.player.save_state()
+        self.prev_camera.update(self.camera)
+        self.player.update(self.level, SIM_DT, keys)
+        update_entities(self.entities, self.level, self.player, SIM_DT)
+        profiler.mark("entities")
+        if isinstance(self.level, EndlessLevel):
+            if self.player.rect.top > self.level.height * TILE_SIZE:
+                self.restart_endless()
+            self.level.discard_behind(self.player.pos.x)
+        self.update_camera()
+        self.step_count += 1
+
+    def restart_endless(self):
+        """Начинает бесконечный забег заново на новом уровне после падения в провал."""
+        self.level.close()
+        self.level = self.level.next_run()
+        self.player.reset(*self.level.spawn)
+        self.camera.update(0, 0)
+        self.prev_camera.update(0, 0)
+
+    def update_camera(self):
         level_width = self.level.width * TILE_SIZE
         level_height = self.level.height * TILE_SIZE
         half_viewport_width = BASE_WIDTH / 2
@@ -846,32 +3341,63 @@ class Game:
             self.camera.x = (level_width - BASE_WIDTH) / 2
         if level_height < BASE_HEIGHT:
             self.camera.y = (level_height - BASE_HEIGHT) / 2
-        self.dt = self.clock.get_time() / 1000.0
 
     def draw(self):
         self.screen.fill(BLACK)
         if level_background:
             self.screen.blit(level_background, (int(offset.x), int(offset.y)))
-        self.level.draw(self.screen, self.camera, scale_factor, offset, viewport)
+        # Отрисовываем состояние между двумя последними шагами симуляции
+        camera = self.prev_camera.lerp(self.camera, self.alpha)
+        player_pos = self.player.get_render_pos(self.alpha)
+        self.level.draw(self.screen, camera, scale_factor, offset, viewport)
+        profiler.mark("level")
+        self.draw_entities(camera)
+        profiler.mark("entities")
         player_rect = pygame.Rect(
-            int(self.player.rect.x * scale_factor + offset.x - self.camera.x * scale_factor),
-            int(self.player.rect.y * scale_factor + offset.y - self.camera.y * scale_factor),
+            int(int(player_pos.x) * scale_factor + offset.x - camera.x * scale_factor),
+            int(int(player_pos.y) * scale_factor + offset.y - camera.y * scale_factor),
             int(self.player.rect.width * scale_factor),
             int(self.player.rect.height * scale_factor)
         )
         if viewport.colliderect(player_rect):
             frame = self.player.get_current_frame(scale_factor)
             self.screen.blit(frame, player_rect.topleft)
-        if self.player.hook_state:
+        if self.player.hook.state:
+            world_hook_pos = self.player.get_render_hook_pos(self.alpha)
             hook_pos = Vector2(
-                int(self.player.hook_pos.x * scale_factor + offset.x - self.camera.x * scale_factor),
-                int(self.player.hook_pos.y * scale_factor + offset.y - self.camera.y * scale_factor)
+                int(world_hook_pos.x * scale_factor + offset.x - camera.x * scale_factor),
+                int(world_hook_pos.y * scale_factor + offset.y - camera.y * scale_factor)
             )
             player_center = Vector2(int(player_rect.centerx), int(player_rect.centery))
             if viewport.collidepoint(hook_pos):
-                pygame.draw.line(self.screen, WHITE, player_center, hook_pos, int(2 * scale_factor))
+                if self.player.hook.rope is not None:
+                    # Промежуточные частицы без интерполяции: концы совпадают с крюком и игроком
+                    points = [hook_pos]
+                    for x, y in self.player.hook.rope.points[1:-1].tolist():
+                        points.append((x * scale_factor + offset.x - camera.x * scale_factor,
+                                       y * scale_factor + offset.y - camera.y * scale_factor))
+                    points.append(player_center)
+                    pygame.draw.lines(self.screen, WHITE, False, points, int(2 * scale_factor))
+                else:
+                    pygame.draw.line(self.screen, WHITE, player_center, hook_pos, int(2 * scale_factor))
                 pygame.draw.circle(self.screen, WHITE, (int(hook_pos.x), int(hook_pos.y)), int(5 * scale_factor))
+        profiler.mark("player")
         self.hud.draw(self.screen, offset, viewport)
+        profiler.mark("hud")
+
+    def draw_entities(self, camera):
+        """Тела в кадре; отбор через широкую фазу EntityWorld."""
+        view = pygame.Rect(int(camera.x), int(camera.y), BASE_WIDTH, BASE_HEIGHT)
+        for entity in self.entities.query_rect(view):
+            pos = entity.get_render_pos(self.alpha)
+            rect = pygame.Rect(
+                int(int(pos.x) * scale_factor + offset.x - camera.x * scale_factor),
+                int(int(pos.y) * scale_factor + offset.y - camera.y * scale_factor),
+                math.ceil(entity.rect.width * scale_factor),
+                math.ceil(entity.rect.height * scale_factor)
+            )
+            if viewport.colliderect(rect):
+                pygame.draw.rect(self.screen, ENTITY_COLORS[entity.kind], rect)
 
     def draw_pause(self):
         if level_background_blurred:
@@ -894,7 +3420,7 @@ def update_ui_elements():
     for button in main_menu_buttons:
         button.update_rect(scale_factor, offset)
     for element in settings_menu_elements:
-        button.update_rect(scale_factor, offset)
+        element.update_rect(scale_factor, offset)
     for button in pause_buttons:
         button.update_rect(scale_factor, offset)
     game.hud.update_font(scale_factor)
@@ -903,32 +3429,62 @@ def update_ui_elements():
 def handle_resize(new_width, new_height):
     global WIDTH, HEIGHT, screen, menu_background, level_background, level_background_blurred, font, scale_factor, offset, viewport
     WIDTH, HEIGHT = new_width, new_height
-    screen = pygame.display.set_mode((WIDTH, HEIGHT), pygame.RESIZABLE)
+    screen = create_window((WIDTH, HEIGHT))
     scale_factor, offset, viewport = calculate_viewport()
-    try:
-        if menu_background:
-            menu_background = scale_background(pygame.image.load('src/Assets/background_play1.png'), viewport.width, viewport.height)
-        if level_background:
-            level_background = scale_background(pygame.image.load('src/Assets/level_background.png'), viewport.width, viewport.height)
-            level_background_blurred = blur_surface(level_background, blur_radius=5)
-    except Exception as e:
-        print(f"Ошибка обновления фона: {e}")
+    # Пока новые фоны собираются, показываются прежние
+    variants = background_pipeline.request(viewport.size)
+    if variants:
+        menu_background, level_background, level_background_blurred = variants
+    text_cache.invalidate(font)
     font = get_scaled_font(scale_factor)
     update_ui_elements()
+    game.level.clear_render_cache()
+    game.player.rebuild_frame_cache(scale_factor)
+    dirty_regions.mark_all()
+
+def update_assets():
+    """Передаёт фон уровня, загруженный в фоне, в сборку фонов и обновляет прогресс в меню."""
+    ready = assets.poll()
+    if not ready:
+        return
+    if LEVEL_BACKGROUND_PATH in ready:
+        background_pipeline.set_level_original(assets.get(LEVEL_BACKGROUND_PATH), disk_cache.source_key(LEVEL_BACKGROUND_PATH))
+    loaded, total = assets.progress()
+    if loaded == total:
+        print(f"Ресурсы уровня загружены через {(time.perf_counter() - STARTUP_TIME) * 1000:.0f} мс после запуска")
+    dirty_regions.mark_all()
+
+def ensure_level_assets():
+    """Дожидается ресурсов уровня перед началом игры, если фон ещё не успел загрузиться."""
+    global menu_background, level_background, level_background_blurred
+    level_original = assets.load(LEVEL_BACKGROUND_PATH)
+    if background_pipeline.level_original is None and level_original is not None:
+        background_pipeline.set_level_original(level_original, disk_cache.source_key(LEVEL_BACKGROUND_PATH))
+        menu_background, level_background, level_background_blurred = background_pipeline.get_now(viewport.size)
+
+def update_backgrounds():
+    """Подставляет фоны, собранные после изменения размера окна."""
+    global menu_background, level_background, level_background_blurred
+    variants = background_pipeline.poll()
+    if variants:
+        menu_background, level_background, level_background_blurred = variants
+        dirty_regions.mark_all()
 
 # Создание кнопок главного меню
 button_width = 300
 button_height = 80
 button_spacing = 20
-play_button = Button("Играть", BASE_WIDTH // 2 - button_width // 2, BASE_HEIGHT // 2 - button_height - button_spacing, button_width, button_height)
+play_button = Button("Играть", BASE_WIDTH // 2 - button_width // 2, BASE_HEIGHT // 2 - (button_height + button_spacing) * 2, button_width, button_height)
+endless_button = Button("Бесконечный", BASE_WIDTH // 2 - button_width // 2, BASE_HEIGHT // 2 - button_height - button_spacing, button_width, button_height)
 settings_button = Button("Настройки", BASE_WIDTH // 2 - button_width // 2, BASE_HEIGHT // 2, button_width, button_height)
 exit_button = Button("Выход", BASE_WIDTH // 2 - button_width // 2, BASE_HEIGHT // 2 + button_height + button_spacing, button_width, button_height)
-main_menu_buttons = [play_button, settings_button, exit_button]
+main_menu_buttons = [play_button, endless_button, settings_button, exit_button]
 
 # Создание элементов меню настроек
 volume_slider = Slider("Громкость", BASE_WIDTH // 2 + 0, BASE_HEIGHT // 2 - 80, 300, 20, 0, 100, 50)
 back_button = Button("Назад", BASE_WIDTH // 2 - button_width // 2, BASE_HEIGHT // 2 + 80, button_width, button_height)
-settings_menu_elements = [volume_slider, back_button]
+rope_button = Button("", BASE_WIDTH // 2 - button_width // 2, BASE_HEIGHT // 2 - button_height // 2, button_width, button_height)
+settings_menu_elements = [volume_slider, rope_button, back_button]
 
 # Создание кнопок меню паузы
 pause_button_y = BASE_HEIGHT // 2 - button_height * 1.5
@@ -937,26 +3493,120 @@ settings_pause_button = Button("Настройки", BASE_WIDTH // 2 - button_wi
 main_menu_pause_button = Button("Главное меню", BASE_WIDTH // 2 - button_width // 2, pause_button_y + (button_height + button_spacing) * 2, button_width, button_height)
 pause_buttons = [continue_button, settings_pause_button, main_menu_pause_button]
 
-# Инициализация игры
-game = Game()
+# Игра создаётся в setup()
+game = None
+# Режим верёвки крюка (переключается в настройках или --rope)
+rope_mode = ROPE_RIGID
+
+def set_rope_mode(mode):
+    """Выбирает режим верёвки; без NumPy гибкая верёвка недоступна."""
+    global rope_mode
+    if mode == ROPE_VERLET and np is None:
+        print("NumPy не найден: гибкая верёвка недоступна, используется жёсткая")
+        mode = ROPE_RIGID
+    rope_mode = mode
+    rope_button.text = "Верёвка: гибкая" if mode == ROPE_VERLET else "Верёвка: жёсткая"
+
+def toggle_rope_mode():
+    set_rope_mode(ROPE_RIGID if rope_mode == ROPE_VERLET else ROPE_VERLET)
+    dirty_regions.mark_all()
+
+set_rope_mode(ROPE_RIGID)
+# Файлы записи и повтора ввода (задаются в командной строке)
+record_path = None
+replay_path = None
+# Файл уровня по умолчанию для Level()
+level_path = LEVEL_PATH
+# Сколько подвижных тел расставить на основном уровне (--entities)
+entity_count = 0
+
+def setup():
+    """Инициализирует pygame, окно, фоны, музыку и шрифты для интерактивной игры."""
+    global WIDTH, HEIGHT, screen, menu_background, level_background, level_background_blurred, font, scale_factor, offset, viewport, game, background_pipeline
+    pygame.init()
+
+    # Определение начального размера окна на основе экрана
+    try:
+        display_info = pygame.display.get_desktop_sizes()[0]
+        WIDTH, HEIGHT = display_info[0], display_info[1]
+    except:
+        WIDTH, HEIGHT = 1280, 720  # Резервное разрешение
+
+    # Создание окна с поддержкой изменения размера
+    screen = create_window((WIDTH, HEIGHT))
+    pygame.display.set_caption("Главное меню - Пиксельный платформер")
+
+    if disk_cache.enabled:
+        disk_cache.detect_pixel_format()
+
+    # Ресурсы уровня грузятся в фоне, фон меню нужен для первого кадра сразу
+    assets.preload(LEVEL_ASSETS)
+    menu_original = assets.load(MENU_BACKGROUND_PATH)
+
+    # Загрузка фоновой музыки
+    try:
+        pygame.mixer.music.load('src/Resources/background_music.mp3')
+        pygame.mixer.music.set_volume(0.5)
+        pygame.mixer.music.play(-1)
+    except Exception as e:
+        print(f"Ошибка загрузки музыки: {e}")
+
+    # Инициализация масштаба и области отображения
+    scale_factor, offset, viewport = calculate_viewport()
+    font = get_scaled_font(scale_factor)
+    background_pipeline = BackgroundPipeline(
+        menu_original, assets.get(LEVEL_BACKGROUND_PATH),
+        menu_key=disk_cache.source_key(MENU_BACKGROUND_PATH),
+        level_key=disk_cache.source_key(LEVEL_BACKGROUND_PATH)
+    )
+    menu_background, level_background, level_background_blurred = background_pipeline.get_now(viewport.size)
+
+    # Инициализация игры
+    game = Game()
+    update_ui_elements()
+
+# Основной игровой цикл
+def draw_main_menu():
+    screen.fill(BLACK)
+    if menu_background:
+        screen.blit(menu_background, (int(offset.x), int(offset.y)))
+    for button in main_menu_buttons:
+        button.draw(screen)
+    loaded, total = assets.progress()
+    if loaded < total:
+        text = text_cache.render(font, f"Загрузка {loaded}/{total}", WHITE)
+        screen.blit(text, (int(offset.x + 10 * scale_factor), int(viewport.bottom - text.get_height() - 10 * scale_factor)))
+
+def draw_settings_menu(previous_menu):
+    screen.fill(BLACK)
+    if menu_background and (previous_menu is None or previous_menu != "pause"):
+        screen.blit(menu_background, (int(offset.x), int(offset.y)))
+    elif level_background_blurred and previous_menu == "pause":
+        screen.blit(level_background_blurred, (int(offset.x), int(offset.y)))
+    for element in settings_menu_elements:
+        element.draw(screen)
 
 # Основной игровой цикл
 async def main():
     global current_menu
+    setup()
     current_menu = ["main", None]  # Инициализация с двумя элементами: текущее состояние, предыдущее состояние
     running = True
+    first_frame_shown = False
     while running:
+        # Обработка событий (без событий и изменений меню ждёт, не нагружая CPU)
+        update_assets()
+        update_backgrounds()
+        events = wait_for_events()
         mouse_pos = pygame.mouse.get_pos()
         mouse_pressed = pygame.mouse.get_pressed()[0]
-
-        # Обработка событий
-        events = pygame.event.get()
         for event in events:
             if event.type == pygame.QUIT:
                 running = False
             elif event.type == pygame.VIDEORESIZE:
                 handle_resize(event.w, event.h)
 
+        shown_menu = tuple(current_menu)
         if current_menu[0] == "main":
             # Обработка событий для главного меню
             for event in events:
@@ -964,23 +3614,23 @@ async def main():
                     mouse_pos = Vector2(event.pos) if event.type == pygame.MOUSEBUTTONDOWN else Vector2(event.x * WIDTH, event.y * HEIGHT)
                     for button in main_menu_buttons:
                         if button.is_hovered(mouse_pos):
-                            if button.text == "Играть":
-                                game.reset()
+                            if button.text == "Играть" or button.text == "Бесконечный":
+                                ensure_level_assets()
+                                if button.text == "Играть":
+                                    game.reset(game.main_level)
+                                else:
+                                    game.reset(EndlessLevel(jump_power=game.player.jump_power, speed=game.player.speed))
                                 current_menu = ["game", "main"]
                                 await game.run(current_menu)
+                                dirty_regions.mark_all()
                             elif button.text == "Настройки":
                                 current_menu = ["settings", "main"]
                             elif button.text == "Выход":
                                 running = False
             # Обновление состояния кнопок
-            for button in main_menu_buttons:
-                button.update(mouse_pos)
-            # Отрисовка главного меню
-            screen.fill(BLACK)
-            if menu_background:
-                screen.blit(menu_background, (int(offset.x), int(offset.y)))
-            for button in main_menu_buttons:
-                button.draw(screen)
+            update_menu_elements(main_menu_buttons, mouse_pos, mouse_pressed)
+            # Отрисовка изменившихся частей главного меню
+            dirty_regions.render(screen, draw_main_menu)
 
         elif current_menu[0] == "settings":
             # Обработка событий для меню настроек
@@ -991,38 +3641,102 @@ async def main():
                         button.update(mouse_pos)
                     for element in settings_menu_elements:
                         if isinstance(element, Button) and element.is_hovered(mouse_pos):
-                            if element.text == "Назад":
+                            if element is rope_button:
+                                toggle_rope_mode()
+                            elif element.text == "Назад":
                                 if current_menu[1] == "pause":
                                     current_menu = ["pause", "game"]
                                 else:
                                     current_menu = ["main", None]
             # Обновление состояния элементов
-            for element in settings_menu_elements:
-                if isinstance(element, Slider):
-                    element.update(mouse_pos, mouse_pressed)
-                elif isinstance(element, Button):
-                    element.update(mouse_pos)
-            # Отрисовка меню настроек
-            screen.fill(BLACK)
-            if menu_background and (current_menu[1] is None or current_menu[1] != "pause"):
-                screen.blit(menu_background, (int(offset.x), int(offset.y)))
-            elif level_background_blurred and current_menu[1] == "pause":
-                screen.blit(level_background_blurred, (int(offset.x), int(offset.y)))
-            for element in settings_menu_elements:
-                element.draw(screen)
+            update_menu_elements(settings_menu_elements, mouse_pos, mouse_pressed)
+            # Отрисовка изменившихся частей меню настроек
+            previous_menu = current_menu[1]
+            dirty_regions.render(screen, lambda: draw_settings_menu(previous_menu))
 
         elif current_menu[0] in ["game", "pause", "settings"]:
             # Обработка игры и паузы выполняется в game.run()
             pass
 
-        pygame.display.flip()
-        await asyncio.sleep(1.0 / FPS)
+        if not first_frame_shown:
+            first_frame_shown = True
+            print(f"Первый кадр через {(time.perf_counter() - STARTUP_TIME) * 1000:.0f} мс после запуска")
+        if tuple(current_menu) != shown_menu:
+            # Следующий экран рисуется целиком
+            dirty_regions.mark_all()
+        await frame_scheduler.wait(record=False)
 
+    profiler.close()
     pygame.quit()
     sys.exit()
 
+def run_headless(steps):
+    """Прогон демонстрационного сценария или записи ввода без дисплея с выводом скорости."""
+    replay = None
+    if replay_path:
+        try:
+            replay = ReplayInput(replay_path)
+            steps = replay.steps
+        except Exception as e:
+            print(f"Ошибка загрузки записи ввода: {e}")
+            return
+    input_source = replay if replay is not None else ScriptedInput(make_demo_script(steps))
+    simulation = HeadlessSimulation(input_source=input_source)
+    recorder = InputRecorder(record_path, session_settings(simulation.level, simulation.entities)) if record_path else None
+    simulation.recorder = recorder
+    steps_per_second = simulation.run(steps)
+    print(f"Headless: {steps} шагов, {steps_per_second:.0f} шагов/с, позиция игрока {simulation.player.pos}")
+    if recorder is not None:
+        recorder.close(simulation.player.pos)
+        print(f"Ввод записан: {recorder.steps} шагов в {record_path}")
+    if replay is not None and replay.final_pos is not None:
+        match = "совпадает" if simulation.player.pos == replay.final_pos else "НЕ совпадает"
+        print(f"Позиция игрока {match} с записью ({replay.final_pos})")
+
+def parse_args():
+    parser = argparse.ArgumentParser(description="Пиксельный платформер")
+    parser.add_argument("--headless", action="store_true", help="симуляция без окна, звука и шрифтов")
+    parser.add_argument("--steps", type=int, default=SIM_HZ * 60, help="число шагов headless-симуляции")
+    parser.add_argument("--profile", metavar="FILE", help="писать время фаз каждого кадра в CSV или JSONL")
+    parser.add_argument("--level", metavar="FILE", default=LEVEL_PATH, help="файл уровня (текстовый или двоичный)")
+    parser.add_argument("--pack-level", nargs=2, metavar=("SRC", "DST"), help="сохранить уровень SRC в двоичном формате DST и выйти")
+    parser.add_argument("--chunked", action="store_true", help="с --pack-level: раскладка по чанкам без сжатия для потокового чтения через mmap")
+    parser.add_argument("--entities", type=int, default=0, metavar="N", help="расставить на уровне N врагов, движущихся платформ и снарядов")
+    parser.add_argument("--rope", choices=(ROPE_RIGID, ROPE_VERLET), default=ROPE_RIGID, help="режим верёвки крюка: жёсткая или гибкая (NumPy)")
+    parser.add_argument("--no-asset-cache", action="store_true", help=f"не использовать дисковый кэш ресурсов ({ASSET_CACHE_DIR})")
+    parser.add_argument("--record", metavar="FILE", help="записать ввод игровой сессии в файл")
+    parser.add_argument("--replay", metavar="FILE", help="воспроизвести записанный ввод (с --headless - без ограничения скорости)")
+    frame_mode = parser.add_mutually_exclusive_group()
+    frame_mode.add_argument("--fps", type=int, help="ограничить частоту кадров (по умолчанию FPS)")
+    frame_mode.add_argument("--vsync", action="store_true", help="темп кадров по вертикальной синхронизации")
+    frame_mode.add_argument("--uncapped", action="store_true", help="без ограничения частоты кадров")
+    return parser.parse_args()
+
 if platform.system() == "Emscripten":
     asyncio.ensure_future(main())
 else:
     if __name__ == "__main__":
-        asyncio.run(main())
\ No newline at end of file
+        args = parse_args()
+        if args.vsync:
+            frame_scheduler.mode = FRAME_MODE_VSYNC
+        elif args.uncapped:
+            frame_scheduler.mode = FRAME_MODE_UNCAPPED
+        elif args.fps:
+            frame_scheduler.target_fps = args.fps
+        if args.profile:
+            profiler.open_output(args.profile)
+        record_path = args.record
+        level_path = args.level
+        entity_count = args.entities
+        if args.no_asset_cache:
+            disk_cache.enabled = False
+        replay_path = args.replay
+        set_rope_mode(args.rope)
+        if args.pack_level:
+            width, height, cells = load_level_file(args.pack_level[0])
+            save_level_binary(args.pack_level[1], width, height, cells, chunked=args.chunked)
+            print(f"Уровень {width}x{height} сохранён в {args.pack_level[1]} ({os.path.getsize(args.pack_level[1])} байт)")
+        elif args.headless:
+            run_headless(args.steps)
+        else:
+            asyncio.run(main())
\ No newline at end of file